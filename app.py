@@ -7,38 +7,238 @@ import sys
 import threading
 import time
 import uuid
+import zlib
 
 from flask import Flask, Response, jsonify, render_template, request
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from scripts.metrics import REGISTRY as METRICS  # noqa: E402
+from scripts.registry import ScanRegistry  # noqa: E402
+from scripts.scheduler import QueueFullError, ScanScheduler  # noqa: E402
+from scripts.timings import StageTimer  # noqa: E402
+
 app = Flask(__name__)
 app.config["TEMPLATES_AUTO_RELOAD"] = True
 
-_active_scans: dict = {}
+MAX_ARP_SCANS = int(os.environ.get("NETWATCHER_MAX_ARP_SCANS", 2))
+MAX_NMAP_SCANS = int(os.environ.get("NETWATCHER_MAX_NMAP_SCANS", 4))
+MAX_QUEUED_SCANS = int(os.environ.get("NETWATCHER_MAX_QUEUED_SCANS", 32))
+MAX_QUEUED_PER_CLIENT = int(os.environ.get("NETWATCHER_MAX_QUEUED_PER_CLIENT", 4))
+HISTORY_DB = os.environ.get("NETWATCHER_HISTORY_DB", "netwatcher_history.db")
+NMAP_CACHE_TTL = float(os.environ.get("NETWATCHER_NMAP_CACHE_TTL", 300))
+MAX_NMAP_CHUNKS = int(os.environ.get("NETWATCHER_MAX_NMAP_CHUNKS", 16))
+SSE_BATCH_INTERVAL = float(os.environ.get("NETWATCHER_SSE_BATCH_MS", 250)) / 1000
+SSE_BATCH_MAX = int(os.environ.get("NETWATCHER_SSE_BATCH_MAX", 500))
+SCAN_TTL = float(os.environ.get("NETWATCHER_SCAN_TTL", 600))
+SCAN_FINISHED_TTL = float(os.environ.get("NETWATCHER_SCAN_FINISHED_TTL", 120))
+SCAN_BUFFER_SIZE = int(os.environ.get("NETWATCHER_SCAN_BUFFER_SIZE", 10000))
+
+_BATCHED_EVENTS = {"host_found": "found", "host_updated": "updated"}
+
+_history = None
+_history_lock = threading.Lock()
+_scheduler = ScanScheduler(
+    {"arp": MAX_ARP_SCANS, "nmap": MAX_NMAP_SCANS},
+    max_queue=MAX_QUEUED_SCANS,
+    max_per_client=MAX_QUEUED_PER_CLIENT,
+)
+SCANS_TOTAL = METRICS.counter(
+    "netwatcher_scans_total", "Escaneos terminados por tipo y resultado", ("kind", "outcome"),
+)
+SCAN_DURATION = METRICS.histogram(
+    "netwatcher_scan_duration_seconds", "Duración de los escaneos terminados", ("kind",),
+)
+SCANS_REAPED = METRICS.counter(
+    "netwatcher_scans_reaped_total", "Escaneos liberados por caducidad",
+)
+SCAN_HOSTS_PER_SECOND = METRICS.histogram(
+    "netwatcher_scan_hosts_per_second", "Hosts procesados por segundo en escaneos completos",
+    ("kind",), buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+
+
+def _on_scan_finish(scan, msg: dict) -> None:
+    # Se llama una vez por escaneo con su evento final, fuera del camino de cada
+    # host: las métricas no añaden coste a los callbacks de run_arp_scan.
+    SCANS_TOTAL.inc(kind=scan.kind, outcome=msg["type"])
+    elapsed = msg.get("elapsed")
+    if elapsed is None:
+        return
+    SCAN_DURATION.observe(elapsed, kind=scan.kind)
+    if msg["type"] == "complete" and "total" in msg and elapsed > 0:
+        SCAN_HOSTS_PER_SECOND.observe(msg["total"] / elapsed, kind=scan.kind)
+
+
+def _on_scan_reaped(scan_id: str) -> None:
+    # Un escaneo caducado que aún espera turno se retira también del planificador.
+    _scheduler.cancel(scan_id)
+    SCANS_REAPED.inc()
+
+
+_active_scans = ScanRegistry(
+    ttl=SCAN_TTL,
+    finished_ttl=SCAN_FINISHED_TTL,
+    maxsize=SCAN_BUFFER_SIZE,
+    on_reap=_on_scan_reaped,
+    on_finish=_on_scan_finish,
+)
+
+
+def _scheduler_gauge(field: str):
+    return lambda: {(pool,): stats[field] for pool, stats in _scheduler.stats().items()}
+
+
+METRICS.gauge(
+    "netwatcher_active_scans", "Escaneos en el registro por estado", ("state",),
+    fn=lambda: {(state,): n for state, n in _active_scans.totals()["states"].items()},
+)
+METRICS.gauge(
+    "netwatcher_sse_subscribers", "Clientes SSE conectados a algún escaneo",
+    fn=lambda: _active_scans.totals()["subscribers"],
+)
+METRICS.gauge(
+    "netwatcher_scan_buffered_events", "Eventos guardados en los buffers de los escaneos",
+    fn=lambda: _active_scans.totals()["buffered"],
+)
+METRICS.gauge(
+    "netwatcher_scheduler_queued", "Escaneos esperando turno por pool", ("pool",),
+    fn=_scheduler_gauge("queued"),
+)
+METRICS.gauge(
+    "netwatcher_scheduler_running", "Escaneos en ejecución por pool", ("pool",),
+    fn=_scheduler_gauge("running"),
+)
+
+
+def _sse(data: dict, event_id: int = None) -> str:
+    # Con `id:` el navegador reenvía Last-Event-ID al reconectar.
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _collect_batch(sub, first_id: int, first: dict):
+    # Agrupa host_found/host_updated consecutivos durante SSE_BATCH_INTERVAL o
+    # hasta SSE_BATCH_MAX eventos. Un evento de otro tipo cierra el lote y se
+    # devuelve aparte para respetar el orden. El lote lleva el ID de su último
+    # evento, así que una reconexión no repite ni pierde hosts.
+    frame = {"type": "hosts_batch", "found": [], "updated": []}
+    frame[_BATCHED_EVENTS[first["type"]]].append(first["host"])
+    last_id, count = first_id, 1
+    deadline = time.monotonic() + SSE_BATCH_INTERVAL
+    while count < SSE_BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            event_id, msg = sub.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if event_id is None or msg["type"] not in _BATCHED_EVENTS:
+            return frame, last_id, (event_id, msg)
+        frame[_BATCHED_EVENTS[msg["type"]]].append(msg["host"])
+        last_id, count = event_id, count + 1
+    return frame, last_id, None
 
 
-def _sse(data: dict) -> str:
-    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+def _last_event_id() -> int:
+    value = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        return int(value) if value else 0
+    except ValueError:
+        return 0
 
 
-def _stream(scan_id: str, timeout: int = 120):
+def _stream(scan_id: str, timeout: int = 120, batch: bool = False, last_event_id: int = 0):
+    # Cada cliente lee con su propio cursor sobre el buffer del escaneo: varios
+    # pueden seguir el mismo escaneo y el registro lo libera al caducar.
     scan = _active_scans.get(scan_id)
     if not scan:
         yield _sse({"type": "error", "message": "Escaneo no encontrado"})
         return
 
-    q = scan["queue"]
-    while True:
-        try:
-            msg = q.get(timeout=timeout)
-            yield _sse(msg)
-            if msg["type"] in ("complete", "error"):
+    sub = scan.subscribe(last_event_id)
+    pending = None
+    try:
+        while True:
+            try:
+                event_id, msg = pending or sub.get(timeout=timeout)
+            except queue.Empty:
+                yield _sse({"type": "heartbeat"})
+                continue
+            pending = None
+            if batch and event_id is not None and msg["type"] in _BATCHED_EVENTS:
+                frame, event_id, pending = _collect_batch(sub, event_id, msg)
+                yield _sse(frame, event_id)
+                continue
+            yield _sse(msg, event_id)
+            if msg["type"] in ("complete", "error", "cancelled"):
                 break
-        except queue.Empty:
-            yield _sse({"type": "heartbeat"})
-
-    _active_scans.pop(scan_id, None)
+    finally:
+        sub.close()
+
+
+def _scan_timings(scan) -> StageTimer:
+    # El registro usa time.monotonic, el mismo reloj que StageTimer: el tiempo
+    # desde que se creó el escaneo hasta que empieza es su espera en la cola.
+    timings = StageTimer()
+    timings.add("queue", timings.clock() - scan.created)
+    return timings
+
+
+def _port_report(
+    raw_ports: list, ip: str = None, vendor: str = None, banners: dict = None
+) -> dict:
+    from scripts.utils import assess_risk, get_service_name
+    banners = banners or {}
+    ports = []
+    for p in sorted(raw_ports):
+        entry = {"port": p, "service": get_service_name(p)}
+        if p in banners:
+            entry["banner"] = banners[p]
+        ports.append(entry)
+    return {
+        "ports": ports,
+        "risk": assess_risk(raw_ports, ip=ip, vendor=vendor, banners=banners),
+    }
+
+
+def _get_history():
+    global _history
+    if not HISTORY_DB:
+        return None
+    with _history_lock:
+        if _history is None:
+            from scripts.history import HistoryStore
+            _history = HistoryStore(HISTORY_DB)
+    return _history
+
+
+def _enqueue(kind: str, scan_id: str, fn, priority: int = 0):
+    q = _active_scans.get(scan_id)
+
+    def _on_position(position):
+        if position > 0:
+            q.put({"type": "queued", "position": position})
+
+    try:
+        position = _scheduler.submit(
+            kind, request.remote_addr or "local", fn,
+            job_id=scan_id, priority=priority, on_position=_on_position,
+        )
+    except QueueFullError as exc:
+        scan = _active_scans.discard(scan_id)
+        SCANS_TOTAL.inc(kind=scan.kind if scan else kind, outcome="rejected")
+        return jsonify({"error": str(exc)}), 429
+    return jsonify({"scan_id": scan_id, "position": position})
+
+
+def _fill_vendors(hosts: list) -> list:
+    from scripts.utils import vendor_lookup_many
+    missing = [h for h in hosts if h.get("vendor") in (None, "", "Desconocido")]
+    for host, vendor in zip(missing, vendor_lookup_many(h.get("mac") for h in missing)):
+        host["vendor"] = vendor
+    return hosts
 
 
 @app.route("/")
@@ -68,42 +268,57 @@ def api_scan_arp():
     if not cidr:
         return jsonify({"error": "El campo CIDR es requerido"}), 400
 
-    from scripts.utils import validate_cidr
+    from scripts.utils import ARP_MODES, validate_cidr
     if not validate_cidr(cidr):
         return jsonify({"error": f"CIDR inválido: '{cidr}'"}), 400
 
+    mode = data.get("mode", "stream")
+    if mode not in ARP_MODES:
+        return jsonify({"error": f"Modo ARP inválido: '{mode}'"}), 400
+
     scan_id = str(uuid.uuid4())
-    q: queue.Queue = queue.Queue()
-    _active_scans[scan_id] = {"queue": q, "cancelled": False}
+    q = _active_scans.create(scan_id, "arp", target=cidr)
 
     def _do_arp():
         try:
             from scripts.utils import run_arp_scan
+            timings = _scan_timings(q)
+            history = _get_history()
             q.put({"type": "started", "cidr": cidr, "timestamp": time.time()})
             start = time.time()
 
             def _on_host(host):
-                if _active_scans.get(scan_id, {}).get("cancelled"):
-                    raise InterruptedError("Escaneo cancelado por el usuario")
                 q.put({"type": "host_found", "host": host})
-
-            hosts = run_arp_scan(cidr, callback=_on_host)
+                if history:
+                    history.record_host(host, scan_id)
+
+            def _on_update(host):
+                q.put({"type": "host_updated", "host": host})
+                if history:
+                    history.record_host(host, scan_id)
+
+            hosts = run_arp_scan(
+                cidr, callback=_on_host, on_update=_on_update, mode=mode, cancel=q.token,
+                timings=timings,
+            )
             elapsed = round(time.time() - start, 2)
-            q.put({"type": "complete", "total": len(hosts), "elapsed": elapsed})
-
-        except InterruptedError:
-            q.put({"type": "cancelled"})
+            q.put({
+                "type": "cancelled" if q.cancelled else "complete",
+                "total": len(hosts), "elapsed": elapsed, "timings": timings.as_dict(),
+            })
         except Exception as exc:
             q.put({"type": "error", "message": str(exc)})
 
-    threading.Thread(target=_do_arp, daemon=True).start()
-    return jsonify({"scan_id": scan_id})
+    return _enqueue("arp", scan_id, _do_arp)
 
 
 @app.route("/api/scan/stream/<scan_id>")
 def api_scan_stream(scan_id: str):
     return Response(
-        _stream(scan_id, timeout=120),
+        _stream(
+            scan_id, timeout=120, batch=request.args.get("batch") == "1",
+            last_event_id=_last_event_id(),
+        ),
         mimetype="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -111,110 +326,409 @@ def api_scan_stream(scan_id: str):
 
 @app.route("/api/scan/cancel/<scan_id>", methods=["POST"])
 def api_scan_cancel(scan_id: str):
+    # Si el escaneo aún espera turno se retira de la cola; si ya corre, el token
+    # corta el envío ARP, el DNS inverso y el proceso nmap en curso.
     scan = _active_scans.get(scan_id)
     if scan:
-        scan["cancelled"] = True
+        scan.cancel()
+        if _scheduler.cancel(scan_id):
+            scan.put({"type": "cancelled", "total": 0})
     return jsonify({"success": True})
 
 
+@app.route("/api/scans")
+def api_scans():
+    return jsonify({
+        "scans": _active_scans.snapshot(),
+        "scheduler": _scheduler.stats(),
+        "reaped": _active_scans.reaped,
+    })
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.route("/api/nmap", methods=["POST"])
 def api_nmap():
     data = request.json or {}
     ip = data.get("ip", "").strip()
     port_range = data.get("ports", "1-1024").strip()
+    engine = data.get("engine", "nmap")
+    force = bool(data.get("force", False))
+    versions = bool(data.get("versions", False))
+    vendor = data.get("vendor")
 
     if not ip:
         return jsonify({"error": "La dirección IP es requerida"}), 400
+    try:
+        chunks = int(data.get("chunks", 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "El número de bloques debe ser un entero"}), 400
+    if not 1 <= chunks <= MAX_NMAP_CHUNKS:
+        return jsonify(
+            {"error": f"El número de bloques debe estar entre 1 y {MAX_NMAP_CHUNKS}"}
+        ), 400
+
+    from scripts.utils import SCAN_ENGINES, scan_port_spec, validate_ip
+    if not validate_ip(ip):
+        return jsonify({"error": f"Dirección IP inválida: '{ip}'"}), 400
+    if engine not in SCAN_ENGINES:
+        return jsonify({"error": f"Motor de escaneo inválido: '{engine}'"}), 400
+    if versions and engine != "nmap":
+        return jsonify({"error": "La detección de versiones requiere el motor 'nmap'"}), 400
+    try:
+        port_range = str(scan_port_spec(port_range))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
 
     scan_id = str(uuid.uuid4())
-    q: queue.Queue = queue.Queue()
-    _active_scans[scan_id] = {"queue": q, "cancelled": False}
+    q = _active_scans.create(scan_id, "nmap", target=ip)
 
     def _do_nmap():
         try:
-            from scripts.utils import nmap_scan, get_service_name, assess_risk
-            q.put({"type": "started", "ip": ip, "ports": port_range})
+            from scripts.utils import (
+                get_service_name, nmap_scan, nmap_scan_cached, nmap_scan_chunked,
+            )
+            timings = _scan_timings(q)
+            q.put({
+                "type": "started", "ip": ip, "ports": port_range, "engine": engine,
+                "chunks": chunks, "versions": versions,
+            })
             start = time.time()
-            raw_ports = nmap_scan(ip, port_range)
+
+            def _on_port(port):
+                q.put({
+                    "type": "port_found", "ip": ip, "port": port,
+                    "service": get_service_name(port),
+                })
+
+            def _on_progress(progress):
+                q.put({"type": "progress", "ip": ip, **progress})
+
+            def _on_chunk(chunk):
+                q.put({"type": "chunk", "ip": ip, **chunk})
+
+            banners = {}
+
+            def _on_service(port, banner):
+                banners[port] = banner
+
+            # Los escaneos por bloques no pasan por la caché: un resultado parcial
+            # no debe servirse como si fuera completo. Tampoco los de versiones,
+            # porque la caché sólo guarda los puertos.
+            partial = {"partial": False, "failed_chunks": []}
+            if chunks > 1 and engine == "nmap":
+                result = nmap_scan_chunked(
+                    ip, port_range, chunks=chunks, on_port=_on_port,
+                    on_chunk=_on_chunk, on_progress=_on_progress, cancel=q.token,
+                    timings=timings, on_service=_on_service if versions else None,
+                )
+                raw_ports, cached = result.pop("open_ports"), False
+                partial = result
+            elif versions:
+                raw_ports = nmap_scan(
+                    ip, port_range, on_port=_on_port, on_progress=_on_progress,
+                    cancel=q.token, timings=timings, on_service=_on_service,
+                )
+                cached = False
+            else:
+                raw_ports, cached = nmap_scan_cached(
+                    ip, port_range, engine=engine, force=force, ttl=NMAP_CACHE_TTL,
+                    on_port=_on_port, on_progress=_on_progress, cancel=q.token,
+                    timings=timings,
+                )
             elapsed = round(time.time() - start, 2)
 
-            port_details = [
-                {"port": p, "service": get_service_name(p)}
-                for p in sorted(raw_ports)
-            ]
-            risk = assess_risk(raw_ports)
+            with timings.stage("report"):
+                report = _port_report(raw_ports, ip=ip, vendor=vendor, banners=banners)
+            if q.cancelled:
+                q.put({
+                    "type": "cancelled", "ip": ip, **report, "elapsed": elapsed,
+                    "timings": timings.as_dict(),
+                })
+                return
+            history = _get_history()
+            if history and not cached and not partial["partial"]:
+                history.record_ports(
+                    ip, raw_ports, scan_id, risk_level=report["risk"]["level"],
+                    port_range=port_range, engine=engine,
+                )
             q.put({
                 "type": "complete",
                 "ip": ip,
-                "ports": port_details,
-                "risk": risk,
+                **report,
                 "elapsed": elapsed,
+                "cached": cached,
+                **partial,
+                "timings": timings.as_dict(),
+            })
+        except Exception as exc:
+            q.put({"type": "error", "message": str(exc)})
+
+    return _enqueue("nmap", scan_id, _do_nmap)
+
+
+@app.route("/api/nmap/batch", methods=["POST"])
+def api_nmap_batch():
+    data = request.json or {}
+    ips = [str(ip).strip() for ip in data.get("ips", []) if str(ip).strip()]
+    vendors = data.get("vendors") or {}
+    port_range = data.get("ports", "1-1024").strip()
+    engine = data.get("engine", "nmap")
+    versions = bool(data.get("versions", False))
+
+    if not ips:
+        return jsonify({"error": "La lista de IPs es requerida"}), 400
+
+    from scripts.utils import SCAN_ENGINES, scan_port_spec, validate_ip
+    invalid = [ip for ip in ips if not validate_ip(ip)]
+    if invalid:
+        return jsonify({"error": f"Dirección IP inválida: '{invalid[0]}'"}), 400
+    if engine not in SCAN_ENGINES:
+        return jsonify({"error": f"Motor de escaneo inválido: '{engine}'"}), 400
+    if versions and engine != "nmap":
+        return jsonify({"error": "La detección de versiones requiere el motor 'nmap'"}), 400
+    try:
+        port_range = str(scan_port_spec(port_range))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    scan_id = str(uuid.uuid4())
+    q = _active_scans.create(scan_id, "nmap_batch", target=f"{len(ips)} hosts")
+
+    def _do_nmap_batch():
+        try:
+            from scripts.utils import get_service_name, nmap_scan_many
+            timings = _scan_timings(q)
+            q.put({
+                "type": "started", "ips": ips, "ports": port_range, "engine": engine,
+                "versions": versions,
+            })
+            start = time.time()
+
+            history = _get_history()
+            banners = {}
+
+            def _on_service(ip, port, banner):
+                banners.setdefault(ip, {})[port] = banner
+
+            def _on_host(ip, raw_ports):
+                with timings.stage("report"):
+                    report = _port_report(
+                        raw_ports, ip=ip, vendor=vendors.get(ip), banners=banners.pop(ip, None)
+                    )
+                q.put({"type": "host_done", "ip": ip, **report})
+                if history:
+                    history.record_ports(
+                        ip, raw_ports, scan_id, risk_level=report["risk"]["level"],
+                        port_range=port_range, engine=engine,
+                    )
+
+            def _on_port(ip, port):
+                q.put({
+                    "type": "port_found", "ip": ip, "port": port,
+                    "service": get_service_name(port),
+                })
+
+            def _on_progress(progress):
+                q.put({"type": "progress", **progress})
+
+            results = nmap_scan_many(
+                ips, port_range, callback=_on_host, engine=engine,
+                on_port=_on_port, on_progress=_on_progress, cancel=q.token,
+                timings=timings, on_service=_on_service if versions else None,
+            )
+            elapsed = round(time.time() - start, 2)
+            q.put({
+                "type": "cancelled" if q.cancelled else "complete",
+                "total": len(results), "elapsed": elapsed, "timings": timings.as_dict(),
             })
         except Exception as exc:
             q.put({"type": "error", "message": str(exc)})
 
-    threading.Thread(target=_do_nmap, daemon=True).start()
-    return jsonify({"scan_id": scan_id})
+    return _enqueue("nmap", scan_id, _do_nmap_batch, priority=1)
 
 
 @app.route("/api/nmap/stream/<scan_id>")
 def api_nmap_stream(scan_id: str):
     return Response(
-        _stream(scan_id, timeout=300),
+        _stream(
+            scan_id, timeout=300, batch=request.args.get("batch") == "1",
+            last_event_id=_last_event_id(),
+        ),
         mimetype="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@app.route("/api/export/csv", methods=["POST"])
-def api_export_csv():
-    data = request.json or {}
-    hosts = data.get("hosts", [])
+def _history_or_404():
+    history = _get_history()
+    if history is None:
+        return None, (jsonify({"error": "El historial está deshabilitado"}), 404)
+    return history, None
+
+
+def _float_arg(name: str):
+    value = request.args.get(name)
+    return float(value) if value else None
+
+
+@app.route("/api/history")
+def api_history():
+    history, error = _history_or_404()
+    if error:
+        return error
+    return jsonify(history.stats())
+
+
+@app.route("/api/history/hosts")
+def api_history_hosts():
+    history, error = _history_or_404()
+    if error:
+        return error
+    try:
+        hosts = history.host_history(
+            ip=request.args.get("ip") or None,
+            mac=request.args.get("mac") or None,
+            since=_float_arg("since"),
+            until=_float_arg("until"),
+            limit=min(int(request.args.get("limit", 100)), 1000),
+        )
+    except ValueError:
+        return jsonify({"error": "Parámetros de consulta inválidos"}), 400
+    return jsonify({"hosts": hosts})
+
+
+@app.route("/api/history/mac/<mac>")
+def api_history_mac(mac: str):
+    history, error = _history_or_404()
+    if error:
+        return error
+    seen = history.first_seen(mac)
+    if seen is None:
+        return jsonify({"error": f"Sin registros para la MAC {mac}"}), 404
+    return jsonify(seen)
+
+
+@app.route("/api/history/ports/<ip>")
+def api_history_ports(ip: str):
+    history, error = _history_or_404()
+    if error:
+        return error
+    try:
+        limit = min(int(request.args.get("limit", 20)), 1000)
+    except ValueError:
+        return jsonify({"error": "Parámetros de consulta inválidos"}), 400
+    return jsonify({"ip": ip, "scans": history.port_history(ip, limit=limit)})
+
+
+EXPORT_FIELDS = ["ip", "mac", "hostname", "vendor", "open_ports", "risk_level"]
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+
+def _export_row(h: dict) -> dict:
+    return {
+        "ip": h.get("ip", ""),
+        "mac": h.get("mac", ""),
+        "hostname": h.get("hostname", "N/A"),
+        "vendor": h.get("vendor", "Desconocido"),
+        "open_ports": ", ".join(str(p) for p in h.get("open_ports", [])),
+        "risk_level": (h.get("risk") or {}).get("level", "SAFE"),
+    }
+
+
+def _iter_csv(hosts):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for h in hosts:
+        writer.writerow(_export_row(h))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
 
-    if not hosts:
-        return jsonify({"error": "Sin datos para exportar"}), 400
 
-    output = io.StringIO()
-    fieldnames = ["ip", "mac", "hostname", "vendor", "open_ports", "risk_level"]
-    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction="ignore")
-    writer.writeheader()
+def _iter_json(hosts):
+    # Misma salida que json.dumps(hosts, indent=2), serializando host a host.
+    first = True
     for h in hosts:
-        row = {
-            "ip": h.get("ip", ""),
-            "mac": h.get("mac", ""),
-            "hostname": h.get("hostname", "N/A"),
-            "vendor": h.get("vendor", "Desconocido"),
-            "open_ports": ", ".join(str(p) for p in h.get("open_ports", [])),
-            "risk_level": h.get("risk", {}).get("level", "SAFE"),
-        }
-        writer.writerow(row)
-
-    output.seek(0)
-    ts = time.strftime("%Y%m%d_%H%M%S")
-    return Response(
-        output.getvalue(),
-        mimetype="text/csv",
-        headers={
-            "Content-Disposition": f'attachment; filename="netwatcher_{ts}.csv"'
-        },
-    )
+        item = json.dumps(h, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+        yield ("[\n  " if first else ",\n  ") + item
+        first = False
+    yield "[]" if first else "\n]"
 
 
-@app.route("/api/export/json", methods=["POST"])
-def api_export_json():
+def _iter_ndjson(hosts):
+    for h in hosts:
+        yield json.dumps(h, ensure_ascii=False) + "\n"
+
+
+def _chunked(pieces, size: int = EXPORT_CHUNK_SIZE):
+    # Agrupa las filas en bloques de ~64 KiB: menos escrituras al socket sin
+    # acumular la exportación completa en memoria.
+    chunk, length = [], 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        chunk.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _export_response(fmt: str):
     data = request.json or {}
     hosts = data.get("hosts", [])
     if not hosts:
         return jsonify({"error": "Sin datos para exportar"}), 400
 
+    serialise = {"csv": _iter_csv, "json": _iter_json, "ndjson": _iter_ndjson}[fmt]
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    body = _chunked(serialise(_fill_vendors(hosts)))
+
     ts = time.strftime("%Y%m%d_%H%M%S")
-    return Response(
-        json.dumps(hosts, indent=2, ensure_ascii=False),
-        mimetype="application/json",
-        headers={
-            "Content-Disposition": f'attachment; filename="netwatcher_{ts}.json"'
-        },
-    )
+    headers = {"Content-Disposition": f'attachment; filename="netwatcher_{ts}.{extension}"'}
+    # La compresión se pide explícitamente y sólo se aplica si el cliente acepta
+    # gzip; la respuesta depende entonces de Accept-Encoding.
+    if data.get("gzip") or request.args.get("gzip") == "1":
+        headers["Vary"] = "Accept-Encoding"
+        if request.accept_encodings["gzip"]:
+            body = _gzipped(body)
+            headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype=mimetype, headers=headers)
+
+
+@app.route("/api/export/csv", methods=["POST"])
+def api_export_csv():
+    return _export_response("csv")
+
+
+@app.route("/api/export/json", methods=["POST"])
+def api_export_json():
+    return _export_response("json")
+
+
+@app.route("/api/export/ndjson", methods=["POST"])
+def api_export_ndjson():
+    return _export_response("ndjson")
 
 
 if __name__ == "__main__":
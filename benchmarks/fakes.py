@@ -0,0 +1,307 @@
+import heapq
+import io
+import ipaddress
+import random
+import socket
+import threading
+import time
+import types
+import zlib
+from typing import Optional
+
+from scripts.ports import parse_port_spec
+from scripts.utils import OUI_DB
+
+
+# ─── Red ARP simulada ───────────────────────────────────────────────────────────
+
+class _ARP:
+    def __init__(self, pdst=None, op=1, psrc=None, hwsrc=None):
+        self.pdst = pdst
+        self.op = op
+        self.psrc = psrc
+        self.hwsrc = hwsrc
+
+
+class _Ether:
+    def __init__(self, dst=None):
+        self.dst = dst
+
+    def __truediv__(self, payload):
+        return payload
+
+
+class _Reply:
+    def __init__(self, ip: str, mac: str):
+        self._arp = _ARP(op=2, psrc=ip, hwsrc=mac)
+        self.psrc = ip
+        self.hwsrc = mac
+
+    def __contains__(self, layer) -> bool:
+        return layer is _ARP
+
+    def __getitem__(self, layer):
+        return self._arp
+
+
+class FakeNetwork:
+    # Red con `density` de direcciones ocupadas por hosts que responden a ARP tras
+    # una latencia uniforme entre `latency[0]` y `latency[1]` segundos, perdiendo
+    # cada respuesta con probabilidad `loss`. sendp tarda lo que tardaría la
+    # interfaz en emitir las peticiones a `pps` paquetes por segundo, y cada
+    # respuesta cuenta su latencia desde que salió su petición. Con la misma
+    # semilla la población y las latencias se repiten entre ejecuciones.
+    def __init__(
+        self,
+        cidr: str,
+        density: float = 0.3,
+        latency: tuple = (0.0005, 0.01),
+        loss: float = 0.0,
+        pps: float = 20000.0,
+        seed: int = 1,
+    ):
+        self.cidr = cidr
+        self.latency = latency
+        self.loss = loss
+        self.pps = pps
+        self._rng = random.Random(seed)
+        prefixes = list(OUI_DB)
+        self.responders = {}
+        for address in ipaddress.ip_network(cidr, strict=False).hosts():
+            if self._rng.random() < density:
+                self.responders[str(address)] = self._mac(prefixes)
+        self._heap: list = []
+        self._cond = threading.Condition()
+        self._sniffers: list = []
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.sent = 0
+        self.delivered = 0
+
+    def _mac(self, prefixes: list) -> str:
+        prefix = self._rng.choice(prefixes) if self._rng.random() < 0.8 else ":".join(
+            f"{self._rng.randrange(256):02X}" for _ in range(3)
+        )
+        suffix = ":".join(f"{self._rng.randrange(256):02X}" for _ in range(3))
+        return f"{prefix}:{suffix}"
+
+    def _replies(self, targets) -> list:
+        replies = []
+        gap = 1 / self.pps if self.pps > 0 else 0
+        for i, ip in enumerate(targets):
+            mac = self.responders.get(ip)
+            if mac is None or self._rng.random() < self.loss:
+                continue
+            replies.append((i * gap + self._rng.uniform(*self.latency), ip, mac))
+        return replies
+
+    def sendp(self, packet, iface=None, verbose=0) -> None:
+        targets = packet.pdst if isinstance(packet.pdst, list) else [packet.pdst]
+        self.sent += len(targets)
+        now = time.monotonic()
+        with self._cond:
+            for delay, ip, mac in self._replies(targets):
+                heapq.heappush(self._heap, (now + delay, ip, mac))
+            self._cond.notify()
+        if self.pps > 0:
+            time.sleep(len(targets) / self.pps)
+
+    def arping(self, cidr, timeout=2, verbose=0) -> tuple:
+        # Como scapy.arping: bloquea hasta el timeout y devuelve las respuestas
+        # que llegaron a tiempo.
+        targets = [str(a) for a in ipaddress.ip_network(cidr, strict=False).hosts()]
+        self.sent += len(targets)
+        sending = len(targets) / self.pps if self.pps > 0 else 0
+        replies = [(None, _Reply(ip, mac)) for delay, ip, mac in self._replies(targets)
+                   if delay <= sending + timeout]
+        time.sleep(sending + min(timeout, self.latency[1]))
+        self.delivered += len(replies)
+        return replies, []
+
+    def _deliver(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and (
+                    not self._heap or self._heap[0][0] > time.monotonic()
+                ):
+                    wait = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(wait)
+                if not self._running:
+                    return
+                _, ip, mac = heapq.heappop(self._heap)
+                sniffers = list(self._sniffers)
+            self.delivered += 1
+            for prn in sniffers:
+                prn(_Reply(ip, mac))
+
+    def _start_sniffer(self, prn) -> None:
+        with self._cond:
+            self._sniffers.append(prn)
+            if not self._running:
+                self._running = True
+                self._thread = threading.Thread(target=self._deliver, daemon=True)
+                self._thread.start()
+
+    def _stop_sniffer(self, prn) -> None:
+        with self._cond:
+            self._sniffers.remove(prn)
+            if not self._sniffers:
+                self._running = False
+                self._heap.clear()
+                self._cond.notify_all()
+        if self._thread is not None and not self._running:
+            self._thread.join()
+            self._thread = None
+
+    def scapy_modules(self) -> dict:
+        # Módulos para sys.modules: run_arp_scan importa scapy.all al vuelo.
+        network = self
+
+        class AsyncSniffer:
+            def __init__(self, prn=None, started_callback=None, **kwargs):
+                self.prn = prn
+                self.started_callback = started_callback
+
+            def start(self):
+                network._start_sniffer(self.prn)
+                if self.started_callback:
+                    self.started_callback()
+
+            def stop(self):
+                network._stop_sniffer(self.prn)
+
+        fake_all = types.ModuleType("scapy.all")
+        fake_all.ARP = _ARP
+        fake_all.Ether = _Ether
+        fake_all.AsyncSniffer = AsyncSniffer
+        fake_all.sendp = self.sendp
+        fake_all.arping = self.arping
+        fake_all.conf = types.SimpleNamespace(
+            route=types.SimpleNamespace(route=lambda ip: ("fake0", ip, "0.0.0.0"))
+        )
+        fake_scapy = types.ModuleType("scapy")
+        fake_scapy.all = fake_all
+        return {"scapy": fake_scapy, "scapy.all": fake_all}
+
+
+# ─── DNS inverso simulado ───────────────────────────────────────────────────────
+
+class FakeResolver:
+    # Sustituto de socket.gethostbyaddr. Qué IPs tienen PTR depende sólo de la IP
+    # (crc32), así que el resultado es estable; los fallos suelen ser lentos
+    # porque el servidor DNS agota su propio tiempo antes de responder NXDOMAIN.
+    def __init__(
+        self, hit_ratio: float = 0.4, hit_latency: float = 0.001, miss_latency: float = 0.02
+    ):
+        self.hit_ratio = hit_ratio
+        self.hit_latency = hit_latency
+        self.miss_latency = miss_latency
+        self.calls = 0
+
+    def gethostbyaddr(self, ip: str) -> tuple:
+        self.calls += 1
+        if zlib.crc32(ip.encode()) % 1000 < self.hit_ratio * 1000:
+            time.sleep(self.hit_latency)
+            return f"host-{ip.replace('.', '-')}.lan", [], [ip]
+        time.sleep(self.miss_latency)
+        raise socket.herror(1, "Unknown host")
+
+
+# ─── Nmap simulado ──────────────────────────────────────────────────────────────
+
+class _FakeNmapProcess:
+    def __init__(self, lines: list, lines_per_second: Optional[float]):
+        self._lines = lines
+        self._rate = lines_per_second
+        self._killed = threading.Event()
+        self.returncode = None
+        self.stdout = self._emit()
+        self.stderr = io.StringIO("")
+
+    def _emit(self):
+        # Con `lines_per_second` la salida se reparte en ráfagas de 50 líneas
+        # para no medir el coste de miles de sleeps diminutos.
+        started = time.monotonic()
+        for i, line in enumerate(self._lines):
+            if self._killed.is_set():
+                return
+            if self._rate and i % 50 == 0:
+                delay = started + i / self._rate - time.monotonic()
+                if delay > 0 and self._killed.wait(delay):
+                    return
+            yield line
+        self.returncode = 0
+
+    def kill(self):
+        self._killed.set()
+        self.returncode = -9
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        return self.returncode
+
+
+class FakeNmap:
+    # Sustituto de subprocess.Popen para `nmap -oX -`: genera para cada objetivo
+    # un bloque <host> con `open_ports` puertos abiertos y `closed_ports` cerrados,
+    # más un <taskprogress> cada `progress_every` hosts.
+    def __init__(
+        self,
+        open_ports: int = 5,
+        closed_ports: int = 20,
+        lines_per_second: Optional[float] = None,
+        progress_every: int = 64,
+        seed: int = 1,
+    ):
+        self.open_ports = open_ports
+        self.closed_ports = closed_ports
+        self.lines_per_second = lines_per_second
+        self.progress_every = progress_every
+        self.seed = seed
+        self.processes = 0
+        self.lines = 0
+
+    def _ports(self, rng: random.Random, candidates: list) -> tuple:
+        chosen = rng.sample(candidates, min(len(candidates), self.open_ports + self.closed_ports))
+        return sorted(chosen[:self.open_ports]), sorted(chosen[self.open_ports:])
+
+    def output(self, targets: list, port_range: str) -> list:
+        rng = random.Random(self.seed)
+        candidates = parse_port_spec(port_range).ports()
+        lines = [
+            '<?xml version="1.0" encoding="UTF-8"?>\n',
+            f'<nmaprun scanner="nmap" args="nmap -p {port_range} -T4 -oX -">\n',
+        ]
+        for i, ip in enumerate(targets):
+            if self.progress_every and i % self.progress_every == 0:
+                percent = 100.0 * i / len(targets)
+                lines.append(
+                    f'<taskprogress task="SYN Stealth Scan" percent="{percent:.2f}" '
+                    f'remaining="{len(targets) - i}"/>\n'
+                )
+            open_ports, closed_ports = self._ports(rng, candidates)
+            lines.append('<host><status state="up"/>\n')
+            lines.append(f'<address addr="{ip}" addrtype="ipv4"/>\n')
+            lines.append('<ports>\n')
+            for port in open_ports:
+                lines.append(
+                    f'<port protocol="tcp" portid="{port}"><state state="open"/>'
+                    '<service name="unknown"/></port>\n'
+                )
+            for port in closed_ports:
+                lines.append(
+                    f'<port protocol="tcp" portid="{port}"><state state="closed"/></port>\n'
+                )
+            lines.append('</ports></host>\n')
+        lines.append('<runstats><finished exit="success"/></runstats>\n</nmaprun>\n')
+        return lines
+
+    def popen(self, command: list, **kwargs) -> _FakeNmapProcess:
+        port_range = command[command.index("-p") + 1]
+        targets = command[command.index("-") + 1:]
+        lines = self.output(targets, port_range)
+        self.processes += 1
+        self.lines += len(lines)
+        return _FakeNmapProcess(lines, self.lines_per_second)
@@ -0,0 +1,444 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from benchmarks.fakes import FakeNetwork, FakeNmap, FakeResolver
+from scripts import utils
+from scripts.timings import StageTimer
+
+BENCHMARKS = ("arp_arping", "arp_stream", "nmap_many", "nmap_single", "vendor", "risk", "sse")
+DEFAULT_SIZES = (24, 20, 16)
+
+
+def percentile(samples: list, q: float) -> float:
+    # Percentil por rango más cercano: siempre es un valor observado. Se
+    # multiplica antes de dividir para que q * n / 100 sea exacto con q entero.
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list) -> dict:
+    # Latencias en milisegundos.
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean": round(1000 * sum(samples) / len(samples), 4),
+        "p50": round(1000 * percentile(samples, 50), 4),
+        "p90": round(1000 * percentile(samples, 90), 4),
+        "p99": round(1000 * percentile(samples, 99), 4),
+        "max": round(1000 * max(samples), 4),
+    }
+
+
+def _result(name: str, size: int, items: int, unit: str, elapsed: float, latencies: list,
+            **extra) -> dict:
+    return {
+        "name": name,
+        "size": size,
+        "items": items,
+        "unit": unit,
+        "seconds": round(elapsed, 4),
+        "throughput": round(items / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": summarize(latencies),
+        **extra,
+    }
+
+
+def _network(size: int, args) -> FakeNetwork:
+    return FakeNetwork(
+        f"10.0.0.0/{size}", density=args.density,
+        latency=(args.arp_latency_min / 1000, args.arp_latency_max / 1000),
+        loss=args.loss, pps=args.pps, seed=args.seed,
+    )
+
+
+def _resolver(args) -> FakeResolver:
+    return FakeResolver(
+        hit_ratio=args.dns_hit_ratio, hit_latency=args.dns_hit_ms / 1000,
+        miss_latency=args.dns_miss_ms / 1000,
+    )
+
+
+def _fake_backends(stack: ExitStack, network: FakeNetwork, resolver: FakeResolver) -> None:
+    stack.enter_context(patch.dict(sys.modules, network.scapy_modules()))
+    stack.enter_context(patch("socket.gethostbyaddr", resolver.gethostbyaddr))
+    utils.clear_dns_cache()
+
+
+# ─── Escaneo ARP ────────────────────────────────────────────────────────────────
+
+def bench_arp(size: int, args, mode: str) -> dict:
+    # Latencia por host: desde el inicio del escaneo hasta que el callback recibe
+    # el host; la del DNS, desde el callback hasta on_update con el nombre.
+    network, resolver = _network(size, args), _resolver(args)
+    timings = StageTimer()
+    found, named = {}, []
+    lock = threading.Lock()
+
+    def _callback(host):
+        with lock:
+            found[host["ip"]] = time.perf_counter()
+
+    def _on_update(host):
+        now = time.perf_counter()
+        with lock:
+            named.append(now - found[host["ip"]])
+
+    with ExitStack() as stack:
+        _fake_backends(stack, network, resolver)
+        started = time.perf_counter()
+        hosts = utils.run_arp_scan(
+            network.cidr, callback=_callback, on_update=_on_update, mode=mode,
+            timeout=args.arp_timeout / 1000, retries=0, timings=timings,
+        )
+        elapsed = time.perf_counter() - started
+    return _result(
+        f"arp_{mode}", size, len(hosts), "hosts/s", elapsed,
+        [t - started for t in found.values()],
+        responders=len(network.responders), dns_lookups=resolver.calls,
+        dns_ms=summarize(named), stages=timings.as_dict(),
+    )
+
+
+# ─── Nmap ───────────────────────────────────────────────────────────────────────
+
+def _nmap(args, open_ports: int, closed_ports: int) -> FakeNmap:
+    return FakeNmap(
+        open_ports=open_ports, closed_ports=closed_ports,
+        lines_per_second=args.nmap_rate or None, seed=args.seed,
+    )
+
+
+def bench_nmap_many(size: int, args) -> dict:
+    # Un único proceso para todos los hosts vivos: mide el parser incremental.
+    # La latencia es el tiempo entre dos bloques <host> consecutivos.
+    targets = sorted(_network(size, args).responders)
+    nmap = _nmap(args, args.open_ports, args.closed_ports)
+    timings = StageTimer()
+    marks = []
+
+    def _on_host(ip, ports):
+        marks.append(time.perf_counter())
+
+    with patch("subprocess.Popen", nmap.popen):
+        started = time.perf_counter()
+        results = utils.nmap_scan_many(
+            targets, args.ports, callback=_on_host, timings=timings
+        )
+        elapsed = time.perf_counter() - started
+    gaps = [b - a for a, b in zip([started] + marks, marks)]
+    return _result(
+        "nmap_many", size, len(results), "hosts/s", elapsed, gaps,
+        lines=nmap.lines, lines_per_second=round(nmap.lines / elapsed, 2) if elapsed else 0.0,
+        stages=timings.as_dict(),
+    )
+
+
+def bench_nmap_single(size: int, args) -> dict:
+    # Un escaneo por host con on_port (el camino de /api/nmap): coste fijo de
+    # arrancar el proceso y leer su salida XML.
+    targets = sorted(_network(size, args).responders)[:args.single_hosts]
+    nmap = _nmap(args, args.open_ports, args.closed_ports)
+    durations, found = [], 0
+
+    def _on_port(port):
+        nonlocal found
+        found += 1
+
+    with patch("subprocess.Popen", nmap.popen):
+        started = time.perf_counter()
+        for ip in targets:
+            began = time.perf_counter()
+            utils.nmap_scan(ip, args.ports, on_port=_on_port)
+            durations.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - started
+    return _result(
+        "nmap_single", size, len(targets), "scans/s", elapsed, durations, open_ports=found,
+    )
+
+
+# ─── Fabricantes y riesgo ───────────────────────────────────────────────────────
+
+def bench_vendor(size: int, args) -> dict:
+    macs = list(_network(size, args).responders.values())
+    # La primera consulta carga el índice OUI; no cuenta en la medición.
+    utils.vendor_lookup("00:00:00:00:00:00")
+    latencies = []
+    started = time.perf_counter()
+    for mac in macs:
+        began = time.perf_counter()
+        utils.vendor_lookup(mac)
+        latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - started
+    began = time.perf_counter()
+    utils.vendor_lookup_many(macs)
+    many = time.perf_counter() - began
+    return _result(
+        "vendor", size, len(macs), "lookups/s", elapsed, latencies,
+        batch_throughput=round(len(macs) / many, 2) if many > 0 else 0.0,
+    )
+
+
+def bench_risk(size: int, args) -> dict:
+    network = _network(size, args)
+    targets = sorted(network.responders)
+    with patch("subprocess.Popen", _nmap(args, args.open_ports, 0).popen):
+        ports = utils.nmap_scan_many(targets, args.ports)
+    # La primera evaluación carga las reglas; no cuenta en la medición.
+    utils.assess_risk([22])
+    latencies = []
+    started = time.perf_counter()
+    for ip in targets:
+        began = time.perf_counter()
+        utils.assess_risk(ports[ip], ip=ip, vendor=utils.vendor_lookup(network.responders[ip]))
+        latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - started
+    return _result("risk", size, len(targets), "hosts/s", elapsed, latencies)
+
+
+# ─── SSE ────────────────────────────────────────────────────────────────────────
+
+def bench_sse(size: int, args, batch: bool) -> dict:
+    # Un productor publica host_found tan rápido como puede y un cliente consume
+    # _stream; la latencia va de la publicación a la decodificación del frame.
+    import app
+
+    hosts = sorted(_network(size, args).responders)
+    scan_id = f"bench-{size}-{int(batch)}"
+    scan = app._active_scans.create(scan_id, "arp", target=f"10.0.0.0/{size}")
+    latencies, frames = [], 0
+
+    def _produce():
+        scan.put({"type": "started", "cidr": f"10.0.0.0/{size}"})
+        for ip in hosts:
+            scan.put({"type": "host_found", "host": {"ip": ip, "sent": time.perf_counter()}})
+        scan.put({"type": "complete", "total": len(hosts)})
+
+    producer = threading.Thread(target=_produce)
+    started = time.perf_counter()
+    producer.start()
+    try:
+        for frame in app._stream(scan_id, timeout=5, batch=batch):
+            now = time.perf_counter()
+            frames += 1
+            msg = json.loads(frame.split("data: ", 1)[1])
+            if msg["type"] == "host_found":
+                latencies.append(now - msg["host"]["sent"])
+            elif msg["type"] == "hosts_batch":
+                latencies.extend(now - host["sent"] for host in msg["found"])
+        elapsed = time.perf_counter() - started
+    finally:
+        producer.join()
+        app._active_scans.discard(scan_id)
+    return _result(
+        "sse_batch" if batch else "sse", size, len(latencies), "events/s", elapsed,
+        latencies, frames=frames, dropped=scan.dropped,
+    )
+
+
+# ─── Ejecución y comparación ────────────────────────────────────────────────────
+
+def _suite(name: str) -> list:
+    return {
+        "arp_arping": [lambda size, args: bench_arp(size, args, "arping")],
+        "arp_stream": [lambda size, args: bench_arp(size, args, "stream")],
+        "nmap_many": [bench_nmap_many],
+        "nmap_single": [bench_nmap_single],
+        "vendor": [bench_vendor],
+        "risk": [bench_risk],
+        "sse": [
+            lambda size, args: bench_sse(size, args, False),
+            lambda size, args: bench_sse(size, args, True),
+        ],
+    }[name]
+
+
+def run_benchmarks(args, log=print) -> list:
+    results = []
+    for size in args.sizes:
+        for name in args.only:
+            for bench in _suite(name):
+                result = bench(size, args)
+                log(_format_row(result))
+                results.append(result)
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+
+
+def report(args, results: list) -> dict:
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+
+
+def _key(result: dict) -> tuple:
+    return result["name"], result["size"]
+
+
+def compare(old: dict, new: dict) -> list:
+    # Cambio relativo de throughput y de p50/p99 entre dos informes; sólo se
+    # comparan las pruebas presentes en ambos.
+    previous = {_key(r): r for r in old.get("results", [])}
+    rows = []
+    for result in new.get("results", []):
+        before = previous.get(_key(result))
+        if before is None:
+            continue
+        row = {"name": result["name"], "size": result["size"]}
+        row["throughput"] = _change(before["throughput"], result["throughput"])
+        for q in ("p50", "p99"):
+            row[q] = _change(before["latency_ms"].get(q), result["latency_ms"].get(q))
+        rows.append(row)
+    return rows
+
+
+def _change(before, after):
+    if not before or after is None:
+        return None
+    return round(100 * (after - before) / before, 1)
+
+
+def _format_row(result: dict) -> str:
+    latency = result["latency_ms"]
+    return (
+        f"{result['name']:<12} /{result['size']:<3} {result['items']:>7} "
+        f"{result['throughput']:>12.1f} {result['unit']:<10} "
+        f"p50={latency.get('p50', 0):.3f}ms p90={latency.get('p90', 0):.3f}ms "
+        f"p99={latency.get('p99', 0):.3f}ms"
+    )
+
+
+def _format_change(row: dict) -> str:
+    def fmt(value):
+        return "   n/a" if value is None else f"{value:+6.1f}%"
+
+    return (
+        f"{row['name']:<12} /{row['size']:<3} throughput {fmt(row['throughput'])}  "
+        f"p50 {fmt(row['p50'])}  p99 {fmt(row['p99'])}"
+    )
+
+
+def _csv_list(value: str, convert=str) -> list:
+    try:
+        return [convert(item.strip().lstrip("/")) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Lista inválida: '{value}'")
+
+
+def _sizes(value: str) -> list:
+    sizes = _csv_list(value, int)
+    if not sizes or any(not 16 <= size <= 30 for size in sizes):
+        raise argparse.ArgumentTypeError("Los tamaños deben ser prefijos entre /16 y /30")
+    return sizes
+
+
+def _benchmarks(value: str) -> list:
+    names = _csv_list(value)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"Prueba desconocida: {', '.join(unknown)}. Opciones: {', '.join(BENCHMARKS)}"
+        )
+    return names
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Benchmarks de NetWatcher con red, DNS y Nmap simulados.",
+    )
+    parser.add_argument("--sizes", type=_sizes, default=list(DEFAULT_SIZES),
+                        help="Prefijos de red a probar, p. ej. 24,20,16 (por defecto)")
+    parser.add_argument("--only", type=_benchmarks, default=list(BENCHMARKS),
+                        help=f"Pruebas a ejecutar ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--seed", type=int, default=1, help="Semilla de la red simulada")
+    parser.add_argument("--density", type=float, default=0.3,
+                        help="Fracción de direcciones con un host que responde")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="Probabilidad de perder una respuesta ARP")
+    parser.add_argument("--pps", type=float, default=20000.0,
+                        help="Paquetes ARP por segundo que emite la interfaz simulada")
+    parser.add_argument("--arp-latency-min", type=float, default=0.5,
+                        help="Latencia ARP mínima en ms")
+    parser.add_argument("--arp-latency-max", type=float, default=20.0,
+                        help="Latencia ARP máxima en ms")
+    parser.add_argument("--arp-timeout", type=float, default=250.0,
+                        help="Espera de respuestas ARP tras el último envío en ms")
+    parser.add_argument("--dns-hit-ratio", type=float, default=0.4,
+                        help="Fracción de IPs con registro PTR")
+    parser.add_argument("--dns-hit-ms", type=float, default=1.0,
+                        help="Latencia de una consulta PTR resuelta en ms")
+    parser.add_argument("--dns-miss-ms", type=float, default=5.0,
+                        help="Latencia de una consulta PTR sin respuesta en ms")
+    parser.add_argument("--ports", default="1-1024", help="Rango de puertos para Nmap")
+    parser.add_argument("--open-ports", type=int, default=5,
+                        help="Puertos abiertos por host en la salida simulada")
+    parser.add_argument("--closed-ports", type=int, default=20,
+                        help="Puertos cerrados por host en la salida simulada")
+    parser.add_argument("--nmap-rate", type=float, default=0,
+                        help="Líneas XML por segundo de Nmap (0 = sin límite)")
+    parser.add_argument("--single-hosts", type=int, default=50,
+                        help="Hosts escaneados uno a uno en nmap_single")
+    parser.add_argument("--output", metavar="ARCHIVO", help="Guardar los resultados en JSON")
+    parser.add_argument("--compare", metavar="ARCHIVO",
+                        help="Comparar con un informe JSON anterior")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    old = None
+    if args.compare:
+        try:
+            with open(args.compare, "r", encoding="utf-8") as f:
+                old = json.load(f)
+        except (IOError, ValueError) as e:
+            print(f"No se pudo leer el informe {args.compare}: {e}", file=sys.stderr)
+            return 1
+
+    data = report(args, run_benchmarks(args))
+    if args.output:
+        try:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+        except IOError as e:
+            print(f"No se pudo escribir en el archivo {args.output}: {e}", file=sys.stderr)
+            return 1
+        print(f"Resultados guardados en {args.output}")
+    if old is not None:
+        print(f"\nCambios respecto a {args.compare} ({old.get('revision', '?')}):")
+        for row in compare(old, data):
+            print(_format_change(row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
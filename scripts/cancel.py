@@ -0,0 +1,52 @@
+import threading
+from typing import Callable, Optional
+
+
+class CancelToken:
+    # Señal de cancelación cooperativa. Los bucles la consultan con `cancelled` o
+    # esperan con wait(), y quien controla un recurso que no puede sondear (un
+    # proceso hijo) registra con on_cancel() cómo interrumpirlo.
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> bool:
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        # Duerme hasta `timeout` segundos; devuelve True si se canceló antes.
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback: Callable) -> Callable:
+        # Devuelve una función que retira el callback. Si el token ya estaba
+        # cancelado el callback se ejecuta en el acto.
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def is_cancelled(token: Optional[CancelToken]) -> bool:
+    return token is not None and token.cancelled
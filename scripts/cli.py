@@ -2,13 +2,35 @@ import argparse
 import json
 import os
 import sys
+import threading
+import uuid
+from datetime import datetime
 
 if os.name == "nt":
     import ctypes
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from scripts.utils import run_arp_scan, nmap_scan, export_csv  # noqa: E402
+from scripts.utils import (  # noqa: E402
+    ARP_MAX_PPS,
+    ARP_MODES,
+    ARP_SHARD_WORKERS,
+    SCAN_ENGINES,
+    ResultWriter,
+    assess_risk,
+    export_csv,
+    load_dns_cache,
+    load_nmap_cache,
+    nmap_scan_cached,
+    nmap_scan_chunked,
+    nmap_scan_many,
+    run_arp_scan,
+    save_dns_cache,
+    save_nmap_cache,
+    scan_port_spec,
+    validate_ip,
+)
+from scripts.timings import StageTimer, profiled  # noqa: E402
 
 
 def check_permissions():
@@ -20,31 +42,227 @@ def check_permissions():
         return False
 
 
+def _open_history(args):
+    if not args.history_db:
+        return None
+    from scripts.history import HistoryStore
+    return HistoryStore(args.history_db)
+
+
+def _record_ports(args, results: dict):
+    history = _open_history(args)
+    if not history:
+        return
+    scan_id = f"cli-{uuid.uuid4()}"
+    for ip, ports in results.items():
+        history.record_ports(
+            ip, ports, scan_id, risk_level=assess_risk(ports, ip=ip)["level"],
+            port_range=args.ports, engine=args.engine,
+        )
+    history.close()
+
+
+ARP_EXPORT_FIELDS = ["ip", "mac", "hostname", "vendor"]
+PORT_EXPORT_FIELDS = ["ip", "open_ports", "risk_level"]
+
+
+def _open_output(args, fieldnames: list):
+    if not args.output:
+        return None
+    return ResultWriter(args.output, fieldnames=fieldnames, append=args.append)
+
+
+def _stage_timer(args):
+    return StageTimer() if args.timings else None
+
+
+def _with_timings(output, timings):
+    # Con --timings la salida JSON lleva el desglose por etapas; una lista de
+    # resultados pasa a ir bajo "results".
+    if timings is None:
+        return output
+    if isinstance(output, list):
+        return {"results": output, "timings": timings.as_dict()}
+    return {**output, "timings": timings.as_dict()}
+
+
+def _port_row(ip: str, open_ports: list) -> dict:
+    return {
+        "ip": ip,
+        "open_ports": ", ".join(str(p) for p in open_ports),
+        "risk_level": assess_risk(open_ports, ip=ip)["level"],
+    }
+
+
 def handle_arp_scan(args):
     if not check_permissions():
         print("Error: El escaneo ARP requiere privilegios de administrador.")
         sys.exit(1)
 
     print(f"Iniciando escaneo ARP en el rango: {args.cidr}...")
+
+    # Con --output cada host se escribe en cuanto se resuelve su nombre; los que
+    # no tienen DNS inverso se escriben al terminar el barrido, ya sin nombre.
+    writer = _open_output(args, ARP_EXPORT_FIELDS)
+    unresolved = {}
+    lock = threading.Lock()
+
+    def on_host(host):
+        with lock:
+            unresolved[host["ip"]] = host
+
+    def on_update(host):
+        with lock:
+            if unresolved.pop(host["ip"], None) is not None:
+                writer.write(host)
+
+    timings = _stage_timer(args)
     try:
-        results = run_arp_scan(args.cidr)
-        print(json.dumps(results, indent=2))
+        results = run_arp_scan(
+            args.cidr, callback=on_host if writer else None,
+            on_update=on_update if writer else None, mode=args.mode, workers=args.workers,
+            max_pps=args.pps, timings=timings,
+        )
+        if writer:
+            with lock:
+                for host in results:
+                    if unresolved.pop(host["ip"], None) is not None:
+                        writer.write(host)
+        print(json.dumps(_with_timings(results, timings), indent=2))
+        history = _open_history(args)
+        if history:
+            scan_id = f"cli-{uuid.uuid4()}"
+            for host in results:
+                history.record_host(host, scan_id)
+            history.close()
     except Exception as e:
         print(f"Ocurrió un error durante el escaneo ARP: {e}")
         sys.exit(1)
+    finally:
+        if writer:
+            writer.close()
 
 
 def handle_nmap_scan(args):
+    if args.ips:
+        handle_nmap_scan_many(args)
+        return
+
+    if args.chunks > 1 and args.engine == "nmap":
+        handle_nmap_scan_chunked(args)
+        return
+
     print(f"Iniciando escaneo Nmap en {args.ip} para los puertos {args.ports}...")
+    timings = _stage_timer(args)
     try:
-        results = nmap_scan(args.ip, port_range=args.ports)
+        results, cached = nmap_scan_cached(
+            args.ip, port_range=args.ports, engine=args.engine, force=args.force,
+            timings=timings,
+        )
+        if cached:
+            print("  Resultado tomado de la caché (usa --force para repetir).", file=sys.stderr)
         output = {"ip": args.ip, "open_ports": results}
-        print(json.dumps(output, indent=2))
+        print(json.dumps(_with_timings(output, timings), indent=2))
+        if args.output:
+            export_csv(
+                [_port_row(args.ip, results)], args.output,
+                fieldnames=PORT_EXPORT_FIELDS, append=args.append,
+            )
+        if not cached:
+            _record_ports(args, {args.ip: results})
+    except Exception as e:
+        print(f"Ocurrió un error durante el escaneo Nmap: {e}")
+        sys.exit(1)
+
+
+def handle_nmap_scan_chunked(args):
+    print(
+        f"Iniciando escaneo Nmap en {args.ip} para los puertos {args.ports} "
+        f"en {args.chunks} bloques..."
+    )
+
+    def on_chunk(chunk):
+        if chunk["status"] == "running":
+            return
+        label = f"  [{chunk['chunk'] + 1}/{chunk['chunks']}] {chunk['ports']}"
+        if chunk["status"] == "failed":
+            print(f"{label}: error ({chunk['error']})", file=sys.stderr)
+        else:
+            print(f"{label}: {len(chunk['open_ports'])} puertos abiertos", file=sys.stderr)
+
+    timings = _stage_timer(args)
+    try:
+        result = nmap_scan_chunked(
+            args.ip, port_range=args.ports, chunks=args.chunks,
+            workers=args.chunk_workers, on_chunk=on_chunk, timings=timings,
+        )
+        print(json.dumps(_with_timings({"ip": args.ip, **result}, timings), indent=2))
+        if args.output:
+            export_csv(
+                [_port_row(args.ip, result["open_ports"])], args.output,
+                fieldnames=PORT_EXPORT_FIELDS, append=args.append,
+            )
+        if not result["partial"]:
+            _record_ports(args, {args.ip: result["open_ports"]})
     except Exception as e:
         print(f"Ocurrió un error durante el escaneo Nmap: {e}")
         sys.exit(1)
 
 
+def handle_nmap_scan_many(args):
+    print(f"Iniciando escaneo Nmap en {len(args.ips)} hosts para los puertos {args.ports}...")
+
+    # Con --output cada host se escribe en cuanto termina, sin esperar al resto.
+    writer = _open_output(args, PORT_EXPORT_FIELDS)
+
+    def on_host(ip, open_ports):
+        print(f"  [+] {ip}: {len(open_ports)} puertos abiertos", file=sys.stderr)
+        if writer:
+            writer.write(_port_row(ip, open_ports))
+
+    timings = _stage_timer(args)
+    try:
+        results = nmap_scan_many(
+            args.ips, port_range=args.ports, callback=on_host, engine=args.engine,
+            timings=timings,
+        )
+        output = [{"ip": ip, "open_ports": ports} for ip, ports in results.items()]
+        print(json.dumps(_with_timings(output, timings), indent=2))
+        _record_ports(args, results)
+    except Exception as e:
+        print(f"Ocurrió un error durante el escaneo Nmap: {e}")
+        sys.exit(1)
+    finally:
+        if writer:
+            writer.close()
+
+
+def handle_incremental_scan(args):
+    from scripts.history import DEFAULT_DB_PATH, HistoryStore
+    from scripts.incremental import run_incremental_scan
+
+    if not check_permissions():
+        print("Error: El escaneo ARP requiere privilegios de administrador.")
+        sys.exit(1)
+
+    def on_host(ip, open_ports):
+        print(f"  [+] {ip}: {len(open_ports)} puertos abiertos", file=sys.stderr)
+
+    print(f"Iniciando escaneo incremental en el rango: {args.cidr}...")
+    history = HistoryStore(args.history_db or DEFAULT_DB_PATH)
+    try:
+        result = run_incremental_scan(
+            args.cidr, history, port_range=args.ports, engine=args.engine,
+            max_age=args.max_age * 3600, mode=args.mode, callback=on_host,
+        )
+        print(json.dumps(result, indent=2))
+    except Exception as e:
+        print(f"Ocurrió un error durante el escaneo incremental: {e}")
+        sys.exit(1)
+    finally:
+        history.close()
+
+
 def handle_export(args):
     print(f"Exportando datos de ejemplo a {args.file}...")
     sample_data = [
@@ -60,18 +278,122 @@ def handle_export(args):
         },
     ]
     try:
-        export_csv(sample_data, args.file)
+        export_csv(sample_data, args.file, append=args.append)
         print("Exportación completada exitosamente.")
     except Exception as e:
         print(f"Error al exportar: {e}")
         sys.exit(1)
 
 
+def _port_spec(value: str) -> str:
+    try:
+        return str(scan_port_spec(value))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _ip_address(value: str) -> str:
+    if not validate_ip(value):
+        raise argparse.ArgumentTypeError(f"Dirección IP inválida: '{value}'")
+    return value
+
+
+def _parse_since(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Fecha inválida: '{value}'. Usa epoch o ISO 8601 (ej. 2025-10-01)."
+        )
+
+
+def handle_history(args):
+    from scripts.history import DEFAULT_DB_PATH, HistoryStore
+
+    path = args.history_db or DEFAULT_DB_PATH
+    if not os.path.exists(path):
+        print(f"Error: No existe la base de datos de historial {path}.")
+        sys.exit(1)
+
+    history = HistoryStore(path)
+    try:
+        if args.ports:
+            if not args.ip:
+                print("Error: --ports requiere --ip.")
+                sys.exit(1)
+            output = history.port_history(args.ip, limit=args.limit)
+        elif args.mac:
+            output = {
+                "summary": history.first_seen(args.mac),
+                "sightings": history.host_history(
+                    mac=args.mac, since=args.since, limit=args.limit
+                ),
+            }
+        else:
+            output = history.host_history(ip=args.ip, since=args.since, limit=args.limit)
+        print(json.dumps(output, indent=2))
+    finally:
+        history.close()
+
+
+def handle_build_oui(args):
+    from scripts.oui import compile_oui_index
+
+    print(f"Compilando índice OUI desde {len(args.source)} archivo(s)...")
+    try:
+        total = compile_oui_index(args.source, args.output)
+        print(f"Índice generado en {args.output} con {total} prefijos.")
+    except Exception as e:
+        print(f"Error al compilar el índice OUI: {e}")
+        sys.exit(1)
+
+
+def _add_output_args(parser):
+    parser.add_argument(
+        "--output",
+        help="Guarda los resultados en CSV o JSON Lines (.csv, .jsonl; añade .gz para comprimir).",
+    )
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="Añade al archivo de --output en vez de reescribirlo.",
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="NetWatcher CLI - Herramienta de escaneo de red.",
         epilog="Recuerda ejecutar 'scan-arp' como administrador.",
     )
+    parser.add_argument(
+        "--dns-cache",
+        default=os.environ.get("NETWATCHER_DNS_CACHE"),
+        help="Archivo JSON para persistir la caché de DNS inverso entre ejecuciones.",
+    )
+    parser.add_argument(
+        "--nmap-cache",
+        default=os.environ.get("NETWATCHER_NMAP_CACHE"),
+        help="Archivo JSON para reutilizar resultados recientes de 'scan-nmap' entre ejecuciones.",
+    )
+    parser.add_argument(
+        "--history-db",
+        default=os.environ.get("NETWATCHER_HISTORY_DB"),
+        help="Base de datos SQLite donde se guardan los resultados de los escaneos.",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Incluye en la salida JSON el tiempo de cada etapa de 'scan-arp' y 'scan-nmap'.",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="ARCHIVO",
+        help="Guarda un perfil cProfile del comando (ver con 'python -m pstats ARCHIVO').",
+    )
     subparsers = parser.add_subparsers(
         dest="command", required=True, help="Subcomandos disponibles"
     )
@@ -84,34 +406,156 @@ def main():
         required=True,
         help="El rango de red en formato CIDR (ej. 192.168.1.0/24).",
     )
+    parser_arp.add_argument(
+        "--mode",
+        choices=ARP_MODES,
+        default="arping",
+        help="Modo de descubrimiento. 'sharded' reparte rangos grandes (/16) entre procesos.",
+    )
+    parser_arp.add_argument(
+        "--workers",
+        type=int,
+        default=ARP_SHARD_WORKERS,
+        help="Procesos para el modo 'sharded'.",
+    )
+    parser_arp.add_argument(
+        "--pps",
+        type=int,
+        default=ARP_MAX_PPS,
+        help="Límite global de paquetes por segundo en el modo 'sharded'.",
+    )
+    _add_output_args(parser_arp)
     parser_arp.set_defaults(func=handle_arp_scan)
 
     parser_nmap = subparsers.add_parser(
         "scan-nmap", help="Realiza un escaneo de puertos con Nmap."
     )
-    parser_nmap.add_argument("--ip", required=True, help="La dirección IP del objetivo.")
+    targets = parser_nmap.add_mutually_exclusive_group(required=True)
+    targets.add_argument("--ip", type=_ip_address, help="La dirección IP del objetivo.")
+    targets.add_argument(
+        "--ips",
+        nargs="+",
+        type=_ip_address,
+        help="Varias IPs escaneadas con un único proceso Nmap (ej. --ips 10.0.0.1 10.0.0.2).",
+    )
     parser_nmap.add_argument(
         "--ports",
+        type=_port_spec,
         default="1-1024",
-        help="Rango de puertos a escanear (ej. '22,80,443' o '1-1024').",
+        help="Puertos a escanear con la sintaxis de nmap (ej. '22,80,443', '1-1024', 'top-100').",
     )
+    parser_nmap.add_argument(
+        "--engine",
+        choices=SCAN_ENGINES,
+        default="nmap",
+        help="Motor de escaneo: 'nmap' o 'connect' (asyncio, no requiere nmap).",
+    )
+    parser_nmap.add_argument(
+        "--force",
+        action="store_true",
+        help="Ignora el resultado en caché y lanza un escaneo nuevo.",
+    )
+    parser_nmap.add_argument(
+        "--chunks",
+        type=int,
+        default=1,
+        help="Divide el rango de --ip en N bloques escaneados por procesos Nmap en paralelo.",
+    )
+    parser_nmap.add_argument(
+        "--chunk-workers",
+        type=int,
+        default=None,
+        help="Procesos Nmap simultáneos para --chunks (límite global: NETWATCHER_NMAP_PROCESSES).",
+    )
+    _add_output_args(parser_nmap)
     parser_nmap.set_defaults(func=handle_nmap_scan)
 
+    parser_incremental = subparsers.add_parser(
+        "scan-incremental",
+        help="Escaneo ARP que sólo escanea puertos de los hosts que cambiaron.",
+    )
+    parser_incremental.add_argument(
+        "--cidr", required=True, help="El rango de red en formato CIDR (ej. 192.168.1.0/24)."
+    )
+    parser_incremental.add_argument(
+        "--ports", type=_port_spec, default="1-1024", help="Puertos a escanear (ej. 'top-100')."
+    )
+    parser_incremental.add_argument(
+        "--engine", choices=SCAN_ENGINES, default="nmap", help="Motor de escaneo de puertos."
+    )
+    parser_incremental.add_argument(
+        "--mode", choices=ARP_MODES, default="arping", help="Modo de descubrimiento ARP."
+    )
+    parser_incremental.add_argument(
+        "--max-age",
+        type=float,
+        default=24,
+        help="Horas tras las que se vuelve a escanear un host aunque no haya cambiado.",
+    )
+    parser_incremental.set_defaults(func=handle_incremental_scan)
+
     parser_export = subparsers.add_parser(
         "export", help="Exporta los resultados a un archivo CSV."
     )
     parser_export.add_argument(
         "--file",
         required=True,
-        help="Nombre del archivo de salida (ej. 'resultados.csv').",
+        help="Archivo de salida (ej. 'resultados.csv', 'resultados.jsonl.gz').",
+    )
+    parser_export.add_argument(
+        "--append", action="store_true", help="Añade las filas al archivo existente."
     )
     parser_export.set_defaults(func=handle_export)
 
+    parser_history = subparsers.add_parser(
+        "history", help="Consulta el historial de escaneos guardado."
+    )
+    parser_history.add_argument("--ip", help="Filtra por dirección IP.")
+    parser_history.add_argument("--mac", help="Muestra cuándo apareció por primera vez una MAC.")
+    parser_history.add_argument(
+        "--since", type=_parse_since, help="Sólo registros desde esta fecha (epoch o ISO 8601)."
+    )
+    parser_history.add_argument(
+        "--ports", action="store_true", help="Muestra el historial de puertos de --ip."
+    )
+    parser_history.add_argument("--limit", type=int, default=100, help="Máximo de registros.")
+    parser_history.set_defaults(func=handle_history)
+
+    parser_oui = subparsers.add_parser(
+        "build-oui", help="Compila los registros IEEE (MA-L/MA-M/MA-S) en un índice OUI."
+    )
+    parser_oui.add_argument(
+        "--source",
+        nargs="+",
+        required=True,
+        help="CSV oficiales del IEEE (oui.csv, mam.csv, oui36.csv).",
+    )
+    parser_oui.add_argument(
+        "--output",
+        required=True,
+        help="Ruta del índice binario (usar con NETWATCHER_OUI_INDEX).",
+    )
+    parser_oui.set_defaults(func=handle_build_oui)
+
     args = parser.parse_args()
-    if hasattr(args, "func"):
-        args.func(args)
-    else:
+    if not hasattr(args, "func"):
         parser.print_help()
+        return
+    if args.command == "scan-nmap" and args.ips and args.chunks > 1:
+        parser_nmap.error("--chunks sólo se admite con --ip, no con --ips")
+
+    if args.dns_cache:
+        load_dns_cache(args.dns_cache)
+    if args.nmap_cache:
+        load_nmap_cache(args.nmap_cache)
+    try:
+        with profiled(args.profile):
+            args.func(args)
+    finally:
+        if args.dns_cache:
+            save_dns_cache(args.dns_cache)
+        if args.nmap_cache:
+            save_nmap_cache(args.nmap_cache)
 
 
 if __name__ == "__main__":
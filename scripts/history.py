@@ -0,0 +1,295 @@
+import ipaddress
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from scripts.utils import mac_to_int
+
+DEFAULT_DB_PATH = "netwatcher_history.db"
+HISTORY_BATCH_SIZE = 200
+HISTORY_FLUSH_INTERVAL = 1.0
+HISTORY_MAX_PENDING = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS host_seen (
+    id INTEGER PRIMARY KEY,
+    scan_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    ip TEXT NOT NULL,
+    mac TEXT,
+    hostname TEXT,
+    vendor TEXT,
+    UNIQUE (scan_id, ip)
+);
+CREATE INDEX IF NOT EXISTS idx_host_seen_ip ON host_seen (ip, ts);
+CREATE INDEX IF NOT EXISTS idx_host_seen_mac ON host_seen (mac, ts);
+CREATE INDEX IF NOT EXISTS idx_host_seen_ts ON host_seen (ts);
+
+CREATE TABLE IF NOT EXISTS port_scan (
+    id INTEGER PRIMARY KEY,
+    scan_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    ip TEXT NOT NULL,
+    port_range TEXT,
+    engine TEXT,
+    open_ports TEXT NOT NULL,
+    risk_level TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_port_scan_ip ON port_scan (ip, ts);
+CREATE INDEX IF NOT EXISTS idx_port_scan_ts ON port_scan (ts);
+"""
+
+_UPSERT_HOST = """
+INSERT INTO host_seen (scan_id, ts, ip, mac, hostname, vendor)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (scan_id, ip) DO UPDATE SET
+    mac = excluded.mac, hostname = excluded.hostname, vendor = excluded.vendor
+"""
+_INSERT_PORTS = """
+INSERT INTO port_scan (scan_id, ts, ip, port_range, engine, open_ports, risk_level)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _normalise_mac(mac: Optional[str]) -> Optional[str]:
+    value = mac_to_int(mac)
+    if value is None:
+        return mac
+    digits = f"{value:012X}"
+    return ":".join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+class HistoryStore:
+    def __init__(
+        self,
+        path: str = DEFAULT_DB_PATH,
+        batch_size: int = HISTORY_BATCH_SIZE,
+        flush_interval: float = HISTORY_FLUSH_INTERVAL,
+        max_pending: int = HISTORY_MAX_PENDING,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+
+        with self._session() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+        self._writer = threading.Thread(
+            target=self._write_loop, daemon=True, name="netwatcher-history"
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _session(self):
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # Escritura: los hilos de escaneo sólo encolan sin bloquear. Si el buffer
+    # está lleno el registro se descarta y se contabiliza en `dropped`.
+    def _enqueue(self, item: tuple) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._pending.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def record_host(self, host: dict, scan_id: str, ts: Optional[float] = None) -> bool:
+        return self._enqueue(("host", (
+            scan_id, ts or time.time(), host.get("ip"), _normalise_mac(host.get("mac")),
+            host.get("hostname"), host.get("vendor"),
+        )))
+
+    def record_ports(
+        self,
+        ip: str,
+        open_ports: list,
+        scan_id: str,
+        risk_level: Optional[str] = None,
+        port_range: Optional[str] = None,
+        engine: Optional[str] = None,
+        ts: Optional[float] = None,
+    ) -> bool:
+        return self._enqueue(("ports", (
+            scan_id, ts or time.time(), ip, port_range, engine,
+            json.dumps(sorted(open_ports)), risk_level,
+        )))
+
+    def flush(self) -> None:
+        self._pending.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.put(None)
+        self._writer.join()
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        running = True
+        while running:
+            batch = []
+            try:
+                item = self._pending.get()
+                batch.append(item)
+                deadline = time.monotonic() + self.flush_interval
+                while item is not None and len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._pending.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(item)
+
+                running = batch[-1] is not None
+                hosts = [row for kind, row in filter(None, batch) if kind == "host"]
+                ports = [row for kind, row in filter(None, batch) if kind == "ports"]
+                with conn:
+                    if hosts:
+                        conn.executemany(_UPSERT_HOST, hosts)
+                    if ports:
+                        conn.executemany(_INSERT_PORTS, ports)
+            except sqlite3.Error as e:
+                print(f"No se pudo guardar el historial: {e}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+        conn.close()
+
+    # Consultas
+    def host_history(
+        self,
+        ip: Optional[str] = None,
+        mac: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 100,
+    ) -> list:
+        clauses, params = [], []
+        if ip:
+            clauses.append("ip = ?")
+            params.append(ip)
+        if mac:
+            clauses.append("mac = ?")
+            params.append(_normalise_mac(mac))
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts <= ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = (
+            f"SELECT scan_id, ts, ip, mac, hostname, vendor FROM host_seen {where} "
+            "ORDER BY ts DESC LIMIT ?"
+        )
+        with self._session() as conn:
+            return [dict(row) for row in conn.execute(query, (*params, limit))]
+
+    def first_seen(self, mac: str) -> Optional[dict]:
+        mac = _normalise_mac(mac)
+        with self._session() as conn:
+            row = conn.execute(
+                "SELECT MIN(ts) AS first_seen, MAX(ts) AS last_seen, COUNT(*) AS sightings "
+                "FROM host_seen WHERE mac = ?",
+                (mac,),
+            ).fetchone()
+            if not row or row["sightings"] == 0:
+                return None
+            ips = [r["ip"] for r in conn.execute(
+                "SELECT ip, MAX(ts) AS ts FROM host_seen WHERE mac = ? "
+                "GROUP BY ip ORDER BY ts DESC",
+                (mac,),
+            )]
+        return {"mac": mac, **dict(row), "ips": ips}
+
+    def port_history(self, ip: str, limit: int = 20) -> list:
+        with self._session() as conn:
+            rows = conn.execute(
+                "SELECT scan_id, ts, ip, port_range, engine, open_ports, risk_level "
+                "FROM port_scan WHERE ip = ? ORDER BY ts DESC LIMIT ?",
+                (ip, limit),
+            )
+            return [{**dict(row), "open_ports": json.loads(row["open_ports"])} for row in rows]
+
+    # Instantáneas para los re-escaneos incrementales
+    def last_snapshot(
+        self, cidr: str, exclude_scan_id: Optional[str] = None, max_scans: int = 50
+    ) -> dict:
+        network = ipaddress.ip_network(cidr, strict=False)
+        with self._session() as conn:
+            scans = conn.execute(
+                "SELECT scan_id, MAX(ts) AS ts FROM host_seen GROUP BY scan_id "
+                "ORDER BY ts DESC LIMIT ?",
+                (max_scans,),
+            ).fetchall()
+            for scan in scans:
+                if scan["scan_id"] == exclude_scan_id:
+                    continue
+                rows = conn.execute(
+                    "SELECT scan_id, ts, ip, mac, hostname, vendor FROM host_seen "
+                    "WHERE scan_id = ?",
+                    (scan["scan_id"],),
+                )
+                hosts = {
+                    row["ip"]: dict(row) for row in rows
+                    if ipaddress.ip_address(row["ip"]) in network
+                }
+                if hosts:
+                    return hosts
+        return {}
+
+    def latest_ports(self, ips: list) -> dict:
+        latest = {}
+        ips = list(dict.fromkeys(ips))
+        with self._session() as conn:
+            for start in range(0, len(ips), 500):
+                chunk = ips[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                # SQLite devuelve las columnas de la fila que contiene MAX(ts).
+                rows = conn.execute(
+                    "SELECT ip, MAX(ts) AS ts, port_range, engine, open_ports, risk_level "
+                    f"FROM port_scan WHERE ip IN ({placeholders}) GROUP BY ip",
+                    chunk,
+                )
+                for row in rows:
+                    latest[row["ip"]] = {
+                        **dict(row), "open_ports": json.loads(row["open_ports"])
+                    }
+        return latest
+
+    def stats(self) -> dict:
+        with self._session() as conn:
+            hosts = conn.execute("SELECT COUNT(*) FROM host_seen").fetchone()[0]
+            ports = conn.execute("SELECT COUNT(*) FROM port_scan").fetchone()[0]
+        return {
+            "path": os.path.abspath(self.path),
+            "host_records": hosts,
+            "port_records": ports,
+            "pending": self._pending.qsize(),
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,126 @@
+import time
+import uuid
+from typing import Callable, Optional
+
+from scripts.utils import (
+    assess_risk,
+    mac_to_int,
+    nmap_scan_many,
+    run_arp_scan,
+    scan_port_spec,
+)
+
+INCREMENTAL_MAX_AGE = 24 * 3600
+
+
+def _rebound(before: dict, host: dict) -> bool:
+    return mac_to_int(before.get("mac")) != mac_to_int(host.get("mac"))
+
+
+def plan_rescan(
+    hosts: list,
+    previous: dict,
+    last_ports: dict,
+    max_age: float = INCREMENTAL_MAX_AGE,
+    port_range: Optional[str] = None,
+    now: Optional[float] = None,
+) -> dict:
+    # Decide qué hosts necesitan escaneo de puertos y con qué motivo:
+    #   new      IP que no estaba en la instantánea anterior
+    #   rebound  la IP responde ahora con otra MAC
+    #   stale    el último escaneo de puertos es más antiguo que `max_age`
+    #            o se hizo con otro rango de puertos
+    # El resto reutiliza los puertos guardados.
+    now = time.time() if now is None else now
+    scan, reuse = {}, {}
+    for host in hosts:
+        ip = host["ip"]
+        before = previous.get(ip)
+        last = last_ports.get(ip)
+        if before is None:
+            scan[ip] = "new"
+        elif _rebound(before, host):
+            scan[ip] = "rebound"
+        elif (
+            last is None
+            or now - last["ts"] > max_age
+            or (port_range and last.get("port_range") not in (None, port_range))
+        ):
+            scan[ip] = "stale"
+        else:
+            reuse[ip] = last["open_ports"]
+    return {"scan": scan, "reuse": reuse}
+
+
+def diff_snapshots(previous: dict, hosts: list, last_ports: dict, ports: dict) -> dict:
+    current = {host["ip"]: host for host in hosts}
+    diff = {
+        "joined": [host for ip, host in current.items() if ip not in previous],
+        "left": [host for ip, host in previous.items() if ip not in current],
+        "rebound": [],
+        "ports_opened": {},
+        "ports_closed": {},
+        "risk_changed": [],
+    }
+    for ip, host in current.items():
+        before = previous.get(ip)
+        if before and _rebound(before, host):
+            diff["rebound"].append(
+                {"ip": ip, "old_mac": before.get("mac"), "new_mac": host.get("mac")}
+            )
+
+        last = last_ports.get(ip)
+        if last is None or ip not in ports:
+            continue
+        old, new = set(last["open_ports"]), set(ports[ip])
+        if new - old:
+            diff["ports_opened"][ip] = sorted(new - old)
+        if old - new:
+            diff["ports_closed"][ip] = sorted(old - new)
+        level = assess_risk(ports[ip], ip=ip, vendor=host.get("vendor"))["level"]
+        if last.get("risk_level") and last["risk_level"] != level:
+            diff["risk_changed"].append({"ip": ip, "before": last["risk_level"], "after": level})
+    return diff
+
+
+def run_incremental_scan(
+    cidr: str,
+    history,
+    port_range: str = "1-1024",
+    engine: str = "nmap",
+    max_age: float = INCREMENTAL_MAX_AGE,
+    mode: str = "arping",
+    callback: Optional[Callable] = None,
+) -> dict:
+    port_range = str(scan_port_spec(port_range))
+    scan_id = f"incremental-{uuid.uuid4()}"
+    previous = history.last_snapshot(cidr, exclude_scan_id=scan_id)
+    hosts = run_arp_scan(cidr, mode=mode)
+    last_ports = history.latest_ports([host["ip"] for host in hosts])
+
+    plan = plan_rescan(hosts, previous, last_ports, max_age=max_age, port_range=port_range)
+    scanned = {}
+    if plan["scan"]:
+        scanned = nmap_scan_many(
+            list(plan["scan"]), port_range=port_range, callback=callback, engine=engine
+        )
+
+    ports = {**plan["reuse"], **scanned}
+    for host in hosts:
+        history.record_host(host, scan_id)
+        host["open_ports"] = ports.get(host["ip"], [])
+    vendors = {host["ip"]: host.get("vendor") for host in hosts}
+    for ip, open_ports in scanned.items():
+        risk = assess_risk(open_ports, ip=ip, vendor=vendors.get(ip))
+        history.record_ports(
+            ip, open_ports, scan_id, risk_level=risk["level"],
+            port_range=port_range, engine=engine,
+        )
+
+    return {
+        "scan_id": scan_id,
+        "hosts": hosts,
+        "scanned": plan["scan"],
+        "skipped": len(plan["reuse"]),
+        "diff": diff_snapshots(previous, hosts, last_ports, scanned),
+    }
@@ -8,7 +8,14 @@ if os.name == "nt":
 import PySimpleGUI as sg
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from scripts.utils import detect_local_cidr, export_csv, nmap_scan, run_arp_scan  # noqa: E402
+from scripts.cancel import CancelToken  # noqa: E402
+from scripts.utils import (  # noqa: E402
+    detect_local_cidr,
+    export_csv,
+    nmap_scan_cached,
+    nmap_scan_many,
+    run_arp_scan,
+)
 
 
 APP_TITLE = "NetWatcher - Escáner de Red Educativo"
@@ -31,20 +38,48 @@ def log_message(window, message, level="INFO"):
     window["-LOG-"].print(f"[{level}] {message}", text_color=color)
 
 
-def run_scan_in_thread(window, scan_function, *args):
+def run_scan_in_thread(window, scan_function, *args, **kwargs):
     try:
-        results = scan_function(*args)
+        results = scan_function(*args, **kwargs)
         window.write_event_value(("-SCAN-COMPLETE-", results), None)
     except Exception as e:
         window.write_event_value(("-SCAN-ERROR-", str(e)), None)
 
 
-def run_nmap_in_thread(window, target_ip, row_index, port_range="1-1024"):
+def run_arp_in_thread(window, cidr, cancel=None):
+    def on_host(host):
+        window.write_event_value(("-HOST-FOUND-", host), None)
+
+    def on_update(host):
+        window.write_event_value(("-HOST-UPDATED-", host), None)
+
+    run_scan_in_thread(
+        window, run_arp_scan, cidr, callback=on_host, on_update=on_update, mode="stream",
+        cancel=cancel,
+    )
+
+
+def run_nmap_in_thread(
+    window, target_ip, row_index, port_range="1-1024", force=False, cancel=None
+):
     try:
-        open_ports = nmap_scan(target_ip, port_range)
-        window.write_event_value(("-NMAP-COMPLETE-", (row_index, open_ports)), None)
+        open_ports, cached = nmap_scan_cached(
+            target_ip, port_range, force=force, cancel=cancel
+        )
+        window.write_event_value(("-NMAP-COMPLETE-", (row_index, open_ports, cached)), None)
     except Exception as e:
-        window.write_event_value(("-NMAP-ERROR-", str(e)), None)
+        window.write_event_value(("-NMAP-ERROR-", ("nmap", str(e))), None)
+
+
+def run_nmap_many_in_thread(window, target_ips, port_range="1-1024", cancel=None):
+    def on_host(ip, open_ports):
+        window.write_event_value(("-NMAP-HOST-DONE-", (ip, open_ports)), None)
+
+    try:
+        nmap_scan_many(target_ips, port_range, callback=on_host, cancel=cancel)
+        window.write_event_value(("-NMAP-ALL-COMPLETE-", len(target_ips)), None)
+    except Exception as e:
+        window.write_event_value(("-NMAP-ERROR-", ("nmap_all", str(e))), None)
 
 
 def create_main_window():
@@ -56,6 +91,8 @@ def create_main_window():
         sg.Button("Detectar", key="-DETECT-"),
         sg.Button("Scan ARP", key="-ARP-SCAN-", button_color=("white", "green")),
         sg.Button("Nmap Quick Scan", key="-NMAP-SCAN-", disabled=True),
+        sg.Button("Nmap Todos", key="-NMAP-ALL-", disabled=True),
+        sg.Checkbox("Forzar", key="-NMAP-FORCE-", tooltip="Ignora los resultados en caché"),
         sg.Button("Detener Scan", key="-STOP-", button_color=("white", "red"), disabled=True),
     ]
 
@@ -98,6 +135,20 @@ def main():
 
     window = create_main_window()
     hosts_data = []
+    # Un token por tipo de escaneo en curso; "Detener Scan" los cancela todos.
+    scans = {"arp": None, "nmap": None, "nmap_all": None}
+
+    def start_scan(kind):
+        scans[kind] = CancelToken()
+        window["-STOP-"].update(disabled=False)
+        return scans[kind]
+
+    def finish_scan(*kinds):
+        stopped = any(scans[k] is not None and scans[k].cancelled for k in kinds)
+        for kind in kinds:
+            scans[kind] = None
+        window["-STOP-"].update(disabled=not any(scans.values()))
+        return stopped
 
     while True:
         event, values = window.read()
@@ -127,38 +178,67 @@ def main():
 
             log_message(window, f"Iniciando escaneo ARP en {cidr_input}...")
             window["-ARP-SCAN-"].update(disabled=True)
-            window["-STOP-"].update(disabled=False)
             hosts_data.clear()
             window["-RESULTS-"].update(values=[])
             window["-EXPORT-"].update(disabled=True)
             window["-NMAP-SCAN-"].update(disabled=True)
+            window["-NMAP-ALL-"].update(disabled=True)
 
             threading.Thread(
-                target=run_scan_in_thread,
-                args=(window, run_arp_scan, cidr_input),
+                target=run_arp_in_thread,
+                args=(window, cidr_input),
+                kwargs={"cancel": start_scan("arp")},
                 daemon=True,
             ).start()
 
+        elif event_key == "-HOST-FOUND-":
+            host = event_data
+            hosts_data.append(
+                [host.get(k, "N/A") for k in ["ip", "mac", "hostname", "vendor"]] + [""]
+            )
+            window["-RESULTS-"].update(values=hosts_data)
+
+        elif event_key == "-HOST-UPDATED-":
+            host = event_data
+            for row in hosts_data:
+                if row[0] == host["ip"]:
+                    row[2] = host["hostname"]
+                    window["-RESULTS-"].update(values=hosts_data)
+                    break
+
+        elif event_key == "-STOP-":
+            log_message(window, "Deteniendo escaneos en curso...", "WARN")
+            for token in scans.values():
+                if token is not None:
+                    token.cancel()
+            window["-STOP-"].update(disabled=True)
+
         elif event_key == "-SCAN-COMPLETE-":
             scan_results = event_data
-            log_message(
-                window,
-                f"Escaneo ARP completado. {len(scan_results)} hosts encontrados.",
-                "INFO"
-            )
-            hosts_data = [
-                [host.get(k, "N/A") for k in ["ip", "mac", "hostname", "vendor"]] + [""]
-                for host in scan_results
-            ]
+            if finish_scan("arp"):
+                log_message(
+                    window,
+                    f"Escaneo ARP detenido. {len(scan_results)} hosts encontrados.",
+                    "WARN"
+                )
+            else:
+                log_message(
+                    window,
+                    f"Escaneo ARP completado. {len(scan_results)} hosts encontrados.",
+                    "INFO"
+                )
+            hostnames = {host["ip"]: host.get("hostname", "N/A") for host in scan_results}
+            for row in hosts_data:
+                row[2] = hostnames.get(row[0], row[2])
             window["-RESULTS-"].update(values=hosts_data)
             window["-EXPORT-"].update(disabled=not hosts_data)
+            window["-NMAP-ALL-"].update(disabled=not hosts_data)
             window["-ARP-SCAN-"].update(disabled=False)
-            window["-STOP-"].update(disabled=True)
 
         elif event_key == "-SCAN-ERROR-":
+            finish_scan("arp")
             log_message(window, f"Error durante el escaneo: {event_data}", "ERROR")
             window["-ARP-SCAN-"].update(disabled=False)
-            window["-STOP-"].update(disabled=True)
 
         elif event_key == "-RESULTS-":
             window["-NMAP-SCAN-"].update(disabled=not values["-RESULTS-"])
@@ -177,21 +257,59 @@ def main():
             threading.Thread(
                 target=run_nmap_in_thread,
                 args=(window, target_ip, row_index),
+                kwargs={"force": values["-NMAP-FORCE-"], "cancel": start_scan("nmap")},
                 daemon=True,
             ).start()
 
         elif event_key == "-NMAP-COMPLETE-":
-            row_index, open_ports = event_data
+            row_index, open_ports, cached = event_data
             target_ip = hosts_data[row_index][0]
-            log_message(window, f"Escaneo Nmap para {target_ip} completado.", "INFO")
+            if finish_scan("nmap"):
+                log_message(window, f"Escaneo Nmap para {target_ip} detenido.", "WARN")
+            else:
+                source = " (desde caché)" if cached else ""
+                log_message(window, f"Escaneo Nmap para {target_ip} completado{source}.", "INFO")
             ports_str = ", ".join(map(str, open_ports)) if open_ports else "Ninguno"
             hosts_data[row_index][4] = ports_str
             window["-RESULTS-"].update(values=hosts_data)
             window["-NMAP-SCAN-"].update(disabled=False)
 
+        elif event_key == "-NMAP-ALL-":
+            target_ips = [row[0] for row in hosts_data]
+            log_message(window, f"Iniciando Nmap en {len(target_ips)} hosts...")
+            window["-NMAP-ALL-"].update(disabled=True)
+
+            threading.Thread(
+                target=run_nmap_many_in_thread,
+                args=(window, target_ips),
+                kwargs={"cancel": start_scan("nmap_all")},
+                daemon=True,
+            ).start()
+
+        elif event_key == "-NMAP-HOST-DONE-":
+            ip, open_ports = event_data
+            ports_str = ", ".join(map(str, open_ports)) if open_ports else "Ninguno"
+            for row in hosts_data:
+                if row[0] == ip:
+                    row[4] = ports_str
+            window["-RESULTS-"].update(values=hosts_data)
+
+        elif event_key == "-NMAP-ALL-COMPLETE-":
+            if finish_scan("nmap_all"):
+                log_message(window, "Escaneo Nmap de todos los hosts detenido.", "WARN")
+            else:
+                log_message(window, f"Escaneo Nmap de {event_data} hosts completado.", "INFO")
+            window["-NMAP-ALL-"].update(disabled=False)
+
         elif event_key == "-NMAP-ERROR-":
-            log_message(window, f"Error en Nmap: {event_data}", "ERROR")
-            window["-NMAP-SCAN-"].update(disabled=False)
+            # Sólo termina el escaneo que falló: el otro puede seguir en curso.
+            kind, message = event_data
+            finish_scan(kind)
+            log_message(window, f"Error en Nmap: {message}", "ERROR")
+            if kind == "nmap":
+                window["-NMAP-SCAN-"].update(disabled=False)
+            else:
+                window["-NMAP-ALL-"].update(disabled=not hosts_data)
 
         elif event_key == "-EXPORT-":
             if not hosts_data:
@@ -200,12 +318,18 @@ def main():
 
             filepath = sg.popup_get_file(
                 "Guardar como", save_as=True, no_window=True,
-                file_types=(("CSV Files", "*.csv"),), default_extension=".csv"
+                file_types=(
+                    ("CSV Files", "*.csv"), ("CSV comprimido", "*.csv.gz"),
+                    ("JSON Lines", "*.jsonl"), ("JSON Lines comprimido", "*.jsonl.gz"),
+                ),
+                default_extension=".csv",
             )
             if filepath:
                 try:
-                    export_data = [dict(zip(TABLE_HEADINGS, row)) for row in hosts_data]
-                    export_csv(export_data, filepath)
+                    export_csv(
+                        (dict(zip(TABLE_HEADINGS, row)) for row in hosts_data),
+                        filepath, fieldnames=TABLE_HEADINGS,
+                    )
                     log_message(window, f"Datos exportados a {filepath}", "INFO")
                 except Exception as e:
                     log_message(window, f"Error al exportar: {e}", "ERROR")
@@ -0,0 +1,132 @@
+import csv
+import mmap
+import os
+import struct
+from typing import Optional
+
+
+# Formato del índice (little-endian):
+#   cabecera   MAGIC + 4 x uint32: entradas de 36, 28 y 24 bits y nº de fabricantes
+#   secciones  por cada longitud (36, 28, 24): registros <prefijo uint64, fabricante uint32>
+#              ordenados por prefijo, para búsqueda binaria directamente sobre el mmap
+#   fabricantes  (n + 1) offsets uint32 seguidos del blob UTF-8 de nombres internados
+MAGIC = b"NWOUI\x00\x01\x00"
+PREFIX_BITS = (36, 28, 24)
+
+_HEADER = struct.Struct("<8s4I")
+_RECORD = struct.Struct("<QI")
+_OFFSET = struct.Struct("<I")
+
+
+def parse_ieee_csv(filepath: str) -> list:
+    entries = []
+    with open(filepath, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            assignment = (row.get("Assignment") or "").strip().upper()
+            vendor = (row.get("Organization Name") or "").strip()
+            bits = len(assignment) * 4
+            if bits not in PREFIX_BITS or not vendor:
+                continue
+            try:
+                entries.append((int(assignment, 16), bits, vendor))
+            except ValueError:
+                continue
+    return entries
+
+
+def compile_oui_index(sources: list, output: str) -> int:
+    tables = {bits: {} for bits in PREFIX_BITS}
+    for source in sources:
+        for prefix, bits, vendor in parse_ieee_csv(source):
+            tables[bits][prefix] = vendor
+
+    vendor_ids: dict = {}
+    sections = []
+    for bits in PREFIX_BITS:
+        records = sorted(
+            (prefix, vendor_ids.setdefault(vendor, len(vendor_ids)))
+            for prefix, vendor in tables[bits].items()
+        )
+        sections.append(records)
+
+    names = [name.encode("utf-8") for name in vendor_ids]
+    offsets = [0]
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+
+    tmp_path = f"{output}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, *(len(records) for records in sections), len(names)))
+            for records in sections:
+                for record in records:
+                    f.write(_RECORD.pack(*record))
+            for offset in offsets:
+                f.write(_OFFSET.pack(offset))
+            f.write(b"".join(names))
+        os.replace(tmp_path, output)
+    except IOError as e:
+        raise IOError(f"No se pudo escribir en el archivo {output}: {e}")
+    return sum(len(records) for records in sections)
+
+
+class OuiIndex:
+    def __init__(self, filepath: str):
+        with open(filepath, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError(f"El archivo {filepath} no es un índice OUI de NetWatcher.")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, *counts = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"El archivo {filepath} no es un índice OUI de NetWatcher.")
+
+        offset = _HEADER.size
+        self._sections = []
+        for bits, count in zip(PREFIX_BITS, counts[:3]):
+            self._sections.append((bits, offset, count))
+            offset += count * _RECORD.size
+        self._vendor_count = counts[3]
+        self._offsets = offset
+        self._names = offset + (self._vendor_count + 1) * _OFFSET.size
+
+        # Un archivo truncado haría fallar con struct.error cada búsqueda: se
+        # rechaza aquí para que se use la base OUI en memoria.
+        size = len(self._mm)
+        if self._names > size or self._names + _OFFSET.unpack_from(
+            self._mm, self._names - _OFFSET.size
+        )[0] > size:
+            self._mm.close()
+            raise ValueError(f"El índice OUI {filepath} está truncado o dañado.")
+
+    def __len__(self) -> int:
+        return sum(count for _, _, count in self._sections)
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def vendor_id(self, mac: int, known_bits: int = 48) -> Optional[int]:
+        for bits, base, count in self._sections:
+            if bits > known_bits:
+                continue
+            prefix = mac >> (48 - bits)
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                key, vendor = _RECORD.unpack_from(self._mm, base + mid * _RECORD.size)
+                if key < prefix:
+                    lo = mid + 1
+                elif key > prefix:
+                    hi = mid
+                else:
+                    return vendor
+        return None
+
+    def vendor_name(self, vendor_id: int) -> str:
+        start, end = struct.unpack_from("<2I", self._mm, self._offsets + vendor_id * _OFFSET.size)
+        return self._mm[self._names + start:self._names + end].decode("utf-8")
+
+    def lookup(self, mac: int, known_bits: int = 48) -> Optional[str]:
+        vendor_id = self.vendor_id(mac, known_bits)
+        return None if vendor_id is None else self.vendor_name(vendor_id)
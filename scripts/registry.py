@@ -0,0 +1,248 @@
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from scripts.cancel import CancelToken
+
+TERMINAL_EVENTS = ("complete", "error", "cancelled")
+_STATES = {"started": "running", "complete": "done", "error": "error", "cancelled": "cancelled"}
+
+
+class ScanEntry:
+    # Buffer circular con los últimos `maxsize` eventos de un escaneo. Cada evento
+    # recibe un ID creciente (empezando en 1) y ocupa la posición id % maxsize,
+    # así que publicar y leer cuestan O(1) y el buffer nunca crece.
+    def __init__(
+        self,
+        scan_id: str,
+        kind: str,
+        maxsize: int,
+        clock: Callable,
+        on_finish: Optional[Callable] = None,
+        **meta,
+    ):
+        self.scan_id = scan_id
+        self.kind = kind
+        self.meta = meta
+        self.maxsize = max(1, maxsize)
+        self.state = "queued"
+        self.token = CancelToken()
+        self.last_id = 0
+        self.dropped = 0
+        self.subscribers = 0
+        self._clock = clock
+        self.created = clock()
+        self.last_read = self.created
+        self.finished_at: Optional[float] = None
+        self._on_finish = on_finish
+        self._slots: list = [None] * self.maxsize
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.token.cancelled
+
+    def cancel(self) -> bool:
+        return self.token.cancel()
+
+    @property
+    def first_id(self) -> int:
+        return max(1, self.last_id - self.maxsize + 1)
+
+    def qsize(self) -> int:
+        with self._cond:
+            return min(self.last_id, self.maxsize)
+
+    def put(self, msg: dict) -> int:
+        with self._cond:
+            self.last_id += 1
+            event_id = self.last_id
+            self._slots[event_id % self.maxsize] = msg
+            self.state = _STATES.get(msg.get("type"), self.state)
+            finishing = msg.get("type") in TERMINAL_EVENTS and self.finished_at is None
+            if finishing:
+                self.finished_at = self._clock()
+            self._cond.notify_all()
+        if finishing and self._on_finish:
+            self._on_finish(self, msg)
+        return event_id
+
+    def subscribe(self, last_event_id: int = 0) -> "Subscription":
+        # Sin Last-Event-ID se repite todo lo que siga en el buffer, de modo que
+        # quien se une tarde a un escaneo ve también los hosts ya encontrados.
+        with self._cond:
+            self.subscribers += 1
+            self.last_read = self._clock()
+            cursor = min(max(0, last_event_id), self.last_id)
+        return Subscription(self, cursor)
+
+    def info(self) -> dict:
+        now = self._clock()
+        with self._cond:
+            return {
+                "scan_id": self.scan_id,
+                "kind": self.kind,
+                "state": self.state,
+                "age": round(now - self.created, 2),
+                "idle": round(now - self.last_read, 2),
+                "last_event_id": self.last_id,
+                "buffered": min(self.last_id, self.maxsize),
+                "buffer_max": self.maxsize,
+                "dropped": self.dropped,
+                "subscribers": self.subscribers,
+                "cancelled": self.cancelled,
+                **self.meta,
+            }
+
+    def _read(self, cursor: int, timeout: Optional[float]) -> tuple:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.last_id > cursor, timeout):
+                raise queue.Empty
+            self.last_read = self._clock()
+            first = self.first_id
+            if cursor + 1 < first:
+                # El suscriptor se quedó atrás más de lo que cabe en el buffer.
+                lost = first - cursor - 1
+                self.dropped += lost
+                return first - 1, None, {"type": "overflow", "dropped": lost}
+            event_id = cursor + 1
+            return event_id, event_id, self._slots[event_id % self.maxsize]
+
+    def _unsubscribe(self) -> None:
+        with self._cond:
+            self.subscribers = max(0, self.subscribers - 1)
+            self.last_read = self._clock()
+
+
+class Subscription:
+    # Cursor de lectura de un cliente sobre un ScanEntry. get() tiene la misma
+    # interfaz que queue.Queue.get pero devuelve (event_id, mensaje); los avisos
+    # de eventos perdidos llevan event_id None.
+    def __init__(self, entry: ScanEntry, cursor: int):
+        self.entry = entry
+        self.cursor = cursor
+        self._closed = False
+
+    def get(self, timeout: Optional[float] = None) -> tuple:
+        self.cursor, event_id, msg = self.entry._read(self.cursor, timeout)
+        return event_id, msg
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self.entry._unsubscribe()
+
+
+class ScanRegistry:
+    # Escaneos activos con caducidad: un escaneo sin clientes conectados durante
+    # `ttl` segundos se cancela y se libera, y uno terminado se conserva
+    # `finished_ttl` segundos para que el navegador pueda leer el resultado.
+    def __init__(
+        self,
+        ttl: float = 600.0,
+        finished_ttl: float = 120.0,
+        maxsize: int = 10000,
+        reap_interval: float = 30.0,
+        clock: Callable = time.monotonic,
+        on_reap: Optional[Callable] = None,
+        on_finish: Optional[Callable] = None,
+    ):
+        self.ttl = ttl
+        self.finished_ttl = finished_ttl
+        self.maxsize = maxsize
+        self.reap_interval = reap_interval
+        self.reaped = 0
+        self.on_reap = on_reap
+        self.on_finish = on_finish
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._scans: dict = {}
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._scans)
+
+    def __contains__(self, scan_id: str) -> bool:
+        with self._lock:
+            return scan_id in self._scans
+
+    def create(self, scan_id: str, kind: str, **meta) -> ScanEntry:
+        entry = ScanEntry(scan_id, kind, self.maxsize, self._clock, self.on_finish, **meta)
+        with self._lock:
+            self._scans[scan_id] = entry
+        self._start_reaper()
+        return entry
+
+    def get(self, scan_id: str) -> Optional[ScanEntry]:
+        with self._lock:
+            return self._scans.get(scan_id)
+
+    def discard(self, scan_id: str) -> Optional[ScanEntry]:
+        with self._lock:
+            return self._scans.pop(scan_id, None)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            entries = list(self._scans.values())
+        return sorted((e.info() for e in entries), key=lambda info: -info["age"])
+
+    def totals(self) -> dict:
+        # Resumen barato para métricas: no copia ni ordena la información de
+        # cada escaneo como snapshot().
+        with self._lock:
+            entries = list(self._scans.values())
+        states: dict = {}
+        for entry in entries:
+            states[entry.state] = states.get(entry.state, 0) + 1
+        return {
+            "states": states,
+            "subscribers": sum(entry.subscribers for entry in entries),
+            "buffered": sum(min(entry.last_id, entry.maxsize) for entry in entries),
+        }
+
+    def reap(self) -> list:
+        now = self._clock()
+        expired = []
+        with self._lock:
+            entries = dict(self._scans)
+            for scan_id, entry in entries.items():
+                if entry.subscribers:
+                    continue
+                if entry.finished:
+                    if now - entry.finished_at < self.finished_ttl:
+                        continue
+                elif now - entry.last_read < self.ttl:
+                    continue
+                del self._scans[scan_id]
+                expired.append(scan_id)
+            self.reaped += len(expired)
+        # Cancelar detiene el escaneo (y mata su proceso nmap) en vez de dejarlo
+        # publicando eventos que nadie va a leer.
+        for scan_id in expired:
+            entries[scan_id].cancel()
+            if self.on_reap:
+                self.on_reap(scan_id)
+        return expired
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def _start_reaper(self) -> None:
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(
+                target=self._reap_loop, daemon=True, name="netwatcher-scan-reaper",
+            )
+        self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        while not self._stop.wait(self.reap_interval):
+            self.reap()
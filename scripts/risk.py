@@ -0,0 +1,256 @@
+import ipaddress
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Optional
+
+from scripts.utils import HIGH_RISK_PORTS, MEDIUM_RISK_PORTS, SECURITY_HINTS
+
+RISK_LEVELS = ("LOW", "MEDIUM", "HIGH")
+RULES_RELOAD_INTERVAL = 1.0
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _invalid(rule_id, reason: str) -> ValueError:
+    return ValueError(f"Regla de riesgo inválida '{rule_id}': {reason}")
+
+
+def _rank(level: Optional[str]) -> int:
+    return RISK_LEVELS.index(level) if level else -1
+
+
+def _address(ip: Optional[str]):
+    try:
+        return ipaddress.ip_address(ip) if ip else None
+    except ValueError:
+        return None
+
+
+def _networks(value, rule_id) -> tuple:
+    if value is None:
+        return ()
+    try:
+        return tuple(
+            ipaddress.ip_network(net, strict=False)
+            for net in ([value] if isinstance(value, str) else value)
+        )
+    except ValueError as e:
+        raise _invalid(rule_id, str(e))
+
+
+class _Rule:
+    __slots__ = (
+        "id", "level", "ports", "anchor", "vendor", "banner", "subnets",
+        "except_subnets", "suppress", "hint", "builtin",
+    )
+
+    def __init__(self, spec: dict, index: int, builtin: bool = False):
+        self.id = str(spec.get("id") or f"rule-{index}")
+        self.builtin = builtin
+        try:
+            self.ports = tuple(sorted({int(p) for p in spec.get("ports", ())}))
+        except (TypeError, ValueError):
+            raise _invalid(self.id, "'ports' debe ser una lista de enteros")
+        if any(not 1 <= p <= 65535 for p in self.ports):
+            raise _invalid(self.id, "puerto fuera de rango")
+        # Una regla se indexa por un único puerto: aunque exija varios, sólo se
+        # evalúa una vez por host.
+        self.anchor = self.ports[0] if self.ports else None
+
+        self.level = spec.get("level")
+        if self.level is not None:
+            self.level = str(self.level).upper()
+            if self.level not in RISK_LEVELS:
+                raise _invalid(self.id, f"nivel desconocido '{spec.get('level')}'")
+
+        # El fabricante se compara por palabras completas, igual que se indexa:
+        # "vm" no coincide con "VMware, Inc.".
+        self.vendor = tuple(_TOKEN.findall((spec.get("vendor") or "").lower())) or None
+        if spec.get("vendor") and not self.vendor:
+            raise _invalid(self.id, "'vendor' debe contener letras o números")
+        try:
+            self.banner = re.compile(spec["banner"], re.I) if spec.get("banner") else None
+        except re.error as e:
+            raise _invalid(self.id, f"expresión 'banner' inválida: {e}")
+        self.subnets = _networks(spec.get("subnet"), self.id)
+        self.except_subnets = _networks(spec.get("except_subnets"), self.id)
+        self.suppress = bool(spec.get("suppress", False))
+
+        self.hint = None
+        if spec.get("msg"):
+            self.hint = {"severity": spec.get("severity", "medium"), "msg": spec["msg"]}
+        if not (self.suppress or self.level or self.hint):
+            raise _invalid(self.id, "necesita 'level', 'msg' o 'suppress'")
+        if self.suppress and not self.ports:
+            raise _invalid(self.id, "las excepciones necesitan 'ports'")
+
+    def matches(self, ports: set, ip, vendor: set, banners: dict) -> bool:
+        if any(p not in ports for p in self.ports):
+            return False
+        if self.vendor and any(token not in vendor for token in self.vendor):
+            return False
+        if self.subnets and (ip is None or not any(ip in net for net in self.subnets)):
+            return False
+        if self.except_subnets and ip is not None \
+                and any(ip in net for net in self.except_subnets):
+            return False
+        if self.banner:
+            candidates = self.ports or banners.keys()
+            if not any(self.banner.search(banners.get(p) or "") for p in candidates):
+                return False
+        return True
+
+
+class RuleSet:
+    # Índice de despacho: cada regla cuelga de su puerto ancla o, si no exige
+    # puertos, de la primera palabra de su fabricante. Evaluar un host sólo
+    # recorre las reglas de sus puertos abiertos y de su fabricante.
+    def __init__(self, rules: list):
+        self.rules = rules
+        self._by_port: dict = {}
+        self._by_vendor: dict = {}
+        self._always: list = []
+        self._suppress_by_port: dict = {}
+        for rule in rules:
+            if rule.suppress:
+                self._suppress_by_port.setdefault(rule.anchor, []).append(rule)
+            elif rule.anchor is not None:
+                self._by_port.setdefault(rule.anchor, []).append(rule)
+            elif rule.vendor:
+                self._by_vendor.setdefault(rule.vendor[0], []).append(rule)
+            else:
+                self._always.append(rule)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def evaluate(
+        self,
+        ports,
+        ip: Optional[str] = None,
+        vendor: Optional[str] = None,
+        banners: Optional[dict] = None,
+    ) -> dict:
+        ports = set(ports)
+        address = _address(ip)
+        vendor = set(_TOKEN.findall((vendor or "").lower()))
+        banners = banners or {}
+
+        for port in list(ports):
+            for rule in self._suppress_by_port.get(port, ()):
+                if rule.matches(ports, address, vendor, banners):
+                    ports.difference_update(rule.ports)
+
+        candidates = [rule for port in ports for rule in self._by_port.get(port, ())]
+        for token in vendor:
+            candidates.extend(self._by_vendor.get(token, ()))
+        candidates.extend(self._always)
+
+        level = None
+        high, medium, hints = set(), set(), []
+        for rule in candidates:
+            if not rule.matches(ports, address, vendor, banners):
+                continue
+            if rule.level and _rank(rule.level) > _rank(level):
+                level = rule.level
+            if rule.level == "HIGH":
+                high.update(rule.ports)
+            elif rule.level == "MEDIUM":
+                medium.update(rule.ports)
+            if rule.hint:
+                hint = {"port": rule.anchor, **rule.hint}
+                if not rule.builtin:
+                    hint["rule"] = rule.id
+                hints.append(hint)
+
+        if level is None:
+            level = "LOW" if ports else "SAFE"
+        return {
+            "level": level,
+            "high_risk_ports": sorted(high),
+            "medium_risk_ports": sorted(medium - high),
+            "hints": hints,
+        }
+
+
+def builtin_rules() -> list:
+    specs = {}
+    for port in HIGH_RISK_PORTS:
+        specs[port] = {"id": f"builtin-{port}", "ports": [port], "level": "HIGH"}
+    for port in MEDIUM_RISK_PORTS:
+        specs.setdefault(port, {"id": f"builtin-{port}", "ports": [port], "level": "MEDIUM"})
+    for port, hint in SECURITY_HINTS.items():
+        specs.setdefault(port, {"id": f"builtin-{port}", "ports": [port]}).update(hint)
+    return [_Rule(spec, i, builtin=True) for i, spec in enumerate(specs.values())]
+
+
+def compile_rules(specs: list, include_builtin: bool = True) -> RuleSet:
+    rules = builtin_rules() if include_builtin else []
+    rules.extend(_Rule(spec, i) for i, spec in enumerate(specs))
+    return RuleSet(rules)
+
+
+def load_rules_file(filepath: str) -> RuleSet:
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (IOError, ValueError) as e:
+        raise ValueError(f"No se pudo leer el archivo de reglas {filepath}: {e}")
+    if isinstance(data, list):
+        data = {"rules": data}
+    return compile_rules(data.get("rules", []), not data.get("replace_builtin", False))
+
+
+class RiskEngine:
+    # Evalúa con el RuleSet vigente y, como mucho una vez por `reload_interval`,
+    # comprueba si el archivo de reglas cambió. Un archivo con errores no
+    # sustituye a las reglas que ya estaban cargadas.
+    def __init__(self, path: Optional[str] = None, reload_interval: float = RULES_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = 0.0
+        self._ruleset = compile_rules([])
+        if path:
+            self.reload()
+
+    @property
+    def ruleset(self) -> RuleSet:
+        self._maybe_reload()
+        return self._ruleset
+
+    def reload(self) -> bool:
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                self._mtime = os.stat(self.path).st_mtime_ns
+                ruleset = load_rules_file(self.path)
+            except (OSError, ValueError) as e:
+                if isinstance(e, OSError):
+                    self._mtime = None
+                self.last_error = str(e)
+                print(f"Reglas de riesgo no recargadas: {e}", file=sys.stderr)
+                return False
+            self._ruleset, self.last_error = ruleset, None
+            return True
+
+    def _maybe_reload(self) -> None:
+        if not self.path or time.monotonic() - self._checked < self.reload_interval:
+            return
+        try:
+            changed = os.stat(self.path).st_mtime_ns != self._mtime
+        except OSError:
+            changed = self._mtime is not None
+        if changed:
+            self.reload()
+        else:
+            self._checked = time.monotonic()
+
+    def assess(self, ports, ip=None, vendor=None, banners=None) -> dict:
+        return self.ruleset.evaluate(ports, ip=ip, vendor=vendor, banners=banners)
@@ -0,0 +1,168 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ("job_id", "client", "fn", "priority", "on_position", "position")
+
+    def __init__(self, job_id, client, fn, priority, on_position):
+        self.job_id = job_id
+        self.client = client
+        self.fn = fn
+        self.priority = priority
+        self.on_position = on_position
+        self.position = None
+
+
+class _Pool:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.running = 0
+        # cliente -> cola FIFO de sus trabajos; el orden de las claves es el turno
+        # de reparto entre clientes (round-robin).
+        self.clients: OrderedDict = OrderedDict()
+        self.size = 0
+
+
+class ScanScheduler:
+    def __init__(self, pools: dict, max_queue: int = 32, max_per_client: int = 8):
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self._cond = threading.Condition()
+        self._pools = {name: _Pool(name, workers) for name, workers in pools.items()}
+        for pool in self._pools.values():
+            for i in range(pool.workers):
+                threading.Thread(
+                    target=self._worker, args=(pool,), daemon=True,
+                    name=f"netwatcher-{pool.name}-{i}",
+                ).start()
+
+    def submit(
+        self,
+        kind: str,
+        client: str,
+        fn: Callable,
+        job_id: Optional[str] = None,
+        priority: int = 0,
+        on_position: Optional[Callable] = None,
+    ) -> int:
+        pool = self._pools[kind]
+        with self._cond:
+            if pool.size >= self.max_queue:
+                raise QueueFullError(f"La cola de escaneos '{kind}' está llena.")
+            pending = pool.clients.get(client)
+            if pending is not None and len(pending) >= self.max_per_client:
+                raise QueueFullError("Demasiados escaneos en cola para este cliente.")
+
+            job = _Job(job_id, client, fn, priority, on_position)
+            pool.clients.setdefault(client, deque()).append(job)
+            pool.size += 1
+            changed = self._reposition(pool)
+            self._cond.notify_all()
+        self._notify(changed)
+        return job.position
+
+    def cancel(self, job_id: str) -> bool:
+        with self._cond:
+            found = self._find(job_id)
+            if not found:
+                return False
+            pool, job = found
+            pending = pool.clients[job.client]
+            pending.remove(job)
+            if not pending:
+                del pool.clients[job.client]
+            pool.size -= 1
+            changed = self._reposition(pool)
+        self._notify(changed)
+        return True
+
+    def position(self, job_id: str) -> Optional[int]:
+        with self._cond:
+            found = self._find(job_id)
+            return found[1].position if found else None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                name: {
+                    "workers": pool.workers,
+                    "running": pool.running,
+                    "queued": pool.size,
+                    "clients": len(pool.clients),
+                }
+                for name, pool in self._pools.items()
+            }
+
+    def _find(self, job_id: str) -> Optional[tuple]:
+        for pool in self._pools.values():
+            for pending in pool.clients.values():
+                for job in pending:
+                    if job.job_id == job_id:
+                        return pool, job
+        return None
+
+    def _next(self, clients: OrderedDict) -> Optional[_Job]:
+        best = None
+        for pending in clients.values():
+            head = pending[0]
+            if best is None or head.priority < best.priority:
+                best = head
+        return best
+
+    def _take(self, clients: OrderedDict) -> _Job:
+        # El cliente servido pasa al final del turno: a igual prioridad, cada
+        # cliente recibe un hueco antes de que otro consiga el segundo.
+        job = self._next(clients)
+        pending = clients.pop(job.client)
+        pending.popleft()
+        if pending:
+            clients[job.client] = pending
+        return job
+
+    def _reposition(self, pool: _Pool) -> list:
+        # Simula el orden de despacho sobre una copia para saber cuántos trabajos
+        # tiene delante cada uno, descontando los workers libres (0 = arrancando).
+        clients = OrderedDict((c, deque(p)) for c, p in pool.clients.items())
+        free = pool.workers - pool.running
+        changed = []
+        order = 1
+        while clients:
+            job = self._take(clients)
+            position = max(0, order - free)
+            if position != job.position:
+                job.position = position
+                if job.on_position:
+                    changed.append((job.on_position, position))
+            order += 1
+        return changed
+
+    def _notify(self, changed: list) -> None:
+        for on_position, position in changed:
+            on_position(position)
+
+    def _worker(self, pool: _Pool) -> None:
+        while True:
+            with self._cond:
+                while not pool.size:
+                    self._cond.wait()
+                job = self._take(pool.clients)
+                pool.size -= 1
+                pool.running += 1
+                changed = self._reposition(pool)
+            self._notify(changed)
+            try:
+                job.fn()
+            except Exception:
+                pass
+            finally:
+                with self._cond:
+                    pool.running -= 1
+                    changed = self._reposition(pool)
+                self._notify(changed)
@@ -0,0 +1,77 @@
+import cProfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Optional
+
+# Contexto vacío compartido: con los tiempos desactivados cada etapa cuesta
+# una llamada y un `with` sobre este objeto, sin leer el reloj.
+_NO_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("_timer", "_name", "_started")
+
+    def __init__(self, timer: "StageTimer", name: str):
+        self._timer = timer
+        self._name = name
+
+    def __enter__(self):
+        self._started = self._timer.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self._timer.add(self._name, self._timer.clock() - self._started)
+
+
+class StageTimer:
+    # Acumula segundos y número de mediciones por etapa con un reloj monotónico.
+    # Las etapas que corren en varios hilos (DNS inverso, bloques de nmap) suman
+    # el tiempo de todos, así que pueden superar la duración total del escaneo.
+    def __init__(self, clock: Callable = time.monotonic):
+        self.clock = clock
+        self._stages: dict = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, count: int = 1) -> None:
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                self._stages[name] = [seconds, count]
+            else:
+                entry[0] += seconds
+                entry[1] += count
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                name: {"seconds": round(seconds, 4), "count": count}
+                for name, (seconds, count) in self._stages.items()
+            }
+
+
+def stage(timings: Optional[StageTimer], name: str):
+    return timings.stage(name) if timings is not None else _NO_STAGE
+
+
+@contextmanager
+def profiled(filepath: Optional[str]):
+    # Vuelca las estadísticas de cProfile en `filepath` (legibles con pstats o
+    # snakeviz). Sólo se perfila el hilo que llama; el trabajo de los hilos de
+    # DNS y del sniffer aparece en las etapas de StageTimer.
+    if not filepath:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        try:
+            profile.dump_stats(filepath)
+        except IOError as e:
+            raise IOError(f"No se pudo escribir en el archivo {filepath}: {e}")
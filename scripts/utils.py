@@ -1,9 +1,25 @@
+import asyncio
 import csv
+import gzip
 import ipaddress
+import json
+import multiprocessing
+import os
 import socket
+import string
 import subprocess
 import sys
-from typing import Callable, Optional
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Optional
+
+from scripts.cancel import CancelToken, is_cancelled
+from scripts.metrics import DNS_LOOKUP_SECONDS, NMAP_PROCESSES
+from scripts.ports import PortSpec, parse_port_spec
+from scripts.timings import StageTimer, stage
 
 
 OUI_DB = {
@@ -218,6 +234,54 @@ OUI_DB = {
     "1C:7E:E5": "D-Link Corporation",
 }
 
+OUI_INDEX_PATH = os.environ.get("NETWATCHER_OUI_INDEX")
+
+_oui_index = None
+_oui_index_loaded = False
+
+RISK_RULES_PATH = os.environ.get("NETWATCHER_RISK_RULES")
+_risk_engine = None
+
+ARP_MODES = ("arping", "stream", "sharded")
+ARP_TIMEOUT = 2.0
+ARP_RETRIES = 1
+ARP_SHARD_PREFIX = 24
+ARP_SHARD_WORKERS = min(8, os.cpu_count() or 1)
+ARP_MAX_PPS = 5000
+ARP_SEND_BATCH = 256
+ARP_SNIFFER_START_TIMEOUT = 2.0
+
+DNS_WORKERS = 32
+DNS_CACHE_SIZE = 4096
+DNS_CACHE_TTL = 3600
+DNS_NEGATIVE_TTL = 300
+
+_dns_cache: OrderedDict = OrderedDict()
+_dns_cache_lock = threading.Lock()
+_dns_cache_stats = {"hits": 0, "misses": 0}
+
+SCAN_ENGINES = ("nmap", "connect")
+CONNECT_TIMEOUT = 1.0
+CONNECT_CONCURRENCY = 512
+CONNECT_PER_HOST = 128
+NMAP_TIMEOUT = 180
+NMAP_BATCH_TIMEOUT = 1800
+NMAP_CACHE_SIZE = 256
+NMAP_CHUNKS = 4
+NMAP_PROCESS_BUDGET = int(
+    os.environ.get("NETWATCHER_NMAP_PROCESSES", min(8, os.cpu_count() or 1))
+)
+NMAP_CACHE_TTL = 300
+NMAP_STDERR_MAX = 64 * 1024
+
+_nmap_cache: OrderedDict = OrderedDict()
+_nmap_inflight: dict = {}
+_nmap_cache_lock = threading.Lock()
+_nmap_cache_stats = {"hits": 0, "misses": 0, "shared": 0}
+_nmap_process_slots = threading.BoundedSemaphore(max(1, NMAP_PROCESS_BUDGET))
+
+_OUI_BY_INT = {int(oui.replace(":", ""), 16): vendor for oui, vendor in OUI_DB.items()}
+
 PORT_SERVICES = {
     20: "FTP-Data",
     21: "FTP",
@@ -382,9 +446,121 @@ def validate_cidr(cidr: str) -> bool:
         return False
 
 
+def validate_ip(ip: str) -> bool:
+    # Los objetivos de nmap van a su argv: sólo se aceptan direcciones literales
+    # para que nada como "-oN archivo" o "--script=..." se lea como opción.
+    try:
+        ipaddress.ip_address(ip)
+        return True
+    except ValueError:
+        return False
+
+
+def _require_ips(targets) -> None:
+    # Nmap interpreta como opción cualquier objetivo que empiece por "-": sólo
+    # se aceptan direcciones IP literales, sea cual sea el motor.
+    for target in targets:
+        if not validate_ip(target):
+            raise ValueError(f"Dirección IP inválida: '{target}'")
+
+
+def load_oui_index(filepath: Optional[str] = None):
+    global _oui_index, _oui_index_loaded
+    from scripts.oui import OuiIndex
+
+    filepath = filepath or OUI_INDEX_PATH
+    if _oui_index is not None:
+        _oui_index.close()
+    _oui_index = OuiIndex(filepath) if filepath and os.path.exists(filepath) else None
+    _oui_index_loaded = True
+    return _oui_index
+
+
+def _get_oui_index():
+    global _oui_index_loaded
+    if not _oui_index_loaded:
+        try:
+            load_oui_index()
+        except (IOError, ValueError) as e:
+            print(f"No se pudo cargar el índice OUI: {e}", file=sys.stderr)
+            _oui_index_loaded = True
+    return _oui_index
+
+
+def _mac_prefix(mac: str) -> Optional[tuple]:
+    digits = []
+    for ch in mac:
+        if ch in ":-.":
+            continue
+        if ch not in string.hexdigits or len(digits) == 12:
+            break
+        digits.append(ch)
+    if len(digits) < 6:
+        return None
+    return int("".join(digits), 16) << (4 * (12 - len(digits))), 4 * len(digits)
+
+
+def mac_to_int(mac: str) -> Optional[int]:
+    if not isinstance(mac, str):
+        return None
+    mac = mac.strip()
+    for sep in (":", "-"):
+        if sep in mac:
+            parts = mac.split(sep)
+            if len(parts) != 6 or not all(1 <= len(p) <= 2 for p in parts):
+                return None
+            digits = "".join(p.zfill(2) for p in parts)
+            break
+    else:
+        parts = mac.split(".")
+        if len(parts) == 3 and all(len(p) == 4 for p in parts):
+            digits = "".join(parts)
+        elif len(parts) == 1:
+            digits = mac
+        else:
+            return None
+    # int(x, 16) admite "0x", "_" y signo; una MAC sólo lleva dígitos hexadecimales.
+    if len(digits) != 12 or not all(c in string.hexdigits for c in digits):
+        return None
+    return int(digits, 16)
+
+
+def _vendor_for_int(mac: int, index) -> str:
+    if index is not None:
+        vendor = index.lookup(mac)
+        if vendor:
+            return vendor
+    return _OUI_BY_INT.get(mac >> 24, "Desconocido")
+
+
+def vendor_lookup_many(macs) -> list:
+    index = _get_oui_index()
+    resolved: dict = {}
+    vendors = []
+    for mac in macs:
+        value = mac_to_int(mac)
+        if value is None:
+            vendors.append(vendor_lookup(mac))
+            continue
+        vendor = resolved.get(value)
+        if vendor is None:
+            vendor = resolved[value] = _vendor_for_int(value, index)
+        vendors.append(vendor)
+    return vendors
+
+
 def vendor_lookup(mac: str) -> str:
     if not isinstance(mac, str):
         return "Desconocido"
+    index = _get_oui_index()
+    value = mac_to_int(mac)
+    if value is not None:
+        return _vendor_for_int(value, index)
+    if index is not None:
+        prefix = _mac_prefix(mac)
+        vendor = index.lookup(*prefix) if prefix else None
+        if vendor:
+            return vendor
     oui = mac.upper().replace("-", ":")[:8]
     return OUI_DB.get(oui, "Desconocido")
 
@@ -393,39 +569,105 @@ def get_service_name(port: int) -> str:
     return PORT_SERVICES.get(port, "Unknown")
 
 
-def assess_risk(ports: list) -> dict:
-    ports_set = set(ports)
-    high = list(ports_set & HIGH_RISK_PORTS)
-    medium = list(ports_set & MEDIUM_RISK_PORTS)
+def load_risk_rules(filepath: Optional[str] = None):
+    global _risk_engine
+    from scripts.risk import RiskEngine
+    _risk_engine = RiskEngine(filepath)
+    return _risk_engine
 
-    if high:
-        level = "HIGH"
-    elif medium:
-        level = "MEDIUM"
-    elif ports:
-        level = "LOW"
-    else:
-        level = "SAFE"
 
-    hints = []
-    for port in ports_set:
-        if port in SECURITY_HINTS:
-            hints.append({"port": port, **SECURITY_HINTS[port]})
+def _get_risk_engine():
+    if _risk_engine is None:
+        load_risk_rules(RISK_RULES_PATH)
+    return _risk_engine
+
+
+def assess_risk(
+    ports: list,
+    ip: Optional[str] = None,
+    vendor: Optional[str] = None,
+    banners: Optional[dict] = None,
+) -> dict:
+    return _get_risk_engine().assess(ports, ip=ip, vendor=vendor, banners=banners)
 
-    return {
-        "level": level,
-        "high_risk_ports": high,
-        "medium_risk_ports": medium,
-        "hints": hints,
-    }
 
+def reverse_dns(ip: str, use_cache: bool = True) -> str:
+    if use_cache:
+        with _dns_cache_lock:
+            entry = _dns_cache.get(ip)
+            if entry and entry[1] > time.time():
+                _dns_cache.move_to_end(ip)
+                _dns_cache_stats["hits"] += 1
+                return entry[0]
+            _dns_cache_stats["misses"] += 1
 
-def reverse_dns(ip: str) -> str:
+    started = time.monotonic()
     try:
         hostname, _, _ = socket.gethostbyaddr(ip)
-        return hostname
     except (socket.herror, socket.gaierror):
-        return "N/A"
+        hostname = "N/A"
+    DNS_LOOKUP_SECONDS.observe(
+        time.monotonic() - started, result="unresolved" if hostname == "N/A" else "resolved"
+    )
+
+    if use_cache:
+        ttl = DNS_NEGATIVE_TTL if hostname == "N/A" else DNS_CACHE_TTL
+        _dns_cache_put(ip, hostname, time.time() + ttl)
+    return hostname
+
+
+def _dns_cache_put(ip: str, hostname: str, expires: float) -> None:
+    with _dns_cache_lock:
+        _dns_cache[ip] = (hostname, expires)
+        _dns_cache.move_to_end(ip)
+        while len(_dns_cache) > DNS_CACHE_SIZE:
+            _dns_cache.popitem(last=False)
+
+
+def dns_cache_stats() -> dict:
+    with _dns_cache_lock:
+        return {**_dns_cache_stats, "size": len(_dns_cache)}
+
+
+def clear_dns_cache() -> None:
+    with _dns_cache_lock:
+        _dns_cache.clear()
+        _dns_cache_stats["hits"] = 0
+        _dns_cache_stats["misses"] = 0
+
+
+def load_dns_cache(filepath: str) -> int:
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except (IOError, ValueError) as e:
+        print(f"No se pudo leer la caché DNS {filepath}: {e}", file=sys.stderr)
+        return 0
+
+    now = time.time()
+    loaded = 0
+    for ip, (hostname, expires) in sorted(entries.items(), key=lambda kv: kv[1][1]):
+        if expires > now:
+            _dns_cache_put(ip, hostname, expires)
+            loaded += 1
+    return loaded
+
+
+def save_dns_cache(filepath: str) -> None:
+    now = time.time()
+    with _dns_cache_lock:
+        entries = {
+            ip: [hostname, expires]
+            for ip, (hostname, expires) in _dns_cache.items()
+            if expires > now
+        }
+    try:
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+    except IOError as e:
+        raise IOError(f"No se pudo escribir en el archivo {filepath}: {e}")
 
 
 def detect_local_cidr() -> Optional[str]:
@@ -439,35 +681,398 @@ def detect_local_cidr() -> Optional[str]:
         return None
 
 
-def run_arp_scan(cidr: str, callback: Optional[Callable] = None) -> list:
+def _resolve_hostname(
+    host: dict, on_update: Optional[Callable], cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+) -> None:
+    if is_cancelled(cancel):
+        return
+    with stage(timings, "dns"):
+        hostname = reverse_dns(host["ip"])
+    if is_cancelled(cancel):
+        return
+    if hostname == "N/A":
+        return
+    host["hostname"] = hostname
+    if on_update:
+        with stage(timings, "callback"):
+            on_update(dict(host))
+
+
+def _arp_sweep_arping(
+    cidr: str, on_reply: Callable, timeout: float, cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+) -> None:
+    from scapy.all import arping
+
+    # arping bloquea hasta su timeout; la cancelación se aplica al terminar. El
+    # envío y la espera de respuestas no se pueden separar: van en "arping".
+    with stage(timings, "arping"):
+        ans, _ = arping(cidr, timeout=timeout, verbose=0)
+    replies = [(received.psrc, received.hwsrc) for sent, received in ans]
+    with stage(timings, "vendor"):
+        vendors = vendor_lookup_many(mac for _, mac in replies)
+    for (ip, mac), vendor in zip(replies, vendors):
+        if is_cancelled(cancel):
+            return
+        on_reply(ip, mac, vendor)
+
+
+def _arp_sweep_stream(
+    cidr: str, on_reply: Callable, timeout: float, retries: int,
+    cancel: Optional[CancelToken] = None, timings: Optional[StageTimer] = None,
+) -> None:
+    from scapy.all import ARP, AsyncSniffer, Ether, conf, sendp
+
+    targets = [str(ip) for ip in ipaddress.ip_network(cidr, strict=False).hosts()]
+    if not targets:
+        return
+    pending = set(targets)
+    errors = []
+    # La interfaz se elige como lo haría arping (iface_hint): la de la ruta hacia
+    # el rango. Con varias interfaces conf.iface puede ser otra.
+    iface = conf.route.route(targets[0])[0]
+
+    def _handle(pkt):
+        if errors or is_cancelled(cancel) or ARP not in pkt or pkt[ARP].op != 2:
+            return
+        ip = pkt[ARP].psrc
+        if ip not in pending:
+            return
+        pending.discard(ip)
+        try:
+            on_reply(ip, pkt[ARP].hwsrc)
+        except Exception as e:
+            errors.append(e)
+
+    # El sniffer se arranca antes de enviar para que ninguna respuesta se pierda;
+    # cada reintento sólo vuelve a preguntar por las IPs que aún no contestaron.
+    # Los envíos van en bloques de ARP_SEND_BATCH para poder cortar a mitad de
+    # un /16 si se cancela el escaneo.
+    # start() vuelve antes de abrir el socket de captura: se espera a
+    # started_callback para no perder las respuestas al primer bloque.
+    ready = threading.Event()
+    sniffer = AsyncSniffer(
+        iface=iface, filter="arp", store=False, prn=_handle, started_callback=ready.set
+    )
+    sniffer.start()
+    try:
+        # Sin captura ninguna respuesta llegaría: mejor un error que cero hosts.
+        if not ready.wait(ARP_SNIFFER_START_TIMEOUT):
+            reason = getattr(sniffer, "exception", None)
+            raise Exception(
+                f"No se pudo iniciar la captura ARP en {iface}"
+                + (f": {reason}" if reason else f" en {ARP_SNIFFER_START_TIMEOUT} s")
+            )
+        for _ in range(max(0, retries) + 1):
+            batch = [ip for ip in targets if ip in pending]
+            if not batch:
+                break
+            for i in range(0, len(batch), ARP_SEND_BATCH):
+                if is_cancelled(cancel):
+                    return
+                with stage(timings, "send"):
+                    sendp(
+                        Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(pdst=batch[i:i + ARP_SEND_BATCH]),
+                        iface=iface, verbose=0,
+                    )
+            with stage(timings, "wait"):
+                deadline = time.monotonic() + timeout
+                while pending and not errors and time.monotonic() < deadline:
+                    if cancel is not None:
+                        if cancel.wait(0.05):
+                            return
+                    else:
+                        time.sleep(0.05)
+            if errors:
+                raise errors[0]
+    finally:
+        # Si el sniffer no llegó a arrancar, stop() falla y ocultaría el error real.
+        try:
+            sniffer.stop()
+        except Exception as e:
+            print(f"No se pudo detener la captura ARP: {e}", file=sys.stderr)
+
+
+def _arp_sweep_shard(cidr: str, timeout: float, retries: int, inter: float) -> list:
+    from scapy.all import ARP, Ether, srp
+
+    ans, _ = srp(
+        Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(pdst=cidr),
+        timeout=timeout, retry=retries, inter=inter, iface_hint=cidr, verbose=0,
+    )
+    return [(received.psrc, received.hwsrc) for sent, received in ans]
+
+
+def _arp_pool_context():
+    # Un fork del servidor web, con hilos del planificador, del registro, del DNS
+    # y del historial, puede heredar un lock tomado y bloquear al hijo.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _arp_shards(cidr: str) -> list:
+    network = ipaddress.ip_network(cidr, strict=False)
+    if network.prefixlen >= ARP_SHARD_PREFIX:
+        return [str(network)]
+    return [str(shard) for shard in network.subnets(new_prefix=ARP_SHARD_PREFIX)]
+
+
+def _arp_sweep_sharded(
+    cidr: str, on_reply: Callable, timeout: float, retries: int,
+    workers: int, max_pps: int, cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+) -> None:
+    shards = _arp_shards(cidr)
+    workers = max(1, min(workers, len(shards)))
+    # El techo de paquetes por segundo es global: se reparte entre los workers
+    # activos, cada uno espaciando sus envíos con el intervalo resultante.
+    inter = workers / max_pps if max_pps > 0 else 0
+    # Al cancelar se descartan los bloques pendientes; los que ya se están
+    # enviando terminan en su propio timeout sin que nadie los espere.
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=_arp_pool_context())
+    futures = {
+        pool.submit(_arp_sweep_shard, shard, timeout, retries, inter)
+        for shard in shards
+    }
+    stopped = True
+    try:
+        while futures:
+            with stage(timings, "sweep"):
+                done, futures = wait(futures, timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in done:
+                replies = future.result()
+                with stage(timings, "vendor"):
+                    vendors = vendor_lookup_many(mac for _, mac in replies)
+                for (ip, mac), vendor in zip(replies, vendors):
+                    if is_cancelled(cancel):
+                        return
+                    on_reply(ip, mac, vendor)
+            if is_cancelled(cancel):
+                return
+        stopped = False
+    finally:
+        pool.shutdown(wait=not stopped, cancel_futures=stopped)
+
+
+def run_arp_scan(
+    cidr: str,
+    callback: Optional[Callable] = None,
+    on_update: Optional[Callable] = None,
+    dns_workers: int = DNS_WORKERS,
+    mode: str = "arping",
+    timeout: float = ARP_TIMEOUT,
+    retries: int = ARP_RETRIES,
+    workers: int = ARP_SHARD_WORKERS,
+    max_pps: int = ARP_MAX_PPS,
+    cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+) -> list:
+    # Con `cancel` el envío, la espera de respuestas y el DNS inverso se cortan
+    # al cancelar y se devuelven los hosts encontrados hasta ese momento. Con
+    # `timings` se acumula el tiempo de cada etapa: envío, espera, fabricante,
+    # callbacks, DNS inverso y la espera final a que termine el DNS.
     if not validate_cidr(cidr):
         raise ValueError(f"Rango CIDR inválido: '{cidr}'. Ejemplo válido: 192.168.1.0/24")
+    if mode not in ARP_MODES:
+        raise ValueError(f"Modo ARP inválido: '{mode}'. Opciones: {', '.join(ARP_MODES)}")
 
     try:
-        from scapy.all import arping
+        import scapy.all  # noqa: F401
     except ImportError:
         raise ImportError(
             "Scapy no está instalado. Ejecuta: pip install scapy"
         )
 
-    try:
-        ans, _ = arping(cidr, verbose=0)
-        hosts = []
-        for sent, received in ans:
-            ip = received.psrc
-            mac = received.hwsrc
-            hostname = reverse_dns(ip)
-            vendor = vendor_lookup(mac)
-            host = {"ip": ip, "mac": mac, "hostname": hostname, "vendor": vendor}
+    # El DNS inverso se resuelve en un pool acotado: el callback recibe el host
+    # en cuanto llega la respuesta ARP y on_update se dispara al resolver el nombre.
+    resolver = ThreadPoolExecutor(
+        max_workers=max(1, dns_workers), thread_name_prefix="netwatcher-dns"
+    )
+    hosts = []
+    seen = set()
+    lock = threading.Lock()
+    # Tras un fallo o una cancelación el pool no se espera: las consultas que ya
+    # estaban en marcha no deben notificar hosts de un escaneo terminado.
+    ended = False
+    update_lock = threading.Lock()
+
+    def _on_update(host):
+        with update_lock:
+            if not ended:
+                on_update(host)
+
+    def _on_reply(ip, mac, vendor=None):
+        with lock:
+            if ip in seen or is_cancelled(cancel):
+                return
+            seen.add(ip)
+            if vendor is None:
+                with stage(timings, "vendor"):
+                    vendor = vendor_lookup(mac)
+            host = {"ip": ip, "mac": mac, "hostname": "N/A", "vendor": vendor}
             hosts.append(host)
-            if callback:
-                callback(host)
+        if callback:
+            with stage(timings, "callback"):
+                callback(dict(host))
+        resolver.submit(
+            _resolve_hostname, host, _on_update if on_update else None, cancel, timings
+        )
+
+    failed = False
+    try:
+        if mode == "stream":
+            _arp_sweep_stream(cidr, _on_reply, timeout, retries, cancel, timings)
+        elif mode == "sharded":
+            _arp_sweep_sharded(
+                cidr, _on_reply, timeout, retries, workers, max_pps, cancel, timings
+            )
+        else:
+            _arp_sweep_arping(cidr, _on_reply, timeout, cancel, timings)
         return hosts
     except Exception as e:
+        failed = True
         raise Exception(f"Fallo en el escaneo ARP: {e}")
+    finally:
+        stop = failed or is_cancelled(cancel)
+        if stop:
+            with update_lock:
+                ended = True
+        with stage(timings, "dns_wait"):
+            resolver.shutdown(wait=not stop, cancel_futures=stop)
 
 
-def nmap_scan(ip: str, port_range: str = "1-1024") -> list:
+def scan_port_spec(port_range) -> PortSpec:
+    spec = parse_port_spec(port_range)
+    if spec.udp:
+        raise ValueError(
+            f"Los escaneos UDP no están soportados: '{port_range}'. Usa puertos TCP."
+        )
+    return spec
+
+
+async def _connect_probe(ip: str, port: int, timeout: float) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def _connect_scan_host(
+    ip: str, ports: list, timeout: float, per_host: int, global_limit: asyncio.Semaphore,
+    on_port: Optional[Callable] = None, cancel: Optional[CancelToken] = None,
+) -> list:
+    open_ports = []
+    pending = iter(ports)
+
+    # Un número fijo de corrutinas por host consume el iterador compartido, de modo
+    # que la memoria no crece con el tamaño del rango y el semáforo global acota
+    # las conexiones simultáneas entre todos los hosts.
+    async def _worker():
+        for port in pending:
+            if is_cancelled(cancel):
+                return
+            async with global_limit:
+                if await _connect_probe(ip, port, timeout):
+                    open_ports.append(port)
+                    if on_port:
+                        on_port(ip, port)
+
+    await asyncio.gather(*(_worker() for _ in range(max(1, min(per_host, len(ports))))))
+    return sorted(open_ports)
+
+
+async def _connect_scan_many(
+    ips: list, ports: list, timeout: float, concurrency: int, per_host: int,
+    callback: Optional[Callable], on_port: Optional[Callable],
+    cancel: Optional[CancelToken] = None,
+) -> dict:
+    concurrency = max(1, concurrency)
+    per_host = max(1, min(per_host, len(ports)))
+    global_limit = asyncio.Semaphore(concurrency)
+    pending = iter(ips)
+    results = {}
+
+    # Sólo se escanean a la vez los hosts necesarios para llenar `concurrency`
+    # (el doble, para que la cola de un host solape con el siguiente). Así las
+    # corrutinas vivas no dependen del número de hosts: un /16 cabe en memoria.
+    async def _host_worker():
+        for ip in pending:
+            if is_cancelled(cancel):
+                return
+            open_ports = await _connect_scan_host(
+                ip, ports, timeout, per_host, global_limit, on_port, cancel
+            )
+            results[ip] = open_ports
+            if callback and not is_cancelled(cancel):
+                callback(ip, open_ports)
+
+    slots = min(len(ips), 2 * -(-concurrency // per_host))
+    await asyncio.gather(*(_host_worker() for _ in range(slots)))
+    return {ip: results[ip] for ip in ips if ip in results}
+
+
+def connect_scan_many(
+    ips: list,
+    port_range: str = "1-1024",
+    timeout: float = CONNECT_TIMEOUT,
+    concurrency: int = CONNECT_CONCURRENCY,
+    per_host: int = CONNECT_PER_HOST,
+    callback: Optional[Callable] = None,
+    on_port: Optional[Callable] = None,
+    cancel: Optional[CancelToken] = None,
+) -> dict:
+    ports = scan_port_spec(port_range).ports()
+    return asyncio.run(_connect_scan_many(
+        list(ips), ports, timeout, concurrency, per_host, callback, on_port, cancel
+    ))
+
+
+def connect_scan(ip: str, port_range: str = "1-1024", **kwargs) -> list:
+    # Un escaneo cancelado antes de empezar no tiene resultados para la IP.
+    return connect_scan_many([ip], port_range, **kwargs).get(ip, [])
+
+
+def nmap_scan(
+    ip: str,
+    port_range: str = "1-1024",
+    engine: str = "nmap",
+    on_port: Optional[Callable] = None,
+    on_progress: Optional[Callable] = None,
+    cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+    on_service: Optional[Callable] = None,
+) -> list:
+    # Con `timings` se acumula el arranque del proceso ("spawn"), su ejecución
+    # ("nmap") y, dentro de ella, la interpretación del XML ("parse").
+    # `on_service(port, banner)` activa la detección de versiones (-sV).
+    _require_ips([ip])
+    if engine not in SCAN_ENGINES:
+        raise ValueError(
+            f"Motor de escaneo inválido: '{engine}'. Opciones: {', '.join(SCAN_ENGINES)}"
+        )
+    port_range = str(scan_port_spec(port_range))
+    if engine == "connect":
+        with stage(timings, "connect"):
+            return connect_scan(
+                ip, port_range, on_port=(lambda _, port: on_port(port)) if on_port else None,
+                cancel=cancel,
+            )
+    # python-nmap no permite matar el proceso, así que un escaneo cancelable va
+    # siempre por el subprocess propio; lo mismo si se piden tiempos, porque
+    # python-nmap no separa la ejecución de la interpretación.
+    if on_port or on_progress or cancel or timings or on_service:
+        return _nmap_scan_subprocess(
+            ip, port_range, on_port=on_port, on_progress=on_progress, cancel=cancel,
+            timings=timings, on_service=on_service,
+        )
+
     try:
         import nmap
         scanner = nmap.PortScanner()
@@ -475,7 +1080,11 @@ def nmap_scan(ip: str, port_range: str = "1-1024") -> list:
         return _nmap_scan_subprocess(ip, port_range)
 
     try:
-        scanner.scan(ip, port_range, arguments="-T4")
+        NMAP_PROCESSES.inc()
+        try:
+            scanner.scan(ip, port_range, arguments="-T4")
+        finally:
+            NMAP_PROCESSES.dec()
         open_ports = []
         if ip in scanner.all_hosts() and "tcp" in scanner[ip]:
             open_ports = list(scanner[ip]["tcp"].keys())
@@ -485,41 +1094,482 @@ def nmap_scan(ip: str, port_range: str = "1-1024") -> list:
         return _nmap_scan_subprocess(ip, port_range)
 
 
-def _nmap_scan_subprocess(ip: str, port_range: str) -> list:
+class _InFlightScan:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[list] = None
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+
+
+def nmap_scan_cached(
+    ip: str,
+    port_range: str = "1-1024",
+    engine: str = "nmap",
+    force: bool = False,
+    ttl: float = NMAP_CACHE_TTL,
+    on_port: Optional[Callable] = None,
+    on_progress: Optional[Callable] = None,
+    cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+) -> tuple:
+    # Devuelve (puertos, cached). Las peticiones simultáneas con la misma clave
+    # esperan al escaneo en curso en lugar de lanzar otro proceso; `force` ignora
+    # el resultado guardado pero sigue compartiendo un escaneo ya en marcha. Un
+    # resultado cancelado no se guarda y quien lo esperaba lanza su propio escaneo.
+    _require_ips([ip])
+    key = (ip, str(scan_port_spec(port_range)), engine)
+    while True:
+        with _nmap_cache_lock:
+            entry = None if force else _nmap_cache.get(key)
+            if entry and entry[1] > time.time():
+                _nmap_cache.move_to_end(key)
+                _nmap_cache_stats["hits"] += 1
+                return list(entry[0]), True
+            flight = _nmap_inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _nmap_inflight[key] = _InFlightScan()
+                _nmap_cache_stats["misses"] += 1
+            else:
+                _nmap_cache_stats["shared"] += 1
+        if leader:
+            break
+
+        with stage(timings, "shared_wait"):
+            while not flight.done.wait(0.1):
+                if is_cancelled(cancel):
+                    return [], False
+        if flight.error is not None:
+            raise flight.error
+        if not flight.cancelled:
+            return list(flight.result), True
+
     try:
-        command = ["nmap", "-p", port_range, "-T4", "-oG", "-", ip]
-        result = subprocess.run(
-            command, capture_output=True, text=True, check=True, timeout=180
+        flight.result = nmap_scan(
+            ip, key[1], engine=engine, on_port=on_port, on_progress=on_progress, cancel=cancel,
+            timings=timings,
         )
+        if is_cancelled(cancel):
+            flight.cancelled = True
+        else:
+            _nmap_cache_put(key, flight.result, time.time() + ttl)
+        return list(flight.result), False
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _nmap_cache_lock:
+            _nmap_inflight.pop(key, None)
+        flight.done.set()
+
+
+def _nmap_cache_put(key: tuple, ports: list, expires: float) -> None:
+    with _nmap_cache_lock:
+        _nmap_cache[key] = (list(ports), expires)
+        _nmap_cache.move_to_end(key)
+        while len(_nmap_cache) > NMAP_CACHE_SIZE:
+            _nmap_cache.popitem(last=False)
+
+
+def nmap_cache_stats() -> dict:
+    with _nmap_cache_lock:
+        return {
+            **_nmap_cache_stats, "size": len(_nmap_cache), "in_flight": len(_nmap_inflight)
+        }
 
-        open_ports = []
-        for line in result.stdout.splitlines():
-            if "Ports:" in line and "Status: Open" not in line:
-                parts = line.split("Ports: ")[1]
-                ports_info = parts.split("\t")[0].strip()
-                for port_info in ports_info.split(","):
-                    port_str = port_info.strip().split("/")[0]
-                    if port_str.isdigit():
-                        open_ports.append(int(port_str))
-        return open_ports
 
+def clear_nmap_cache() -> None:
+    with _nmap_cache_lock:
+        _nmap_cache.clear()
+        for name in _nmap_cache_stats:
+            _nmap_cache_stats[name] = 0
+
+
+def load_nmap_cache(filepath: str) -> int:
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            entries = json.load(f)
     except FileNotFoundError:
-        raise Exception("Nmap no está instalado o no se encuentra en el PATH.")
-    except subprocess.CalledProcessError as e:
-        raise Exception(f"Nmap devolvió un error: {e.stderr}")
-    except subprocess.TimeoutExpired:
-        raise Exception("El escaneo Nmap excedió el tiempo límite.")
+        return 0
+    except (IOError, ValueError) as e:
+        print(f"No se pudo leer la caché de Nmap {filepath}: {e}", file=sys.stderr)
+        return 0
 
+    now = time.time()
+    loaded = 0
+    for ip, port_range, engine, ports, expires in sorted(entries, key=lambda e: e[4]):
+        if expires > now:
+            _nmap_cache_put((ip, port_range, engine), ports, expires)
+            loaded += 1
+    return loaded
 
-def export_csv(data: list, filepath: str) -> None:
-    if not data:
-        raise ValueError("La lista de datos para exportar no puede estar vacía.")
 
-    headers = data[0].keys()
+def save_nmap_cache(filepath: str) -> None:
+    now = time.time()
+    with _nmap_cache_lock:
+        entries = [
+            [*key, ports, expires]
+            for key, (ports, expires) in _nmap_cache.items()
+            if expires > now
+        ]
     try:
-        with open(filepath, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=headers)
-            writer.writeheader()
-            writer.writerows(data)
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
     except IOError as e:
         raise IOError(f"No se pudo escribir en el archivo {filepath}: {e}")
+
+
+def _drain_stderr(stream, tail: deque) -> None:
+    # nmap escribe avisos por stderr mientras escanea; si nadie lee el pipe se
+    # bloquea al llenarlo y stdout no avanza. Sólo se conservan los últimos
+    # NMAP_STDERR_MAX caracteres para el mensaje de error.
+    size = 0
+    for line in stream:
+        tail.append(line)
+        size += len(line)
+        while size > NMAP_STDERR_MAX and len(tail) > 1:
+            size -= len(tail.popleft())
+
+
+def _service_banner(service) -> str:
+    # Producto, versión y detalles que informa -sV, p. ej. "OpenSSH 7.2p2 Ubuntu".
+    if service is None:
+        return ""
+    return " ".join(
+        service.get(field) for field in ("product", "version", "extrainfo") if service.get(field)
+    )
+
+
+def _nmap_stream(
+    targets: list,
+    port_range: str,
+    timeout: float,
+    on_port: Optional[Callable] = None,
+    on_host: Optional[Callable] = None,
+    on_progress: Optional[Callable] = None,
+    cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+    on_service: Optional[Callable] = None,
+) -> dict:
+    _require_ips(targets)
+    command = [
+        "nmap", "-p", port_range, "-T4", *(["-sV"] if on_service else []),
+        "--stats-every", "5s", "-oX", "-", *targets
+    ]
+    try:
+        with stage(timings, "spawn"):
+            proc = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+    except FileNotFoundError:
+        raise Exception("Nmap no está instalado o no se encuentra en el PATH.")
+    NMAP_PROCESSES.inc()
+    started = timings.clock() if timings is not None else 0.0
+    stderr_tail: deque = deque()
+    stderr_reader = threading.Thread(
+        target=_drain_stderr, args=(proc.stderr, stderr_tail), daemon=True,
+        name="nmap-stderr",
+    )
+    stderr_reader.start()
+
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, _kill)
+    timer.start()
+    # Cancelar mata el proceso: el bucle de lectura termina al cerrarse el pipe
+    # y se devuelven los puertos recibidos hasta ese momento.
+    forget = cancel.on_cancel(proc.kill) if cancel is not None else None
+
+    # La salida XML se interpreta a medida que llega por el pipe. Cada <host> y
+    # <taskprogress> se descarta del árbol al procesarse, así la memoria no
+    # depende del tamaño de la salida.
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    ip = None
+    open_ports = []
+    results = {}
+    try:
+        for line in proc.stdout:
+            with stage(timings, "parse"):
+                parser.feed(line)
+            for event, elem in parser.read_events():
+                if event == "start":
+                    if root is None:
+                        root = elem
+                    elif elem.tag == "host":
+                        ip, open_ports = None, []
+                    continue
+
+                if elem.tag == "address" and elem.get("addrtype") in ("ipv4", "ipv6"):
+                    ip = elem.get("addr")
+                elif elem.tag == "port":
+                    state = elem.find("state")
+                    if elem.get("protocol") == "tcp" and state is not None \
+                            and state.get("state") == "open":
+                        port = int(elem.get("portid"))
+                        open_ports.append(port)
+                        if on_port:
+                            on_port(ip, port)
+                        banner = _service_banner(elem.find("service")) if on_service else ""
+                        if banner:
+                            on_service(ip, port, banner)
+                elif elem.tag == "host":
+                    if ip is not None and ip not in results:
+                        results[ip] = open_ports
+                        if on_host:
+                            on_host(ip, open_ports)
+                    root.remove(elem)
+                elif elem.tag == "taskprogress":
+                    if on_progress:
+                        on_progress({
+                            "task": elem.get("task"),
+                            "percent": float(elem.get("percent", 0)),
+                            "remaining": int(elem.get("remaining", 0)),
+                        })
+                    root.remove(elem)
+        returncode = proc.wait()
+    except ET.ParseError as e:
+        if not is_cancelled(cancel):
+            raise Exception(f"No se pudo interpretar la salida XML de Nmap: {e}")
+    finally:
+        timer.cancel()
+        if forget:
+            forget()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        stderr_reader.join()
+        NMAP_PROCESSES.dec()
+        if timings is not None:
+            timings.add("nmap", timings.clock() - started)
+
+    if is_cancelled(cancel):
+        if ip is not None and ip not in results:
+            results[ip] = open_ports
+        return results
+    if timed_out.is_set():
+        raise Exception("El escaneo Nmap excedió el tiempo límite.")
+    if returncode != 0:
+        raise Exception(f"Nmap devolvió un error: {''.join(stderr_tail)}")
+
+    for target in targets:
+        if target not in results:
+            results[target] = []
+            if on_host:
+                on_host(target, [])
+    return results
+
+
+def _nmap_scan_subprocess(
+    ip: str,
+    port_range: str,
+    on_port: Optional[Callable] = None,
+    on_progress: Optional[Callable] = None,
+    cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+    on_service: Optional[Callable] = None,
+) -> list:
+    results = _nmap_stream(
+        [ip], port_range, NMAP_TIMEOUT,
+        on_port=(lambda _, port: on_port(port)) if on_port else None,
+        on_progress=on_progress, cancel=cancel, timings=timings,
+        on_service=(lambda _, port, banner: on_service(port, banner)) if on_service else None,
+    )
+    return results.get(ip, [])
+
+
+def nmap_scan_chunked(
+    ip: str,
+    port_range: str = "1-65535",
+    chunks: int = NMAP_CHUNKS,
+    workers: Optional[int] = None,
+    timeout: float = NMAP_TIMEOUT,
+    on_port: Optional[Callable] = None,
+    on_chunk: Optional[Callable] = None,
+    on_progress: Optional[Callable] = None,
+    cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+    on_service: Optional[Callable] = None,
+) -> dict:
+    # Reparte el rango en bloques equilibrados, cada uno escaneado por su propio
+    # proceso nmap. Todos los escaneos comparten NMAP_PROCESS_BUDGET procesos como
+    # máximo. Si un bloque falla o agota el tiempo se conservan los puertos que
+    # llegó a reportar y los de los demás bloques.
+    parts = scan_port_spec(port_range).split(chunks)
+    workers = max(1, min(workers or len(parts), len(parts)))
+    found, failed = set(), []
+    lock = threading.Lock()
+
+    def _report(index, status, **extra):
+        if on_chunk:
+            on_chunk({
+                "chunk": index, "chunks": len(parts), "ports": str(parts[index]),
+                "status": status, **extra,
+            })
+
+    def _scan_chunk(index):
+        chunk_ports = []
+
+        def _on_port(_, port):
+            with lock:
+                found.add(port)
+            chunk_ports.append(port)
+            if on_port:
+                on_port(port)
+
+        def _on_progress(progress):
+            if on_progress:
+                on_progress({"chunk": index, "chunks": len(parts), **progress})
+
+        with _nmap_process_slots:
+            if is_cancelled(cancel):
+                return
+            _report(index, "running")
+            try:
+                _nmap_stream(
+                    [ip], str(parts[index]), timeout,
+                    on_port=_on_port, on_progress=_on_progress, cancel=cancel,
+                    timings=timings,
+                    on_service=(
+                        (lambda _, port, banner: on_service(port, banner)) if on_service else None
+                    ),
+                )
+            except Exception as e:
+                with lock:
+                    failed.append({"chunk": index, "ports": str(parts[index]), "error": str(e)})
+                _report(index, "failed", open_ports=sorted(chunk_ports), error=str(e))
+                return
+        _report(index, "done", open_ports=sorted(chunk_ports))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nmap-chunk") as pool:
+        list(pool.map(_scan_chunk, range(len(parts))))
+
+    if len(failed) == len(parts) and not found:
+        raise Exception(failed[0]["error"])
+    return {
+        "open_ports": sorted(found),
+        "partial": bool(failed) or is_cancelled(cancel),
+        "failed_chunks": sorted(failed, key=lambda f: f["chunk"]),
+    }
+
+
+def nmap_scan_many(
+    ips: list,
+    port_range: str = "1-1024",
+    callback: Optional[Callable] = None,
+    engine: str = "nmap",
+    timeout: float = NMAP_BATCH_TIMEOUT,
+    on_port: Optional[Callable] = None,
+    on_progress: Optional[Callable] = None,
+    cancel: Optional[CancelToken] = None,
+    timings: Optional[StageTimer] = None,
+    on_service: Optional[Callable] = None,
+) -> dict:
+    ips = list(dict.fromkeys(ips))
+    if not ips:
+        return {}
+    _require_ips(ips)
+    if engine not in SCAN_ENGINES:
+        raise ValueError(
+            f"Motor de escaneo inválido: '{engine}'. Opciones: {', '.join(SCAN_ENGINES)}"
+        )
+    port_range = str(scan_port_spec(port_range))
+    if engine == "connect":
+        with stage(timings, "connect"):
+            return connect_scan_many(
+                ips, port_range, callback=callback, on_port=on_port, cancel=cancel
+            )
+
+    # Un único proceso nmap para toda la lista: nmap paraleliza internamente y
+    # cada host se notifica en cuanto su bloque <host> está completo.
+    return _nmap_stream(
+        ips, port_range, timeout, on_port=on_port, on_host=callback,
+        on_progress=on_progress, cancel=cancel, timings=timings, on_service=on_service,
+    )
+
+
+class ResultWriter:
+    # Escribe filas según llegan en CSV o JSON Lines, comprimiendo con gzip si la
+    # ruta termina en ".gz". El archivo se abre con la primera fila, de modo que
+    # un escaneo sin resultados no deja un archivo vacío.
+    def __init__(self, filepath: str, fieldnames: Optional[list] = None, append: bool = False):
+        name = filepath.lower()
+        self.compressed = name.endswith(".gz")
+        self.jsonl = name.endswith((".jsonl", ".jsonl.gz", ".ndjson", ".ndjson.gz"))
+        self.filepath = filepath
+        self.fieldnames = list(fieldnames) if fieldnames else None
+        self.explicit_fields = self.fieldnames is not None
+        self.append = append
+        self.rows = 0
+        self._file = None
+        self._writer = None
+
+    def _open(self) -> None:
+        mode = "at" if self.append else "wt"
+        has_content = self.append and os.path.exists(self.filepath) \
+            and os.path.getsize(self.filepath) > 0
+        try:
+            if self.compressed:
+                self._file = gzip.open(self.filepath, mode, encoding="utf-8", newline="")
+            else:
+                self._file = open(self.filepath, mode[0], encoding="utf-8", newline="")
+        except IOError as e:
+            raise IOError(f"No se pudo escribir en el archivo {self.filepath}: {e}")
+        if not self.jsonl:
+            self._writer = csv.DictWriter(
+                self._file, fieldnames=self.fieldnames,
+                extrasaction="ignore" if self.explicit_fields else "raise",
+            )
+            if not has_content:
+                self._writer.writeheader()
+
+    def write(self, row: dict) -> None:
+        if self._file is None:
+            if self.fieldnames is None:
+                self.fieldnames = list(row.keys())
+            self._open()
+        try:
+            if self.jsonl:
+                if self.explicit_fields:
+                    row = {key: row.get(key) for key in self.fieldnames}
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            else:
+                self._writer.writerow(row)
+        except IOError as e:
+            raise IOError(f"No se pudo escribir en el archivo {self.filepath}: {e}")
+        self.rows += 1
+
+    def close(self) -> None:
+        if self._file is None and self.explicit_fields and not self.jsonl:
+            self._open()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_csv(
+    data: Iterable[dict],
+    filepath: str,
+    fieldnames: Optional[list] = None,
+    append: bool = False,
+) -> int:
+    writer = ResultWriter(filepath, fieldnames=fieldnames, append=append)
+    try:
+        for row in data:
+            writer.write(row)
+    finally:
+        writer.close()
+    if writer.rows == 0 and not fieldnames:
+        raise ValueError("La lista de datos para exportar no puede estar vacía.")
+    return writer.rows
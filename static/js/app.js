@@ -128,6 +128,8 @@ const els = {
   // Export
   exportCsvBtn:   $('export-csv-btn'),
   exportJsonBtn:  $('export-json-btn'),
+  exportNdjsonBtn: $('export-ndjson-btn'),
+  scanAllBtn:     $('scan-all-btn'),
 
   // Modal
   hostModal:      $('host-modal'),
@@ -221,6 +223,37 @@ function logLine(msg, level='INFO') {
   }
 }
 
+// Desglose por etapas del evento complete, de la más lenta a la más rápida.
+// Las etapas paralelas (DNS, bloques nmap) suman el tiempo de todos los hilos.
+function logTimings(label, timings) {
+  if (!timings) return;
+  const parts = Object.entries(timings)
+    .sort((a, b) => b[1].seconds - a[1].seconds)
+    .map(([name, t]) => `${name} ${t.seconds.toFixed(2)}s`);
+  if (parts.length) logLine(`${label}: ${parts.join(' · ')}`, 'INFO');
+}
+
+// ─── SSE reconnect ──────────────────────────────────────────────────────────
+// EventSource reconecta solo y reenvía Last-Event-ID, así que el servidor
+// reanuda el stream en el evento siguiente. Tras varios fallos seguidos se abandona.
+const SSE_MAX_RETRIES = 5;
+function watchReconnect(es, label, onGiveUp) {
+  let failures = 0;
+  es.addEventListener('open', () => {
+    if (failures) logLine(`${label}: reconectado, reanudando eventos`, 'OK');
+    failures = 0;
+  });
+  es.onerror = () => {
+    failures++;
+    if (es.readyState === EventSource.CLOSED || failures > SSE_MAX_RETRIES) {
+      es.close();
+      onGiveUp();
+      return;
+    }
+    logLine(`${label}: conexión perdida, reintentando (${failures}/${SSE_MAX_RETRIES})...`, 'WARN');
+  };
+}
+
 // ─── Escape HTML ────────────────────────────────────────────────────────────
 function esc(s) {
   return String(s)
@@ -409,7 +442,7 @@ function renderPortData(host) {
   const hints = (risk.hints || []).slice(0, 5);
   els.riskHints.innerHTML = hints.map(h =>
     `<div class="risk-hint hint-${h.severity}">
-       <span class="hint-port">${h.port}</span> — ${esc(h.msg)}
+       <span class="hint-port">${h.port ?? '—'}</span> — ${esc(h.msg)}
      </div>`
   ).join('');
   if (hints.length === 0) {
@@ -476,6 +509,33 @@ function addHostRow(host) {
   updateStats();
 }
 
+// Aplica un lote de hosts en una sola pasada: un fragmento, una inserción en
+// el DOM y un único recálculo de estadísticas.
+function addHostRows(hosts) {
+  if (hosts.length === 0) return;
+  const frag = document.createDocumentFragment();
+  hosts.forEach(host => {
+    host.open_ports = [];
+    host.portDetails = [];
+    host.risk = null;
+    state.hosts.push(host);
+    frag.appendChild(renderHostRow(host, state.hosts.length - 1));
+  });
+  const empty = $('empty-state-row');
+  if (empty) empty.remove();
+  els.hostsTbody.appendChild(frag);
+  updateStats();
+}
+
+function updateHostRow(update, idx = state.hosts.findIndex(h => h.ip === update.ip)) {
+  if (idx < 0) return;
+  const host = state.hosts[idx];
+  host.hostname = update.hostname;
+  const row = document.querySelector(`#hosts-tbody tr[data-idx="${idx}"]`);
+  if (row) row.cells[3].textContent = host.hostname || 'N/A';
+  if (state.selectedIdx === idx) showDetailPanel(host);
+}
+
 // ─── ARP Scan ───────────────────────────────────────────────────────────────
 async function startArpScan() {
   const cidr = els.cidrInput.value.trim();
@@ -491,6 +551,8 @@ async function startArpScan() {
   els.stopBtn.disabled      = false;
   els.exportCsvBtn.disabled  = true;
   els.exportJsonBtn.disabled = true;
+  els.exportNdjsonBtn.disabled = true;
+  els.scanAllBtn.disabled    = true;
   els.progressCard.style.display = '';
   document.body.classList.add('scanning-active');
   reRenderTable();
@@ -510,12 +572,16 @@ async function startArpScan() {
     if (!r.ok) { throw new Error(d.error || 'Error en el servidor'); }
 
     state.scanId = d.scan_id;
-    const es = new EventSource(`/api/scan/stream/${d.scan_id}`);
+    const es = new EventSource(`/api/scan/stream/${d.scan_id}?batch=1`);
 
     es.onmessage = e => {
       const msg = JSON.parse(e.data);
 
-      if (msg.type === 'started') {
+      if (msg.type === 'queued') {
+        els.progressLabel.textContent = `En cola... posición ${msg.position}`;
+        logLine(`Escaneo en cola (posición ${msg.position})`, 'WARN');
+
+      } else if (msg.type === 'started') {
         logLine(`Escaneo iniciado en ${msg.cidr}`, 'OK');
 
       } else if (msg.type === 'host_found') {
@@ -526,9 +592,28 @@ async function startArpScan() {
         addHostRow(host);
         logLine(`Host encontrado: ${host.ip} (${host.vendor||'Desconocido'})`, 'OK');
 
+      } else if (msg.type === 'host_updated') {
+        updateHostRow(msg.host);
+
+      } else if (msg.type === 'hosts_batch') {
+        addHostRows(msg.found);
+        if (msg.updated.length) {
+          const byIp = new Map(state.hosts.map((h, i) => [h.ip, i]));
+          msg.updated.forEach(u => updateHostRow(u, byIp.get(u.ip) ?? -1));
+        }
+        if (msg.found.length === 1) {
+          logLine(`Host encontrado: ${msg.found[0].ip} (${msg.found[0].vendor||'Desconocido'})`, 'OK');
+        } else if (msg.found.length > 1) {
+          logLine(`${msg.found.length} hosts encontrados (${msg.found[0].ip} … ${msg.found[msg.found.length - 1].ip})`, 'OK');
+        }
+
+      } else if (msg.type === 'overflow') {
+        logLine(`El servidor descartó ${msg.dropped} evento(s): la tabla puede estar incompleta`, 'WARN');
+
       } else if (msg.type === 'complete') {
         es.close();
         finishArpScan(msg.elapsed, msg.total);
+        logTimings('Tiempos del escaneo ARP', msg.timings);
 
       } else if (msg.type === 'cancelled') {
         es.close();
@@ -542,13 +627,12 @@ async function startArpScan() {
       }
     };
 
-    es.onerror = () => {
-      es.close();
+    watchReconnect(es, 'Escaneo ARP', () => {
       if (state.scanning) {
         toast('Conexión perdida', 'El stream SSE se cerró inesperadamente.', 'error');
         finishArpScan(null, state.hosts.length);
       }
-    };
+    });
 
   } catch (e) {
     toast('Error al iniciar escaneo', e.message, 'error');
@@ -571,6 +655,8 @@ function finishArpScan(elapsed, total, cancelled=false) {
   const exportEnabled = state.hosts.length > 0;
   els.exportCsvBtn.disabled  = !exportEnabled;
   els.exportJsonBtn.disabled = !exportEnabled;
+  els.exportNdjsonBtn.disabled = !exportEnabled;
+  els.scanAllBtn.disabled    = !exportEnabled;
 
   if (cancelled) {
     logLine('Escaneo cancelado por el usuario.', 'WARN');
@@ -607,7 +693,7 @@ async function stopScan() {
 }
 
 // ─── Nmap Scan ──────────────────────────────────────────────────────────────
-async function startNmapScan(ip, ports, targetIdx) {
+async function startNmapScan(ip, ports, targetIdx, force = false) {
   logLine(`Iniciando escaneo de puertos en ${ip} (${ports})...`, 'INFO');
   els.nmapStatus.style.display = '';
   els.nmapStatusTxt.textContent = `Escaneando ${ip}...`;
@@ -617,17 +703,46 @@ async function startNmapScan(ip, ports, targetIdx) {
     const r = await fetch('/api/nmap', {
       method:'POST',
       headers:{'Content-Type':'application/json'},
-      body: JSON.stringify({ip, ports}),
+      body: JSON.stringify({ip, ports, force, vendor: state.hosts[targetIdx]?.vendor}),
     });
     const d = await r.json();
     if (!r.ok) throw new Error(d.error || 'Error servidor');
 
     const es = new EventSource(`/api/nmap/stream/${d.scan_id}`);
+    let found = 0;
     es.onmessage = e => {
       const msg = JSON.parse(e.data);
-      if (msg.type === 'complete') {
+      if (msg.type === 'queued') {
+        els.nmapStatusTxt.textContent = `En cola... posición ${msg.position}`;
+      } else if (msg.type === 'port_found') {
+        found++;
+        els.nmapStatusTxt.textContent = `Escaneando ${ip}... ${found} puerto(s) abierto(s)`;
+        logLine(`Puerto abierto en ${msg.ip}: ${msg.port} (${msg.service})`, 'OK');
+      } else if (msg.type === 'progress') {
+        const chunk = msg.chunks ? ` bloque ${msg.chunk + 1}/${msg.chunks}` : '';
+        els.nmapStatusTxt.textContent = `Escaneando ${ip}${chunk}... ${Math.round(msg.percent)}% (${found} abierto(s))`;
+      } else if (msg.type === 'chunk') {
+        if (msg.status === 'failed') {
+          logLine(`Bloque ${msg.chunk + 1}/${msg.chunks} (${msg.ports}) falló: ${msg.error}`, 'WARN');
+        } else if (msg.status === 'done') {
+          logLine(`Bloque ${msg.chunk + 1}/${msg.chunks} (${msg.ports}) completado`, 'INFO');
+        }
+      } else if (msg.type === 'complete') {
         es.close();
+        if (msg.partial) toast('Resultado parcial', `${msg.failed_chunks.length} bloque(s) de puertos fallaron en ${msg.ip}.`, 'warn', 6000);
+        if (msg.cached) logLine(`Resultado de ${msg.ip} servido desde caché (Mayús+clic para forzar)`, 'INFO');
         onNmapComplete(msg, targetIdx);
+        logTimings(`Tiempos del escaneo de ${msg.ip}`, msg.timings);
+      } else if (msg.type === 'cancelled') {
+        es.close();
+        if (msg.ports) {
+          logLine(`Escaneo de ${ip} cancelado: ${msg.ports.length} puerto(s) encontrados antes de detenerlo`, 'WARN');
+          onNmapComplete(msg, targetIdx);
+        } else {
+          logLine(`Escaneo de ${ip} cancelado antes de empezar`, 'WARN');
+          els.nmapStatus.style.display = 'none';
+          els.detailNmapBtn.disabled = false;
+        }
       } else if (msg.type === 'error') {
         es.close();
         els.nmapStatus.style.display = 'none';
@@ -636,12 +751,11 @@ async function startNmapScan(ip, ports, targetIdx) {
         logLine(`Nmap error: ${msg.message}`, 'ERROR');
       }
     };
-    es.onerror = () => {
-      es.close();
+    watchReconnect(es, `Nmap ${ip}`, () => {
       els.nmapStatus.style.display = 'none';
       els.detailNmapBtn.disabled = false;
       toast('Error SSE', 'Stream de Nmap cerrado inesperadamente.', 'error');
-    };
+    });
 
   } catch(e) {
     els.nmapStatus.style.display = 'none';
@@ -653,7 +767,10 @@ async function startNmapScan(ip, ports, targetIdx) {
 function onNmapComplete(msg, targetIdx) {
   els.nmapStatus.style.display = 'none';
   els.detailNmapBtn.disabled = false;
+  applyPortResult(msg, targetIdx);
+}
 
+function applyPortResult(msg, targetIdx) {
   const host = state.hosts[targetIdx];
   if (!host) return;
 
@@ -680,13 +797,63 @@ function onNmapComplete(msg, targetIdx) {
   }
 }
 
-function startNmapForSelected() {
+async function startNmapBatch() {
+  const ips = state.hosts.map(h => h.ip);
+  if (ips.length === 0) return;
+  const ports = els.detailPorts.value.trim() || '1-1024';
+  logLine(`Iniciando escaneo de puertos en ${ips.length} host(s) (${ports})...`, 'INFO');
+  els.scanAllBtn.disabled = true;
+
+  try {
+    const r = await fetch('/api/nmap/batch', {
+      method:'POST',
+      headers:{'Content-Type':'application/json'},
+      body: JSON.stringify({ips, ports, vendors: Object.fromEntries(state.hosts.map(h => [h.ip, h.vendor]))}),
+    });
+    const d = await r.json();
+    if (!r.ok) throw new Error(d.error || 'Error servidor');
+
+    const es = new EventSource(`/api/nmap/stream/${d.scan_id}`);
+    es.onmessage = e => {
+      const msg = JSON.parse(e.data);
+      if (msg.type === 'queued') {
+        logLine(`Escaneo de puertos en cola (posición ${msg.position})`, 'WARN');
+      } else if (msg.type === 'host_done') {
+        applyPortResult(msg, state.hosts.findIndex(h => h.ip === msg.ip));
+      } else if (msg.type === 'complete') {
+        es.close();
+        els.scanAllBtn.disabled = false;
+        logLine(`Escaneo de ${msg.total} host(s) completado en ${msg.elapsed}s.`, 'OK');
+        logTimings('Tiempos del escaneo de puertos', msg.timings);
+      } else if (msg.type === 'cancelled') {
+        es.close();
+        els.scanAllBtn.disabled = false;
+        logLine(`Escaneo de puertos cancelado tras ${msg.total} host(s).`, 'WARN');
+      } else if (msg.type === 'error') {
+        es.close();
+        els.scanAllBtn.disabled = false;
+        toast('Error Nmap', msg.message, 'error');
+        logLine(`Nmap error: ${msg.message}`, 'ERROR');
+      }
+    };
+    watchReconnect(es, 'Nmap por lotes', () => {
+      els.scanAllBtn.disabled = false;
+      toast('Error SSE', 'Stream de Nmap cerrado inesperadamente.', 'error');
+    });
+
+  } catch(e) {
+    els.scanAllBtn.disabled = false;
+    toast('Error al iniciar Nmap', e.message, 'error');
+  }
+}
+
+function startNmapForSelected(force = false) {
   const idx = state.selectedIdx;
   if (idx == null) return;
   const host = state.hosts[idx];
   if (!host) return;
   const ports = els.detailPorts.value.trim() || '1-1024';
-  startNmapScan(host.ip, ports, idx);
+  startNmapScan(host.ip, ports, idx, force);
 }
 
 // ─── Export ─────────────────────────────────────────────────────────────────
@@ -696,7 +863,8 @@ async function exportAs(fmt) {
     const r = await fetch(`/api/export/${fmt}`, {
       method:'POST',
       headers:{'Content-Type':'application/json'},
-      body: JSON.stringify({hosts: state.hosts}),
+      // gzip sólo afecta a la transferencia: el navegador descomprime la respuesta.
+      body: JSON.stringify({hosts: state.hosts, gzip: true}),
     });
     if (!r.ok) throw new Error('Error de servidor');
     const blob = await r.blob();
@@ -814,7 +982,8 @@ function setupListeners() {
   });
 
   // Detail panel nmap
-  els.detailNmapBtn.addEventListener('click', startNmapForSelected);
+  els.detailNmapBtn.addEventListener('click', e => startNmapForSelected(e.shiftKey));
+  els.scanAllBtn.addEventListener('click', startNmapBatch);
 
   // Filters
   els.filterInput.addEventListener('input', reRenderTable);
@@ -823,6 +992,7 @@ function setupListeners() {
   // Export
   els.exportCsvBtn.addEventListener('click', () => exportAs('csv'));
   els.exportJsonBtn.addEventListener('click', () => exportAs('json'));
+  els.exportNdjsonBtn.addEventListener('click', () => exportAs('ndjson'));
 
   // Log clear
   $('clear-log-btn').addEventListener('click', () => {
@@ -0,0 +1,234 @@
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as netwatcher  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    netwatcher.app.config["TESTING"] = True
+    with netwatcher.app.test_client() as client:
+        yield client
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/nmap", {"ip": "-oN"}),
+    ("/api/nmap", {"ip": "router.lan"}),
+    ("/api/nmap/batch", {"ips": ["10.0.0.1", "-oN", "/root/package/app.py"]}),
+    ("/api/nmap/batch", {"ips": ["--script=vuln"]}),
+])
+def test_nmap_endpoints_reject_non_ip_targets(client, path, body):
+    before = len(netwatcher._active_scans)
+
+    response = client.post(path, json=body)
+
+    assert response.status_code == 400
+    assert "Dirección IP inválida" in response.get_json()["error"]
+    assert len(netwatcher._active_scans) == before
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/nmap", {"ip": "10.0.0.1", "engine": "connect", "versions": True}),
+    ("/api/nmap/batch", {"ips": ["10.0.0.1"], "engine": "connect", "versions": True}),
+])
+def test_nmap_versions_require_nmap_engine(client, path, body):
+    response = client.post(path, json=body)
+
+    assert response.status_code == 400
+    assert "versiones" in response.get_json()["error"]
+
+
+def test_port_report_feeds_banners_to_risk_rules():
+    report = netwatcher._port_report(
+        [22, 80], ip="10.0.0.1", banners={22: "OpenSSH 7.2p2 Ubuntu 4ubuntu2.8"}
+    )
+
+    assert report["ports"] == [
+        {"port": 22, "service": "SSH", "banner": "OpenSSH 7.2p2 Ubuntu 4ubuntu2.8"},
+        {"port": 80, "service": "HTTP"},
+    ]
+    assert set(report["risk"]) == {"level", "high_risk_ports", "medium_risk_ports", "hints"}
+
+
+EXPORT_HOSTS = [
+    {
+        "ip": f"10.0.{i // 256}.{i % 256}", "mac": f"00:0c:29:00:{i // 256:02x}:{i % 256:02x}",
+        "hostname": f"equipo-{i}-cocina-ñ", "vendor": "VMware, Inc.",
+        "open_ports": [22, 443] if i % 3 else [], "risk": {"level": "LOW" if i % 3 else "SAFE"},
+    }
+    for i in range(2000)
+]
+
+
+def _export(client, fmt, hosts=EXPORT_HOSTS, query="", headers=None, **extra):
+    # json= del cliente de pruebas ordena las claves; se envía tal cual para
+    # poder comparar byte a byte con la entrada.
+    return client.post(
+        f"/api/export/{fmt}{query}", data=json.dumps({"hosts": hosts, **extra}),
+        content_type="application/json", headers=headers,
+    )
+
+
+def test_export_csv_streams_every_row(client):
+    response = _export(client, "csv")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert response.headers["Content-Disposition"].endswith('.csv"')
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == len(EXPORT_HOSTS)
+    assert rows[1] == {
+        "ip": "10.0.0.1", "mac": "00:0c:29:00:00:01", "hostname": "equipo-1-cocina-ñ",
+        "vendor": "VMware, Inc.", "open_ports": "22, 443", "risk_level": "LOW",
+    }
+    assert rows[0]["open_ports"] == "" and rows[0]["risk_level"] == "SAFE"
+
+
+@pytest.mark.parametrize("hosts", [EXPORT_HOSTS[:1], EXPORT_HOSTS])
+def test_export_json_is_byte_identical_to_json_dumps(client, hosts):
+    response = _export(client, "json", hosts=hosts)
+
+    assert response.mimetype == "application/json"
+    expected = json.dumps(hosts, indent=2, ensure_ascii=False).encode("utf-8")
+    assert response.get_data() == expected
+
+
+def test_iter_json_empty_list_matches_json_dumps():
+    assert "".join(netwatcher._iter_json([])) == json.dumps([], indent=2)
+
+
+def test_export_ndjson_one_host_per_line(client):
+    response = _export(client, "ndjson")
+
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == EXPORT_HOSTS
+
+
+@pytest.mark.parametrize("fmt", ["csv", "json", "ndjson"])
+def test_export_gzip_decompresses_to_plain_body(client, fmt):
+    plain = _export(client, fmt).get_data()
+
+    accepts = {"Accept-Encoding": "br, gzip;q=0.8"}
+    for response in (
+        _export(client, fmt, headers=accepts, gzip=True),
+        _export(client, fmt, query="?gzip=1", headers=accepts),
+    ):
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert gzip.decompress(response.get_data()) == plain
+
+
+@pytest.mark.parametrize("accept", [None, "identity", "gzip;q=0"])
+def test_export_gzip_flag_needs_client_support(client, accept):
+    headers = {"Accept-Encoding": accept} if accept else None
+
+    response = _export(client, "ndjson", query="?gzip=1", headers=headers)
+
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.get_data() == _export(client, "ndjson").get_data()
+
+
+def test_export_without_gzip_flag_does_not_vary(client):
+    response = _export(client, "csv", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+
+
+@pytest.mark.parametrize("fmt", ["csv", "json", "ndjson"])
+@pytest.mark.parametrize("body", [{}, {"hosts": []}])
+def test_export_rejects_empty_body(client, fmt, body):
+    response = client.post(f"/api/export/{fmt}", json=body)
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Sin datos para exportar"}
+
+
+def test_chunked_groups_pieces_without_losing_bytes():
+    pieces = ["ñ" * 10] * 25
+
+    chunks = list(netwatcher._chunked(pieces, size=64))
+
+    assert b"".join(chunks) == "".join(pieces).encode("utf-8")
+    assert all(len(chunk) >= 64 for chunk in chunks[:-1])
+    assert len(chunks) == 7
+    assert list(netwatcher._chunked([], size=64)) == []
+
+
+@pytest.fixture
+def scan():
+    scan_id = str(uuid.uuid4())
+    entry = netwatcher._active_scans.create(scan_id, "arp", target="10.0.0.0/24")
+    yield entry
+    netwatcher._active_scans.discard(scan_id)
+
+
+def _frames(scan, **kwargs) -> list:
+    frames = []
+    for raw in netwatcher._stream(scan.scan_id, timeout=1, **kwargs):
+        fields = dict(line.split(": ", 1) for line in raw.strip().split("\n"))
+        frames.append((int(fields["id"]), json.loads(fields["data"])))
+    return frames
+
+
+def _host(n: int) -> dict:
+    return {"ip": f"10.0.0.{n}", "mac": f"00:0c:29:00:00:{n:02x}"}
+
+
+def test_stream_batches_host_events_into_one_frame(scan):
+    for n in range(1, 4):
+        scan.put({"type": "host_found", "host": _host(n)})
+    scan.put({"type": "host_updated", "host": _host(2)})
+    scan.put({"type": "complete", "total": 3})
+
+    frames = _frames(scan, batch=True)
+
+    assert frames == [
+        (4, {"type": "hosts_batch", "found": [_host(1), _host(2), _host(3)],
+             "updated": [_host(2)]}),
+        (5, {"type": "complete", "total": 3}),
+    ]
+    assert len(_frames(scan, batch=False)) == 5
+
+
+def test_stream_batch_closes_on_other_events_and_keeps_order(scan):
+    scan.put({"type": "host_found", "host": _host(1)})
+    scan.put({"type": "host_found", "host": _host(2)})
+    scan.put({"type": "progress", "percent": 50})
+    scan.put({"type": "host_found", "host": _host(3)})
+    scan.put({"type": "complete", "total": 3})
+
+    frames = _frames(scan, batch=True)
+
+    assert [(event_id, msg["type"]) for event_id, msg in frames] == [
+        (2, "hosts_batch"), (3, "progress"), (4, "hosts_batch"), (5, "complete"),
+    ]
+    assert frames[0][1]["found"] == [_host(1), _host(2)]
+    assert frames[2][1]["found"] == [_host(3)]
+
+
+def test_stream_batch_respects_max_and_resumes_after_last_id(scan, monkeypatch):
+    monkeypatch.setattr(netwatcher, "SSE_BATCH_MAX", 3)
+    for n in range(1, 8):
+        scan.put({"type": "host_found", "host": _host(n)})
+    scan.put({"type": "complete", "total": 7})
+
+    frames = _frames(scan, batch=True)
+
+    assert [event_id for event_id, _ in frames] == [3, 6, 7, 8]
+    assert [len(msg.get("found", ())) for _, msg in frames] == [3, 3, 1, 0]
+
+    resumed = _frames(scan, batch=True, last_event_id=frames[0][0])
+    assert resumed[0] == (6, {"type": "hosts_batch", "found": [_host(n) for n in range(4, 7)],
+                              "updated": []})
@@ -0,0 +1,82 @@
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeNetwork, FakeNmap, FakeResolver  # noqa: E402
+from benchmarks.run import build_parser, compare, main, percentile, run_benchmarks  # noqa: E402
+from scripts import utils  # noqa: E402
+
+
+def _args(*extra):
+    return build_parser().parse_args([
+        "--sizes", "28", "--arp-latency-min", "0", "--arp-latency-max", "1",
+        "--arp-timeout", "20", "--dns-hit-ms", "0", "--dns-miss-ms", "0",
+        "--single-hosts", "3", "--density", "0.5", *extra,
+    ])
+
+
+def test_fake_backends_feed_the_real_scanners():
+    network = FakeNetwork("10.0.0.0/28", density=0.5, latency=(0, 0.001), seed=3)
+    resolver = FakeResolver(hit_ratio=1.0, hit_latency=0)
+    utils.clear_dns_cache()
+    with patch.dict(sys.modules, network.scapy_modules()), \
+            patch("socket.gethostbyaddr", resolver.gethostbyaddr):
+        hosts = utils.run_arp_scan(network.cidr, mode="stream", timeout=0.02, retries=0)
+    assert {h["ip"]: h["mac"] for h in hosts} == network.responders
+    assert resolver.calls == len(hosts)
+
+    nmap = FakeNmap(open_ports=3, closed_ports=4)
+    targets = sorted(network.responders)
+    with patch("subprocess.Popen", nmap.popen):
+        results = utils.nmap_scan_many(targets, "1-100")
+    assert sorted(results) == targets
+    assert all(len(ports) == 3 for ports in results.values())
+
+
+def test_run_benchmarks_reports_every_suite():
+    results = run_benchmarks(_args(), log=lambda line: None)
+
+    names = [r["name"] for r in results]
+    assert names == [
+        "arp_arping", "arp_stream", "nmap_many", "nmap_single", "vendor", "risk",
+        "sse", "sse_batch",
+    ]
+    for result in results:
+        assert result["size"] == 28
+        assert result["items"] > 0
+        assert result["latency_ms"]["p50"] <= result["latency_ms"]["p99"]
+
+
+def test_percentile_is_nearest_rank():
+    assert percentile(list(range(1, 11)), 90) == 9
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile(list(range(1, 101)), 90) == 90
+    assert percentile(list(range(1, 11)), 50) == 5
+    assert percentile(list(range(1, 11)), 95) == 10
+    assert percentile(list(range(1, 11)), 100) == 10
+    assert percentile(list(range(1, 11)), 0) == 1
+
+
+def test_percentile_and_compare(tmp_path):
+    assert percentile([5, 1, 4, 2, 3], 50) == 3
+    assert percentile([5, 1, 4, 2, 3], 99) == 5
+    assert percentile([], 90) == 0.0
+
+    old = {"results": [{
+        "name": "vendor", "size": 24, "throughput": 100.0,
+        "latency_ms": {"p50": 2.0, "p99": 4.0},
+    }]}
+    new = {"results": [
+        {"name": "vendor", "size": 24, "throughput": 150.0,
+         "latency_ms": {"p50": 1.0, "p99": 4.0}},
+        {"name": "risk", "size": 24, "throughput": 1.0, "latency_ms": {}},
+    ]}
+    assert compare(old, new) == [
+        {"name": "vendor", "size": 24, "throughput": 50.0, "p50": -50.0, "p99": 0.0},
+    ]
+
+    output = tmp_path / "bench.json"
+    assert main(["--sizes", "28", "--only", "vendor", "--output", str(output)]) == 0
+    assert main(["--sizes", "28", "--only", "vendor", "--compare", str(output)]) == 0
@@ -0,0 +1,36 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.cancel import CancelToken, is_cancelled  # noqa: E402
+
+
+def test_cancel_runs_callbacks_once():
+    token = CancelToken()
+    calls = []
+    token.on_cancel(lambda: calls.append("kill"))
+    forget = token.on_cancel(lambda: calls.append("forgotten"))
+    forget()
+
+    assert token.cancel() is True
+    assert token.cancel() is False
+    assert calls == ["kill"]
+    assert token.cancelled and is_cancelled(token)
+    assert not is_cancelled(None)
+
+
+def test_on_cancel_after_cancel_runs_immediately():
+    token = CancelToken()
+    token.cancel()
+    calls = []
+    token.on_cancel(lambda: calls.append("late"))
+    assert calls == ["late"]
+
+
+def test_wait_wakes_up_on_cancel():
+    token = CancelToken()
+    threading.Timer(0.05, token.cancel).start()
+    assert token.wait(5) is True
+    assert CancelToken().wait(0) is False
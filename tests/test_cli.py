@@ -3,10 +3,12 @@ import pytest
 from unittest.mock import patch
 import sys
 import json
+import tempfile
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from scripts import cli  # noqa: E402
+from scripts.utils import ARP_MAX_PPS, ARP_SHARD_WORKERS  # noqa: E402
 
 
 @patch("scripts.cli.run_arp_scan")
@@ -21,7 +23,10 @@ def test_cli_scan_arp_success(mock_check_permissions, mock_run_arp_scan, capsys)
 
     captured = capsys.readouterr()
 
-    mock_run_arp_scan.assert_called_once_with("192.168.1.0/24")
+    mock_run_arp_scan.assert_called_once_with(
+        "192.168.1.0/24", callback=None, on_update=None, mode="arping",
+        workers=ARP_SHARD_WORKERS, max_pps=ARP_MAX_PPS, timings=None,
+    )
 
     lines = captured.out.strip().splitlines()
     json_str = "\n".join(lines[1:]) if len(lines) > 1 else captured.out
@@ -29,6 +34,74 @@ def test_cli_scan_arp_success(mock_check_permissions, mock_run_arp_scan, capsys)
     assert output_json == fake_results
 
 
+@patch("scripts.cli.run_arp_scan", return_value=[])
+@patch("scripts.cli.check_permissions", return_value=True)
+def test_cli_scan_arp_sharded_mode(mock_check_permissions, mock_run_arp_scan, capsys):
+    sys.argv = [
+        "cli.py", "scan-arp", "--cidr", "10.20.0.0/16",
+        "--mode", "sharded", "--workers", "4", "--pps", "2000",
+    ]
+
+    cli.main()
+
+    capsys.readouterr()
+    mock_run_arp_scan.assert_called_once_with(
+        "10.20.0.0/16", callback=None, on_update=None, mode="sharded", workers=4,
+        max_pps=2000, timings=None,
+    )
+
+
+@patch("scripts.cli.check_permissions", return_value=True)
+def test_cli_scan_arp_writes_output_as_hosts_resolve(mock_check_permissions, capsys):
+    written, during_scan = [], []
+    original_write = cli.ResultWriter.write
+
+    def recording_write(self, row):
+        written.append(row["ip"])
+        original_write(self, row)
+
+    def fake_scan(cidr, callback, on_update, **kwargs):
+        hosts = [
+            {"ip": f"10.0.0.{n}", "mac": f"aa:bb:cc:00:00:0{n}", "hostname": "N/A",
+             "vendor": "Desconocido"}
+            for n in (1, 2)
+        ]
+        for host in hosts:
+            callback(dict(host))
+        hosts[1]["hostname"] = "nas.lan"
+        on_update(dict(hosts[1]))
+        during_scan.extend(written)
+        return hosts
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = os.path.join(tmpdir, "hosts.jsonl")
+        sys.argv = ["cli.py", "scan-arp", "--cidr", "10.0.0.0/24", "--output", output]
+        with patch("scripts.cli.run_arp_scan", side_effect=fake_scan), \
+                patch.object(cli.ResultWriter, "write", recording_write):
+            cli.main()
+        capsys.readouterr()
+        with open(output, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+
+    assert during_scan == ["10.0.0.2"]
+    assert rows == [
+        {"ip": "10.0.0.2", "mac": "aa:bb:cc:00:00:02", "hostname": "nas.lan",
+         "vendor": "Desconocido"},
+        {"ip": "10.0.0.1", "mac": "aa:bb:cc:00:00:01", "hostname": "N/A",
+         "vendor": "Desconocido"},
+    ]
+
+
+def test_cli_scan_nmap_rejects_chunks_with_ips(capsys):
+    sys.argv = ["cli.py", "scan-nmap", "--ips", "10.0.0.1", "10.0.0.2", "--chunks", "4"]
+
+    with pytest.raises(SystemExit) as e:
+        cli.main()
+
+    assert e.value.code == 2
+    assert "--chunks" in capsys.readouterr().err
+
+
 @patch("scripts.cli.check_permissions", return_value=False)
 def test_cli_scan_arp_no_permissions(mock_check_permissions, capsys):
     sys.argv = ["cli.py", "scan-arp", "--cidr", "192.168.1.0/24"]
@@ -41,17 +114,19 @@ def test_cli_scan_arp_no_permissions(mock_check_permissions, capsys):
     assert "Error: El escaneo ARP requiere privilegios de" in captured.out
 
 
-@patch("scripts.cli.nmap_scan")
+@patch("scripts.cli.nmap_scan_cached")
 def test_cli_scan_nmap_success(mock_nmap_scan, capsys):
     fake_ports = [80, 443]
-    mock_nmap_scan.return_value = fake_ports
+    mock_nmap_scan.return_value = (fake_ports, False)
 
     sys.argv = ["cli.py", "scan-nmap", "--ip", "1.1.1.1", "--ports", "80,443"]
 
     cli.main()
 
     captured = capsys.readouterr()
-    mock_nmap_scan.assert_called_once_with("1.1.1.1", port_range="80,443")
+    mock_nmap_scan.assert_called_once_with(
+        "1.1.1.1", port_range="80,443", engine="nmap", force=False, timings=None
+    )
 
     lines = captured.out.strip().splitlines()
     json_str = "\n".join(lines[1:]) if len(lines) > 1 else captured.out
@@ -59,16 +134,141 @@ def test_cli_scan_nmap_success(mock_nmap_scan, capsys):
     assert output_json == {"ip": "1.1.1.1", "open_ports": fake_ports}
 
 
-@patch("scripts.cli.nmap_scan")
+@patch("scripts.cli.nmap_scan_cached")
 def test_cli_scan_nmap_default_ports(mock_nmap_scan, capsys):
-    mock_nmap_scan.return_value = [22]
+    mock_nmap_scan.return_value = ([22], False)
 
     sys.argv = ["cli.py", "scan-nmap", "--ip", "1.1.1.1"]
 
     cli.main()
 
     capsys.readouterr()
-    mock_nmap_scan.assert_called_once_with("1.1.1.1", port_range="1-1024")
+    mock_nmap_scan.assert_called_once_with(
+        "1.1.1.1", port_range="1-1024", engine="nmap", force=False, timings=None
+    )
+
+
+@patch("scripts.cli.nmap_scan_cached")
+def test_cli_scan_nmap_connect_engine(mock_nmap_scan, capsys):
+    mock_nmap_scan.return_value = ([22], False)
+
+    sys.argv = ["cli.py", "scan-nmap", "--ip", "1.1.1.1", "--engine", "connect"]
+
+    cli.main()
+
+    capsys.readouterr()
+    mock_nmap_scan.assert_called_once_with(
+        "1.1.1.1", port_range="1-1024", engine="connect", force=False, timings=None
+    )
+
+
+@patch("scripts.cli.nmap_scan_many")
+def test_cli_scan_nmap_multiple_hosts(mock_nmap_scan_many, capsys):
+    mock_nmap_scan_many.return_value = {"10.0.0.1": [22], "10.0.0.2": []}
+
+    sys.argv = ["cli.py", "scan-nmap", "--ips", "10.0.0.1", "10.0.0.2", "--ports", "22"]
+
+    cli.main()
+
+    captured = capsys.readouterr()
+    args, kwargs = mock_nmap_scan_many.call_args
+    assert args == (["10.0.0.1", "10.0.0.2"],)
+    assert kwargs["port_range"] == "22"
+
+    json_str = "\n".join(captured.out.strip().splitlines()[1:])
+    assert json.loads(json_str) == [
+        {"ip": "10.0.0.1", "open_ports": [22]},
+        {"ip": "10.0.0.2", "open_ports": []},
+    ]
+
+
+@patch("scripts.cli.nmap_scan_chunked")
+def test_cli_scan_nmap_chunks(mock_chunked, capsys):
+    mock_chunked.return_value = {"open_ports": [22], "partial": False, "failed_chunks": []}
+    sys.argv = [
+        "cli.py", "scan-nmap", "--ip", "1.1.1.1", "--ports", "1-65535",
+        "--chunks", "8", "--chunk-workers", "4",
+    ]
+
+    cli.main()
+
+    lines = capsys.readouterr().out.strip().splitlines()
+    assert json.loads("\n".join(lines[1:]))["open_ports"] == [22]
+    kwargs = mock_chunked.call_args.kwargs
+    assert (kwargs["port_range"], kwargs["chunks"], kwargs["workers"]) == ("1-65535", 8, 4)
+
+
+@patch("scripts.cli.nmap_scan_many")
+def test_cli_scan_nmap_many_writes_output_per_host(mock_nmap_scan_many, capsys):
+    def fake_scan(ips, port_range, callback, engine, timings=None):
+        for ip in ips:
+            callback(ip, [22])
+        return {ip: [22] for ip in ips}
+
+    mock_nmap_scan_many.side_effect = fake_scan
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = os.path.join(tmpdir, "ports.jsonl")
+        sys.argv = ["cli.py", "scan-nmap", "--ips", "10.0.0.1", "10.0.0.2", "--output", output]
+        cli.main()
+        capsys.readouterr()
+        with open(output, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+
+    assert rows == [
+        {"ip": "10.0.0.1", "open_ports": "22", "risk_level": "LOW"},
+        {"ip": "10.0.0.2", "open_ports": "22", "risk_level": "LOW"},
+    ]
+
+
+@patch("scripts.cli.nmap_scan_cached", return_value=([22, 445], False))
+def test_cli_scan_nmap_records_history(mock_nmap_scan, capsys):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db = os.path.join(tmpdir, "history.db")
+        sys.argv = ["cli.py", "--history-db", db, "scan-nmap", "--ip", "10.0.0.5"]
+        cli.main()
+        capsys.readouterr()
+
+        sys.argv = ["cli.py", "--history-db", db, "history", "--ip", "10.0.0.5", "--ports"]
+        cli.main()
+
+    output_json = json.loads(capsys.readouterr().out)
+    assert output_json[0]["open_ports"] == [22, 445]
+    assert output_json[0]["risk_level"] == "HIGH"
+    assert output_json[0]["port_range"] == "1-1024"
+
+
+@patch("scripts.cli.nmap_scan_cached")
+def test_cli_scan_nmap_timings_and_profile(mock_nmap_scan, capsys):
+    def fake_scan(ip, port_range, engine, force, timings):
+        timings.add("nmap", 1.5)
+        return [22], False
+
+    mock_nmap_scan.side_effect = fake_scan
+    with tempfile.TemporaryDirectory() as tmpdir:
+        profile = os.path.join(tmpdir, "scan.prof")
+        sys.argv = [
+            "cli.py", "--timings", "--profile", profile, "scan-nmap", "--ip", "10.0.0.5",
+        ]
+        cli.main()
+        assert os.path.getsize(profile) > 0
+
+    lines = capsys.readouterr().out.strip().splitlines()
+    output_json = json.loads("\n".join(lines[1:]))
+    assert output_json == {
+        "ip": "10.0.0.5", "open_ports": [22],
+        "timings": {"nmap": {"seconds": 1.5, "count": 1}},
+    }
+
+
+@patch("scripts.cli.nmap_scan_many")
+def test_cli_scan_nmap_rejects_non_ip_targets(mock_nmap_scan_many, capsys):
+    sys.argv = ["cli.py", "scan-nmap", "--ips", "10.0.0.1", "router.lan"]
+
+    with pytest.raises(SystemExit):
+        cli.main()
+
+    assert "Dirección IP inválida: 'router.lan'" in capsys.readouterr().err
+    mock_nmap_scan_many.assert_not_called()
 
 
 def test_cli_missing_arguments(capsys):
@@ -0,0 +1,65 @@
+import os
+import queue
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.history import HistoryStore  # noqa: E402
+
+
+@pytest.fixture
+def store():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        history = HistoryStore(os.path.join(tmpdir, "history.db"), flush_interval=0.01)
+        yield history
+        history.close()
+
+
+def test_history_records_and_queries_hosts(store):
+    store.record_host({"ip": "10.0.0.5", "mac": "000c.29aa.bbcc", "hostname": "N/A",
+                       "vendor": "VMware, Inc."}, scan_id="s1", ts=100.0)
+    store.record_host({"ip": "10.0.0.5", "mac": "00:0C:29:AA:BB:CC", "hostname": "vm.local",
+                       "vendor": "VMware, Inc."}, scan_id="s1", ts=101.0)
+    store.record_host({"ip": "10.0.0.9", "mac": "00:0C:29:AA:BB:CC", "hostname": "N/A",
+                       "vendor": "VMware, Inc."}, scan_id="s2", ts=200.0)
+    store.flush()
+
+    by_ip = store.host_history(ip="10.0.0.5")
+    assert len(by_ip) == 1
+    assert by_ip[0]["hostname"] == "vm.local"
+    assert by_ip[0]["mac"] == "00:0C:29:AA:BB:CC"
+
+    assert [h["ip"] for h in store.host_history(since=150)] == ["10.0.0.9"]
+
+    seen = store.first_seen("00-0c-29-aa-bb-cc")
+    assert seen["first_seen"] == 100.0
+    assert seen["last_seen"] == 200.0
+    assert seen["ips"] == ["10.0.0.9", "10.0.0.5"]
+    assert store.first_seen("AA:BB:CC:DD:EE:FF") is None
+
+
+def test_history_records_port_scans(store):
+    store.record_ports("10.0.0.5", [443, 22], scan_id="n1", risk_level="LOW",
+                       port_range="1-1024", engine="nmap", ts=100.0)
+    store.record_ports("10.0.0.5", [22, 445], scan_id="n2", risk_level="HIGH", ts=200.0)
+    store.flush()
+
+    history = store.port_history("10.0.0.5")
+    assert [h["open_ports"] for h in history] == [[22, 445], [22, 443]]
+    assert history[0]["risk_level"] == "HIGH"
+    assert store.stats()["port_records"] == 2
+
+
+def test_history_drops_when_buffer_full(store):
+    writer_queue = store._pending
+    full = queue.Queue(maxsize=1)
+    full.put(("host", ("s", 1.0, "10.0.0.1", None, None, None)))
+    store._pending = full
+    try:
+        assert store.record_host({"ip": "10.0.0.2"}, scan_id="s") is False
+        assert store.dropped == 1
+    finally:
+        store._pending = writer_queue
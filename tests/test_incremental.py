@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.history import HistoryStore  # noqa: E402
+from scripts.incremental import plan_rescan, run_incremental_scan  # noqa: E402
+
+
+@pytest.fixture
+def store():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        history = HistoryStore(os.path.join(tmpdir, "history.db"), flush_interval=0.01)
+        yield history
+        history.close()
+
+
+def test_plan_rescan_reasons():
+    hosts = [
+        {"ip": "10.0.0.1", "mac": "aa:bb:cc:00:00:01"},
+        {"ip": "10.0.0.2", "mac": "aa:bb:cc:00:00:99"},
+        {"ip": "10.0.0.3", "mac": "aa:bb:cc:00:00:03"},
+        {"ip": "10.0.0.4", "mac": "aa:bb:cc:00:00:04"},
+    ]
+    previous = {
+        "10.0.0.1": {"ip": "10.0.0.1", "mac": "AA:BB:CC:00:00:01"},
+        "10.0.0.2": {"ip": "10.0.0.2", "mac": "AA:BB:CC:00:00:02"},
+        "10.0.0.3": {"ip": "10.0.0.3", "mac": "AA:BB:CC:00:00:03"},
+    }
+    last_ports = {
+        "10.0.0.1": {"ts": 900.0, "port_range": "1-1024", "open_ports": [22]},
+        "10.0.0.2": {"ts": 900.0, "port_range": "1-1024", "open_ports": [80]},
+        "10.0.0.3": {"ts": 100.0, "port_range": "1-1024", "open_ports": [443]},
+    }
+
+    plan = plan_rescan(hosts, previous, last_ports, max_age=500, port_range="1-1024", now=1000.0)
+
+    assert plan["scan"] == {"10.0.0.2": "rebound", "10.0.0.3": "stale", "10.0.0.4": "new"}
+    assert plan["reuse"] == {"10.0.0.1": [22]}
+
+
+@patch("scripts.incremental.nmap_scan_many")
+@patch("scripts.incremental.run_arp_scan")
+def test_incremental_scan_only_scans_changed_hosts(mock_arp, mock_nmap_many, store):
+    store.record_host({"ip": "10.0.0.1", "mac": "aa:bb:cc:00:00:01"}, scan_id="s1")
+    store.record_host({"ip": "10.0.0.2", "mac": "aa:bb:cc:00:00:02"}, scan_id="s1")
+    store.record_host({"ip": "192.168.9.9", "mac": "aa:bb:cc:00:00:09"}, scan_id="other")
+    store.record_ports("10.0.0.1", [22], scan_id="n1", risk_level="LOW", port_range="1-1024")
+    store.record_ports("10.0.0.2", [80], scan_id="n1", risk_level="LOW", port_range="1-1024")
+    store.flush()
+
+    mock_arp.return_value = [
+        {"ip": "10.0.0.1", "mac": "aa:bb:cc:00:00:01"},
+        {"ip": "10.0.0.3", "mac": "aa:bb:cc:00:00:03"},
+    ]
+    mock_nmap_many.return_value = {"10.0.0.3": [445]}
+
+    result = run_incremental_scan("10.0.0.0/24", store, port_range="1-1024")
+
+    mock_nmap_many.assert_called_once_with(
+        ["10.0.0.3"], port_range="1-1024", callback=None, engine="nmap"
+    )
+    assert result["scanned"] == {"10.0.0.3": "new"}
+    assert result["skipped"] == 1
+    assert [h["open_ports"] for h in result["hosts"]] == [[22], [445]]
+    assert [h["ip"] for h in result["diff"]["joined"]] == ["10.0.0.3"]
+    assert [h["ip"] for h in result["diff"]["left"]] == ["10.0.0.2"]
+
+    store.flush()
+    assert store.latest_ports(["10.0.0.3"])["10.0.0.3"]["risk_level"] == "HIGH"
+
+
+@patch("scripts.incremental.nmap_scan_many")
+@patch("scripts.incremental.run_arp_scan")
+def test_incremental_scan_reports_port_and_risk_changes(mock_arp, mock_nmap_many, store):
+    store.record_host({"ip": "10.0.0.1", "mac": "aa:bb:cc:00:00:01"}, scan_id="s1")
+    store.record_ports("10.0.0.1", [22, 80], scan_id="n1", risk_level="LOW",
+                       port_range="1-100", ts=1.0)
+    store.flush()
+
+    mock_arp.return_value = [{"ip": "10.0.0.1", "mac": "aa:bb:cc:00:00:01"}]
+    mock_nmap_many.return_value = {"10.0.0.1": [22, 3389]}
+
+    result = run_incremental_scan("10.0.0.0/24", store, port_range="1-1024")
+
+    assert result["scanned"] == {"10.0.0.1": "stale"}
+    diff = result["diff"]
+    assert diff["ports_opened"] == {"10.0.0.1": [3389]}
+    assert diff["ports_closed"] == {"10.0.0.1": [80]}
+    assert diff["risk_changed"] == [{"ip": "10.0.0.1", "before": "LOW", "after": "HIGH"}]
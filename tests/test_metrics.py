@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.metrics import MetricsRegistry  # noqa: E402
+
+
+def test_counter_and_gauge_render_prometheus_text():
+    registry = MetricsRegistry()
+    scans = registry.counter("scans_total", "Escaneos", ("kind", "outcome"))
+    registry.counter("reaped_total", "Liberados")
+    registry.gauge("pools", "Pools", ("pool",), fn=lambda: {("arp",): 2, ("nmap",): 4})
+    scans.inc(kind="arp", outcome="complete")
+    scans.inc(2, kind="nmap", outcome="error")
+
+    text = registry.render()
+    assert "# TYPE scans_total counter\n" in text
+    assert 'scans_total{kind="arp",outcome="complete"} 1\n' in text
+    assert 'scans_total{kind="nmap",outcome="error"} 2\n' in text
+    assert "reaped_total 0\n" in text
+    assert 'pools{pool="arp"} 2\npools{pool="nmap"} 4\n' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("dns_seconds", "DNS", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+
+    text = registry.render()
+    assert 'dns_seconds_bucket{le="0.1"} 2\n' in text
+    assert 'dns_seconds_bucket{le="1"} 3\n' in text
+    assert 'dns_seconds_bucket{le="+Inf"} 4\n' in text
+    assert "dns_seconds_sum 3.65\n" in text
+    assert "dns_seconds_count 4\n" in text
+    assert latency.count() == 4
+
+
+def test_metrics_validate_labels_and_names():
+    registry = MetricsRegistry()
+    counter = registry.counter("scans_total", "Escaneos", ("kind",))
+    with pytest.raises(ValueError, match="etiquetas"):
+        counter.inc(outcome="complete")
+    with pytest.raises(ValueError, match="disminuir"):
+        counter.inc(-1, kind="arp")
+    with pytest.raises(ValueError, match="ya está registrada"):
+        registry.gauge("scans_total", "Duplicada")
@@ -0,0 +1,111 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import utils  # noqa: E402
+from scripts.oui import OuiIndex, compile_oui_index  # noqa: E402
+
+IEEE_MAL = (
+    "Registry,Assignment,Organization Name,Organization Address\n"
+    "MA-L,000C29,\"VMware, Inc.\",3401 Hillview Avenue Palo Alto CA US 94304\n"
+    "MA-L,70B3D5,IEEE Registration Authority,445 Hoes Lane Piscataway NJ US 08554\n"
+    "MA-L,1C2F65,Juniper Networks,1133 Innovation Way Sunnyvale CA US 94089\n"
+)
+IEEE_MAM = (
+    "Registry,Assignment,Organization Name,Organization Address\n"
+    "MA-M,70B3D51,Acme Sensors,Calle Falsa 123 Madrid ES 28001\n"
+)
+IEEE_MAS = (
+    "Registry,Assignment,Organization Name,Organization Address\n"
+    "MA-S,70B3D5123,Tiny Widgets,1 Main St Springfield US 00001\n"
+    "MA-S,70B3D5F00,Acme Sensors,Calle Falsa 123 Madrid ES 28001\n"
+)
+
+
+@pytest.fixture
+def oui_index_path():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sources = []
+        for name, content in (("oui.csv", IEEE_MAL), ("mam.csv", IEEE_MAM),
+                              ("oui36.csv", IEEE_MAS)):
+            path = os.path.join(tmpdir, name)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+            sources.append(path)
+        output = os.path.join(tmpdir, "oui.idx")
+        assert compile_oui_index(sources, output) == 6
+        yield output
+
+
+def test_oui_index_longest_prefix_match(oui_index_path):
+    index = OuiIndex(oui_index_path)
+    try:
+        assert len(index) == 6
+        assert index.lookup(0x000C29AABBCC) == "VMware, Inc."
+        assert index.lookup(0x70B3D5123456) == "Tiny Widgets"
+        assert index.lookup(0x70B3D5F00123) == "Acme Sensors"
+        assert index.lookup(0x70B3D5100000) == "Acme Sensors"
+        assert index.lookup(0x70B3D5200000) == "IEEE Registration Authority"
+        assert index.lookup(0xAABBCCDDEEFF) is None
+    finally:
+        index.close()
+
+
+def test_oui_index_interns_vendor_names(oui_index_path):
+    index = OuiIndex(oui_index_path)
+    try:
+        assert index.vendor_id(0x70B3D5100000) == index.vendor_id(0x70B3D5F00123)
+    finally:
+        index.close()
+
+
+def test_oui_index_rejects_foreign_file():
+    with tempfile.NamedTemporaryFile(suffix=".idx", delete=False) as tmp:
+        tmp.write(b"not an index" * 4)
+    try:
+        with pytest.raises(ValueError):
+            OuiIndex(tmp.name)
+    finally:
+        os.remove(tmp.name)
+
+
+def test_vendor_lookup_uses_loaded_index(oui_index_path):
+    utils.load_oui_index(oui_index_path)
+    try:
+        assert utils.vendor_lookup("70:B3:D5:12:34:56") == "Tiny Widgets"
+        assert utils.vendor_lookup("1c-2f-65-00-11-22") == "Juniper Networks"
+        assert utils.vendor_lookup("00:0C:29:XX:YY:ZZ") == "VMware, Inc."
+        assert utils.vendor_lookup("B8:27:EB:00:11:22") == "Raspberry Pi Foundation"
+    finally:
+        utils._oui_index.close()
+        utils._oui_index = None
+        utils._oui_index_loaded = False
+
+
+def test_oui_index_rejects_truncated_file(oui_index_path):
+    with open(oui_index_path, "rb") as f:
+        data = f.read()
+    truncated = f"{oui_index_path}.part"
+    for size in range(len(data)):
+        with open(truncated, "wb") as f:
+            f.write(data[:size])
+        with pytest.raises(ValueError):
+            OuiIndex(truncated)
+
+
+def test_vendor_lookup_falls_back_to_builtin_db_on_truncated_index(
+    oui_index_path, monkeypatch, capsys
+):
+    with open(oui_index_path, "r+b") as f:
+        f.truncate(os.path.getsize(oui_index_path) - 5)
+    monkeypatch.setattr(utils, "OUI_INDEX_PATH", oui_index_path)
+    monkeypatch.setattr(utils, "_oui_index", None)
+    monkeypatch.setattr(utils, "_oui_index_loaded", False)
+
+    assert utils.vendor_lookup("00:0C:29:AA:BB:CC") == "VMware, Inc."
+    assert utils.vendor_lookup("70:B3:D5:12:34:56") == "Desconocido"
+    assert "truncado" in capsys.readouterr().err
@@ -0,0 +1,89 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scripts.ports as ports  # noqa: E402
+from scripts.ports import TOP_PORTS, PortSpec, normalise_port_spec, parse_port_spec  # noqa: E402
+
+
+def test_parse_coalesces_ranges_and_lists():
+    spec = parse_port_spec("443, 80,20-25,22,26")
+    assert str(spec) == "20-26,80,443"
+    assert spec.ranges() == [(20, 26), (80, 80), (443, 443)]
+    assert len(spec) == 9
+    assert normalise_port_spec("-3,65530-") == "1-3,65530-65535"
+    assert parse_port_spec("1-65535") == PortSpec.from_ports(range(1, 65536))
+
+
+def test_parse_protocol_prefixes_and_top_ports(monkeypatch):
+    monkeypatch.setattr(ports, "_top_ports", TOP_PORTS)
+    spec = parse_port_spec("T:80,443,U:53,161-162")
+    assert spec.ports("tcp") == [80, 443]
+    assert spec.ports("udp") == [53, 161, 162]
+    assert str(spec) == "T:80,443,U:53,161-162"
+
+    assert sorted(parse_port_spec("top-5").ports()) == sorted(TOP_PORTS[:5])
+    assert len(parse_port_spec("top-100,1-10")) == len(set(TOP_PORTS[:100]) | set(range(1, 11)))
+
+
+@pytest.mark.parametrize("bad", ["", "0", "80-22", "70000", "abc", "X:80", "top-0", "U:top-10"])
+def test_parse_rejects_invalid_specs(bad):
+    with pytest.raises(ValueError):
+        parse_port_spec(bad)
+
+
+def test_top_1000_is_embedded_without_nmap_services(monkeypatch):
+    monkeypatch.setattr(ports, "_top_ports", TOP_PORTS)
+
+    spec = parse_port_spec("top-1000")
+
+    assert len(TOP_PORTS) == len(set(TOP_PORTS)) == len(spec) == 1000
+    # Mismo conjunto que Nmap escanea por defecto (sin -p ni --top-ports).
+    assert str(spec).startswith("1,3-4,6-7,9,13,17,19-26,30,32-33,37,42-43,49,53,70,79-85,")
+    assert "1021-1100" in str(spec) and "32768-32785" in str(spec)
+    assert str(spec).endswith(",64623,64680,65000,65129,65389")
+    with pytest.raises(ValueError, match="nmap-services"):
+        parse_port_spec("top-1001")
+
+
+def test_top_ports_beyond_1000_come_from_nmap_services(tmp_path, monkeypatch):
+    monkeypatch.setattr(ports, "_top_ports", TOP_PORTS)
+
+    services = tmp_path / "nmap-services"
+    services.write_text(
+        "# Fields in this file are: Service name, portnum/protocol, open-frequency\n"
+        "domain\t53/udp\t0.213496\t# Domain Name Server\n"
+        + "".join(f"svc{p}\t{p}/tcp\t{1 / p:.6f}\n" for p in range(2000, 1, -1))
+        + "unknown\t1/tcp\t0.000000\n",
+        encoding="utf-8",
+    )
+    ranked = ports.load_top_ports(str(services))
+
+    assert ranked[:3] == (2, 3, 4)
+    assert len(ranked) == 2000 and 53 in ranked
+    assert parse_port_spec("top-1000") == PortSpec.from_ports(range(2, 1002))
+    with pytest.raises(ValueError, match="entre 1 y 2000"):
+        parse_port_spec("top-2001")
+
+
+def test_set_operations():
+    spec = parse_port_spec("1-1024")
+    assert str(spec.exclude("100-200,443")) == "1-99,201-442,444-1024"
+    assert spec.intersect([22, 80, 8080]).ports() == [22, 80]
+    assert str(parse_port_spec("22").union("U:53")) == "T:22,U:53"
+
+
+def test_split_balances_chunks():
+    chunks = parse_port_spec("1-10,100,200-209").split(4)
+    assert [len(c) for c in chunks] == [6, 5, 5, 5]
+    assert [str(c) for c in chunks] == ["1-6", "7-10,100", "200-204", "205-209"]
+    merged = PortSpec()
+    for chunk in chunks:
+        merged |= chunk
+    assert merged == parse_port_spec("1-10,100,200-209")
+
+    assert len(parse_port_spec("22,80").split(8)) == 2
+    assert [len(c) for c in parse_port_spec("1-65535").split(3)] == [21845] * 3
@@ -0,0 +1,136 @@
+import os
+import queue
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.registry import ScanRegistry  # noqa: E402
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _drain(sub) -> list:
+    events = []
+    while True:
+        try:
+            events.append(sub.get(timeout=0))
+        except queue.Empty:
+            return events
+
+
+def test_ring_buffer_assigns_ids_and_reports_lost_events():
+    registry = ScanRegistry(maxsize=3, clock=_Clock())
+    scan = registry.create("s1", "arp")
+    for i in range(5):
+        scan.put({"type": "host_found", "host": {"ip": f"10.0.0.{i}"}})
+    assert scan.put({"type": "complete", "total": 5}) == 6
+
+    events = _drain(scan.subscribe())
+    assert events[0] == (None, {"type": "overflow", "dropped": 3})
+    assert [event_id for event_id, _ in events[1:]] == [4, 5, 6]
+    assert events[-1][1]["type"] == "complete"
+    assert scan.qsize() == 3
+    assert scan.dropped == 3
+    assert scan.state == "done"
+
+
+def test_subscribers_read_independently_and_resume_from_last_event_id():
+    registry = ScanRegistry(clock=_Clock())
+    scan = registry.create("s1", "nmap")
+    for port in (22, 80, 443):
+        scan.put({"type": "port_found", "port": port})
+
+    first, second = scan.subscribe(), scan.subscribe()
+    assert scan.subscribers == 2
+    assert [msg["port"] for _, msg in _drain(first)] == [22, 80, 443]
+    assert second.get(timeout=0) == (1, {"type": "port_found", "port": 22})
+
+    resumed = scan.subscribe(last_event_id=2)
+    assert _drain(resumed) == [(3, {"type": "port_found", "port": 443})]
+    for sub in (first, second, resumed):
+        sub.close()
+    assert scan.subscribers == 0
+
+
+def test_subscription_wakes_up_on_new_events():
+    scan = ScanRegistry().create("s1", "arp")
+    sub = scan.subscribe()
+    received = []
+    reader = threading.Thread(target=lambda: received.append(sub.get(timeout=5)))
+    reader.start()
+    scan.put({"type": "started"})
+    reader.join(5)
+
+    assert received == [(1, {"type": "started"})]
+    with pytest.raises(queue.Empty):
+        sub.get(timeout=0)
+
+
+def test_registry_reaps_unwatched_and_finished_scans():
+    clock = _Clock()
+    reaped = []
+    registry = ScanRegistry(ttl=60, finished_ttl=10, clock=clock, on_reap=reaped.append)
+    orphan = registry.create("orphan", "arp", target="10.0.0.0/24")
+    watched = registry.create("watched", "arp")
+    sub = watched.subscribe()
+    done = registry.create("done", "nmap")
+    done.put({"type": "complete"})
+
+    clock.now += 5
+    assert registry.reap() == []
+    clock.now += 56
+    assert sorted(registry.reap()) == ["done", "orphan"]
+
+    assert orphan.cancelled
+    assert "watched" in registry
+    assert sorted(reaped) == ["done", "orphan"]
+    assert registry.reaped == 2
+
+    sub.close()
+    clock.now += 61
+    assert registry.reap() == ["watched"]
+    assert len(registry) == 0
+
+
+def test_registry_snapshot_reports_state_and_buffer():
+    clock = _Clock()
+    registry = ScanRegistry(clock=clock)
+    scan = registry.create("s1", "arp", target="10.0.0.0/24")
+    scan.put({"type": "started"})
+    scan.put({"type": "host_found", "host": {}})
+    clock.now += 5
+
+    (info,) = registry.snapshot()
+    assert info["scan_id"] == "s1"
+    assert info["state"] == "running"
+    assert info["buffered"] == 2
+    assert info["last_event_id"] == 2
+    assert info["age"] == 5.0
+    assert info["target"] == "10.0.0.0/24"
+
+
+def test_registry_reports_finish_once_and_totals():
+    finished = []
+    registry = ScanRegistry(
+        clock=_Clock(), on_finish=lambda scan, msg: finished.append((scan.kind, msg)),
+    )
+    scan = registry.create("s1", "arp")
+    scan.subscribe()
+    scan.put({"type": "started"})
+    scan.put({"type": "cancelled", "total": 0})
+    scan.put({"type": "cancelled", "total": 0})
+    registry.create("s2", "nmap")
+
+    assert finished == [("arp", {"type": "cancelled", "total": 0})]
+    assert registry.totals() == {
+        "states": {"cancelled": 1, "queued": 1}, "subscribers": 1, "buffered": 3,
+    }
@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.risk import RiskEngine, compile_rules  # noqa: E402
+
+EXAMPLE_RULES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples", "risk_rules.json"
+)
+
+
+def test_builtin_rules_keep_assess_risk_shape():
+    result = compile_rules([]).evaluate([22, 80, 445, 3306])
+    assert set(result) == {"level", "high_risk_ports", "medium_risk_ports", "hints"}
+    assert result["level"] == "HIGH"
+    assert result["high_risk_ports"] == [445]
+    assert result["medium_risk_ports"] == [80, 3306]
+    assert {h["port"] for h in result["hints"]} == {445, 3306}
+    assert compile_rules([]).evaluate([22])["level"] == "LOW"
+    assert compile_rules([]).evaluate([])["level"] == "SAFE"
+
+
+def test_combo_vendor_banner_and_subnet_rules():
+    engine = RiskEngine(EXAMPLE_RULES)
+
+    vmware = engine.assess([902], ip="10.0.0.5", vendor="VMware, Inc.")
+    assert vmware["level"] == "HIGH"
+    assert vmware["hints"][0]["rule"] == "vmware-esxi-902"
+    assert engine.assess([902], vendor="Dell Inc.")["level"] == "LOW"
+
+    combo = engine.assess([445, 3389])
+    assert "smb-y-rdp" in {h.get("rule") for h in combo["hints"]}
+    assert "smb-y-rdp" not in {h.get("rule") for h in engine.assess([445])["hints"]}
+
+    old_ssh = engine.assess([22], banners={22: "SSH-2.0-OpenSSH_7.2p2 Ubuntu"})
+    assert old_ssh["level"] == "MEDIUM"
+    assert engine.assess([22], banners={22: "SSH-2.0-OpenSSH_9.6"})["level"] == "LOW"
+
+    assert engine.assess([23], ip="10.99.1.1")["level"] == "SAFE"
+    assert engine.assess([23], ip="10.1.1.1")["level"] == "HIGH"
+
+
+def test_vendor_rules_match_whole_words_with_or_without_ports():
+    ruleset = compile_rules([
+        {"id": "vm", "vendor": "vm", "level": "HIGH"},
+        {"id": "hpe", "vendor": "Hewlett Packard", "level": "MEDIUM"},
+        {"id": "vmware-902", "vendor": "vm", "ports": [902], "level": "HIGH"},
+    ], include_builtin=False)
+
+    assert ruleset.evaluate([], vendor="VMware, Inc.")["level"] == "SAFE"
+    assert ruleset.evaluate([902], vendor="VMware, Inc.")["level"] == "LOW"
+    assert ruleset.evaluate([], vendor="VM Corp")["level"] == "HIGH"
+    assert ruleset.evaluate([], vendor="Hewlett Packard Enterprise")["level"] == "MEDIUM"
+    assert ruleset.evaluate([], vendor="Hewlett-Packard")["level"] == "MEDIUM"
+
+
+def test_dispatch_only_visits_matching_rules():
+    rules = [{"id": f"r{port}", "ports": [port, 1], "level": "MEDIUM"} for port in range(2, 5000)]
+    ruleset = compile_rules(rules, include_builtin=False)
+    assert len(ruleset._by_port[1]) == len(rules)
+    assert ruleset.evaluate([40000])["level"] == "LOW"
+    assert ruleset.evaluate([1, 77])["medium_risk_ports"] == [1, 77]
+
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError, match="Regla de riesgo inválida 'x'"):
+        compile_rules([{"id": "x", "ports": [80], "level": "CRITICO"}])
+    with pytest.raises(ValueError):
+        compile_rules([{"ports": [80]}])
+
+
+def test_engine_hot_reloads_and_keeps_rules_on_errors():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "rules.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([{"id": "web", "ports": [8000], "level": "HIGH"}], f)
+        engine = RiskEngine(path, reload_interval=0)
+        assert engine.assess([8000])["level"] == "HIGH"
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"rules": [{"id": "web", "ports": [8000], "level": "MEDIUM"}]}, f)
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+        assert engine.assess([8000])["level"] == "MEDIUM"
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{roto")
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2 * 10**9))
+        assert engine.assess([8000])["level"] == "MEDIUM"
+        assert "No se pudo leer" in engine.last_error
@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.scheduler import QueueFullError, ScanScheduler  # noqa: E402
+
+
+def _blocked_scheduler(**kwargs):
+    scheduler = ScanScheduler({"nmap": 1}, **kwargs)
+    release = threading.Event()
+    started = threading.Event()
+
+    def _blocker():
+        started.set()
+        release.wait(5)
+
+    scheduler.submit("nmap", "blocker", _blocker)
+    assert started.wait(5)
+    return scheduler, release
+
+
+def _recorder(order, name, done=None):
+    def _job():
+        order.append(name)
+        if done and len(order) == done[0]:
+            done[1].set()
+    return _job
+
+
+def test_scheduler_round_robin_between_clients():
+    scheduler, release = _blocked_scheduler()
+    order = []
+    finished = threading.Event()
+    done = (4, finished)
+
+    scheduler.submit("nmap", "alice", _recorder(order, "a1", done))
+    scheduler.submit("nmap", "alice", _recorder(order, "a2", done))
+    scheduler.submit("nmap", "alice", _recorder(order, "a3", done))
+    scheduler.submit("nmap", "bob", _recorder(order, "b1", done))
+    release.set()
+
+    assert finished.wait(5)
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_scheduler_priority_runs_first():
+    scheduler, release = _blocked_scheduler()
+    order = []
+    finished = threading.Event()
+    done = (2, finished)
+
+    scheduler.submit("nmap", "alice", _recorder(order, "normal", done))
+    scheduler.submit("nmap", "bob", _recorder(order, "urgent", done), priority=-1)
+    release.set()
+
+    assert finished.wait(5)
+    assert order == ["urgent", "normal"]
+
+
+def test_scheduler_reports_positions():
+    scheduler, release = _blocked_scheduler()
+    positions = []
+
+    first = scheduler.submit("nmap", "alice", lambda: None, job_id="j1")
+    second = scheduler.submit(
+        "nmap", "bob", lambda: None, job_id="j2", on_position=positions.append
+    )
+
+    assert (first, second) == (1, 2)
+    assert scheduler.cancel("j1") is True
+    assert scheduler.cancel("j1") is False
+    assert positions == [2, 1]
+    assert scheduler.position("j2") == 1
+    release.set()
+
+
+def test_scheduler_rejects_when_full():
+    scheduler, release = _blocked_scheduler(max_queue=2, max_per_client=1)
+
+    scheduler.submit("nmap", "alice", lambda: None)
+    with pytest.raises(QueueFullError):
+        scheduler.submit("nmap", "alice", lambda: None)
+    scheduler.submit("nmap", "bob", lambda: None)
+    with pytest.raises(QueueFullError):
+        scheduler.submit("nmap", "carol", lambda: None)
+
+    assert scheduler.stats()["nmap"] == {"workers": 1, "running": 1, "queued": 2, "clients": 2}
+    release.set()
@@ -0,0 +1,60 @@
+import os
+import pstats
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.timings import StageTimer, profiled, stage  # noqa: E402
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_stage_timer_accumulates_per_stage():
+    clock = _Clock()
+    timings = StageTimer(clock=clock)
+    with timings.stage("send"):
+        clock.now += 0.5
+    with stage(timings, "send"):
+        clock.now += 0.25
+    timings.add("dns", 2.0, count=3)
+
+    assert timings.as_dict() == {
+        "send": {"seconds": 0.75, "count": 2},
+        "dns": {"seconds": 2.0, "count": 3},
+    }
+
+
+def test_stage_timer_is_thread_safe_and_disabled_stage_is_a_no_op():
+    timings = StageTimer()
+
+    def _worker():
+        for _ in range(1000):
+            timings.add("dns", 0.001)
+
+    threads = [threading.Thread(target=_worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert timings.as_dict()["dns"]["count"] == 4000
+    with stage(None, "send") as entered:
+        assert entered is None
+
+
+def test_profiled_dumps_stats(tmp_path):
+    path = tmp_path / "scan.prof"
+    with profiled(str(path)):
+        sorted(range(1000), key=lambda i: -i)
+    with profiled(None):
+        pass
+
+    stats = pstats.Stats(str(path))
+    assert stats.total_calls > 0
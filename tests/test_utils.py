@@ -1,26 +1,57 @@
 import builtins
+import gzip
+import io
 import os
 import socket
-import subprocess
 import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 from unittest.mock import MagicMock, mock_open, patch
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from scripts.cancel import CancelToken  # noqa: E402
+from scripts.metrics import DNS_LOOKUP_SECONDS  # noqa: E402
+from scripts.timings import StageTimer  # noqa: E402
 from scripts.utils import (  # noqa: E402
     assess_risk,
+    clear_dns_cache,
+    clear_nmap_cache,
+    connect_scan_many,
+    dns_cache_stats,
+    ResultWriter,
     export_csv,
     get_service_name,
+    load_dns_cache,
+    mac_to_int,
+    nmap_cache_stats,
     nmap_scan,
+    nmap_scan_cached,
+    nmap_scan_chunked,
+    nmap_scan_many,
     reverse_dns,
+    run_arp_scan,
+    save_dns_cache,
     validate_cidr,
+    validate_ip,
     vendor_lookup,
+    vendor_lookup_many,
 )
 
 
+@pytest.fixture(autouse=True)
+def _empty_dns_cache():
+    clear_dns_cache()
+    clear_nmap_cache()
+    yield
+    clear_dns_cache()
+    clear_nmap_cache()
+
+
 def test_validate_cidr_valid():
     assert validate_cidr("192.168.1.0/24") is True
     assert validate_cidr("10.0.0.0/8") is True
@@ -34,6 +65,36 @@ def test_validate_cidr_invalid():
     assert validate_cidr("192.168.1.1/99") is False
 
 
+def test_validate_ip_rejects_options_and_hostnames():
+    assert validate_ip("192.168.1.1") is True
+    assert validate_ip("fe80::1") is True
+    for value in ("-oN", "--script=vuln", "router.lan", "10.0.0.0/24", ""):
+        assert validate_ip(value) is False
+
+
+@patch("subprocess.Popen")
+def test_nmap_scan_many_never_passes_options_as_targets(mock_popen):
+    with pytest.raises(ValueError, match="Dirección IP inválida: '-oN'"):
+        nmap_scan_many(["10.0.0.1", "-oN", "/tmp/pwned"], "22")
+    mock_popen.assert_not_called()
+
+
+@pytest.mark.parametrize("engine", ["nmap", "connect"])
+@pytest.mark.parametrize("target", ["-oN /tmp/x", "--script=vuln", "router.lan"])
+@patch("subprocess.Popen")
+def test_every_nmap_entry_point_rejects_non_ip_targets(mock_popen, target, engine):
+    fake_nmap = MagicMock()
+    with patch.dict(sys.modules, {"nmap": fake_nmap}):
+        with pytest.raises(ValueError, match="Dirección IP inválida"):
+            nmap_scan(target, "22", engine=engine)
+        with pytest.raises(ValueError, match="Dirección IP inválida"):
+            nmap_scan_cached(target, "22", engine=engine)
+        with pytest.raises(ValueError, match="Dirección IP inválida"):
+            nmap_scan_many([target], "22", engine=engine)
+    fake_nmap.PortScanner.assert_not_called()
+    mock_popen.assert_not_called()
+
+
 def test_vendor_lookup_known_mac():
     assert vendor_lookup("00:0C:29:XX:YY:ZZ") == "VMware, Inc."
 
@@ -109,16 +170,75 @@ def test_reverse_dns_failure(mock_gethostbyaddr):
     assert reverse_dns("192.168.1.99") == "N/A"
 
 
-@patch("subprocess.run")
-def test_nmap_scan_subprocess_success(mock_run):
-    nmap_output = (
-        "# Nmap scan\n"
-        "Host: 192.168.1.1 (router.local)\tStatus: Up\n"
-        "Host: 192.168.1.1 (router.local)\t"
-        "Ports: 22/open/tcp//ssh///, 80/open/tcp//http///, 443/open/tcp//https///\n"
-        "# Nmap done\n"
+@patch("socket.gethostbyaddr")
+def test_reverse_dns_latency_labels_lookup_outcome(mock_gethostbyaddr):
+    before = {r: DNS_LOOKUP_SECONDS.count(result=r) for r in ("resolved", "unresolved")}
+
+    mock_gethostbyaddr.return_value = ("router.lan", [], ["192.168.1.1"])
+    reverse_dns("192.168.1.1", use_cache=False)
+    mock_gethostbyaddr.side_effect = socket.herror("Test error")
+    reverse_dns("192.168.1.99", use_cache=False)
+    reverse_dns("192.168.1.98", use_cache=False)
+
+    assert DNS_LOOKUP_SECONDS.count(result="resolved") == before["resolved"] + 1
+    assert DNS_LOOKUP_SECONDS.count(result="unresolved") == before["unresolved"] + 2
+
+
+NMAP_XML_HEADER = [
+    '<?xml version="1.0" encoding="UTF-8"?>\n',
+    '<nmaprun scanner="nmap" args="nmap -p 1-1024 -T4 -oX -">\n',
+    '<taskprogress task="Connect Scan" time="1" percent="50.00" remaining="3" etc="4"/>\n',
+]
+NMAP_XML_FOOTER = ['<runstats><finished exit="success"/></runstats>\n', '</nmaprun>\n']
+
+
+def _nmap_xml_host(ip, open_ports, closed_ports=()):
+    ports = [
+        f'<port protocol="tcp" portid="{p}"><state state="open"/><service name="x"/></port>\n'
+        for p in open_ports
+    ] + [
+        f'<port protocol="tcp" portid="{p}"><state state="closed"/></port>\n'
+        for p in closed_ports
+    ]
+    return [
+        '<host><status state="up"/>\n',
+        f'<address addr="{ip}" addrtype="ipv4"/>\n',
+        '<address addr="00:0C:29:AA:BB:CC" addrtype="mac"/>\n',
+        '<ports><extraports state="closed" count="1000"/>\n',
+        *ports,
+        '</ports></host>\n',
+    ]
+
+
+class FakeNmapProcess:
+    def __init__(self, lines, returncode=0, stderr="", hang=False):
+        self._killed = threading.Event()
+        self._hang = hang
+        self.returncode = None if hang else returncode
+        self.stdout = self._read(lines)
+        self.stderr = io.StringIO(stderr)
+
+    def _read(self, lines):
+        yield from lines
+        if self._hang:
+            self._killed.wait(5)
+
+    def kill(self):
+        self._killed.set()
+        self.returncode = -9
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        return self.returncode
+
+
+@patch("subprocess.Popen")
+def test_nmap_scan_subprocess_success(mock_popen):
+    mock_popen.return_value = FakeNmapProcess(
+        NMAP_XML_HEADER + _nmap_xml_host("192.168.1.1", [22, 80, 443], [23]) + NMAP_XML_FOOTER
     )
-    mock_run.return_value = MagicMock(stdout=nmap_output, stderr="", returncode=0)
 
     original_import = builtins.__import__
 
@@ -137,37 +257,139 @@ def test_nmap_scan_subprocess_success(mock_run):
     assert 22 in result
     assert 80 in result
     assert 443 in result
+    assert 23 not in result
 
 
-@patch("subprocess.run")
-def test_nmap_scan_subprocess_no_open_ports(mock_run):
-    nmap_output = "# Nmap scan\nHost: 192.168.1.10 (host.local) Status: Up\n# done\n"
-    mock_run.return_value = MagicMock(stdout=nmap_output, stderr="")
+@patch("subprocess.Popen")
+def test_nmap_scan_subprocess_no_open_ports(mock_popen):
+    mock_popen.return_value = FakeNmapProcess(
+        NMAP_XML_HEADER + _nmap_xml_host("192.168.1.10", []) + NMAP_XML_FOOTER
+    )
 
     from scripts.utils import _nmap_scan_subprocess
     result = _nmap_scan_subprocess("192.168.1.10", "1-1024")
     assert result == []
 
 
-@patch("subprocess.run")
-def test_nmap_scan_subprocess_file_not_found(mock_run):
-    mock_run.side_effect = FileNotFoundError
+@patch("subprocess.Popen")
+def test_nmap_scan_subprocess_streams_ports_and_progress(mock_popen):
+    mock_popen.return_value = FakeNmapProcess(
+        NMAP_XML_HEADER + _nmap_xml_host("192.168.1.1", [22, 445]) + NMAP_XML_FOOTER
+    )
+    ports, progress = [], []
+
+    result = nmap_scan(
+        "192.168.1.1", "1-1024", on_port=ports.append, on_progress=progress.append
+    )
+
+    assert "-oX" in mock_popen.call_args[0][0]
+    assert ports == [22, 445]
+    assert result == [22, 445]
+    assert progress == [{"task": "Connect Scan", "percent": 50.0, "remaining": 3}]
+
+
+@patch("subprocess.Popen")
+def test_nmap_scan_many_reports_service_banners_with_version_detection(mock_popen):
+    host = _nmap_xml_host("10.0.0.1", [80])
+    host.insert(-1, (
+        '<port protocol="tcp" portid="22"><state state="open"/>'
+        '<service name="ssh" product="OpenSSH" version="7.2p2 Ubuntu 4ubuntu2.8"'
+        ' extrainfo="Ubuntu Linux; protocol 2.0"/></port>\n'
+    ))
+    mock_popen.return_value = FakeNmapProcess(NMAP_XML_HEADER + host + NMAP_XML_FOOTER)
+    services = []
+
+    results = nmap_scan_many(
+        ["10.0.0.1"], "1-1024", on_service=lambda *args: services.append(args)
+    )
+
+    assert "-sV" in mock_popen.call_args[0][0]
+    assert results == {"10.0.0.1": [80, 22]}
+    assert services == [
+        ("10.0.0.1", 22, "OpenSSH 7.2p2 Ubuntu 4ubuntu2.8 Ubuntu Linux; protocol 2.0")
+    ]
+
+    nmap_scan_many(["10.0.0.1"], "1-1024")
+    assert "-sV" not in mock_popen.call_args[0][0]
+
+
+@patch("subprocess.Popen")
+def test_nmap_scan_records_stage_timings(mock_popen):
+    lines = NMAP_XML_HEADER + _nmap_xml_host("192.168.1.1", [22]) + NMAP_XML_FOOTER
+    mock_popen.return_value = FakeNmapProcess(lines)
+    timings = StageTimer()
+
+    assert nmap_scan("192.168.1.1", "1-1024", timings=timings) == [22]
+
+    stages = timings.as_dict()
+    assert set(stages) == {"spawn", "nmap", "parse"}
+    assert stages["parse"]["count"] == len(lines)
+    assert stages["nmap"]["seconds"] >= stages["parse"]["seconds"]
+
+
+@patch("subprocess.Popen")
+def test_nmap_scan_cancel_kills_process_and_keeps_partial_ports(mock_popen):
+    host = _nmap_xml_host("192.168.1.1", [22, 80])
+    mock_popen.return_value = FakeNmapProcess(NMAP_XML_HEADER + host[:-1], hang=True)
+    token = CancelToken()
+
+    def _on_port(port):
+        if port == 80:
+            token.cancel()
+
+    started = time.monotonic()
+    result = nmap_scan("192.168.1.1", "1-1024", on_port=_on_port, cancel=token)
+
+    assert result == [22, 80]
+    assert mock_popen.return_value.returncode == -9
+    assert time.monotonic() - started < 2
+
+
+@patch("subprocess.Popen")
+def test_nmap_scan_subprocess_file_not_found(mock_popen):
+    mock_popen.side_effect = FileNotFoundError
     from scripts.utils import _nmap_scan_subprocess
     with pytest.raises(Exception, match="Nmap no está instalado"):
         _nmap_scan_subprocess("127.0.0.1", "22")
 
 
-@patch("subprocess.run")
-def test_nmap_scan_subprocess_called_process_error(mock_run):
-    mock_run.side_effect = subprocess.CalledProcessError(1, "nmap", stderr="Error de Nmap")
+@patch("subprocess.Popen")
+def test_nmap_scan_subprocess_called_process_error(mock_popen):
+    mock_popen.return_value = FakeNmapProcess([], returncode=1, stderr="Error de Nmap")
     from scripts.utils import _nmap_scan_subprocess
-    with pytest.raises(Exception, match="Nmap devolvió un error"):
+    with pytest.raises(Exception, match="Nmap devolvió un error: Error de Nmap"):
         _nmap_scan_subprocess("127.0.0.1", "22")
 
 
-@patch("subprocess.run")
-def test_nmap_scan_subprocess_timeout(mock_run):
-    mock_run.side_effect = subprocess.TimeoutExpired("nmap", 180)
+@pytest.mark.skipif(os.name == "nt", reason="usa un ejecutable nmap falso con shebang")
+@patch("scripts.utils.NMAP_TIMEOUT", 10)
+def test_nmap_scan_survives_heavy_stderr(tmp_path, monkeypatch):
+    # Más avisos de los que caben en el pipe antes de escribir el XML: si nadie
+    # leyera stderr, nmap se bloquearía y el escaneo acabaría por tiempo.
+    xml = "".join(
+        NMAP_XML_HEADER + _nmap_xml_host("192.168.1.1", [22, 80]) + NMAP_XML_FOOTER
+    )
+    fake = tmp_path / "nmap"
+    fake.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        "for i in range(4000):\n"
+        "    sys.stderr.write(f'Warning: 192.168.1.1 giving up on port because "
+        "retransmission cap hit ({i}).\\n')\n"
+        f"sys.stdout.write({xml!r})\n"
+    )
+    fake.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ.get('PATH', '')}")
+
+    ports = []
+    assert nmap_scan("192.168.1.1", "1-1024", on_port=ports.append) == [22, 80]
+    assert ports == [22, 80]
+
+
+@patch("scripts.utils.NMAP_TIMEOUT", 0.05)
+@patch("subprocess.Popen")
+def test_nmap_scan_subprocess_timeout(mock_popen):
+    mock_popen.return_value = FakeNmapProcess(NMAP_XML_HEADER, hang=True)
     from scripts.utils import _nmap_scan_subprocess
     with pytest.raises(Exception, match="tiempo límite"):
         _nmap_scan_subprocess("127.0.0.1", "1-65535")
@@ -195,9 +417,540 @@ def test_export_csv_empty_data():
         export_csv([], "test.csv")
 
 
+def test_export_csv_streams_generators_with_explicit_fields_and_append():
+    rows = ({"ip": f"10.0.0.{i}", "mac": "AA", "extra": i} for i in range(3))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, "hosts.csv")
+        assert export_csv(rows, filepath, fieldnames=["ip", "mac"]) == 3
+        assert export_csv(iter([{"ip": "10.0.0.9", "mac": "BB"}]), filepath,
+                          fieldnames=["ip", "mac"], append=True) == 1
+        with open(filepath, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines[0] == "ip,mac"
+        assert lines[1:] == ["10.0.0.0,AA", "10.0.0.1,AA", "10.0.0.2,AA", "10.0.0.9,BB"]
+
+        empty = os.path.join(tmpdir, "empty.csv")
+        assert export_csv(iter([]), empty, fieldnames=["ip"]) == 0
+        with open(empty, encoding="utf-8") as f:
+            assert f.read().strip() == "ip"
+
+
+def test_export_csv_writes_compressed_csv_and_jsonl():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_gz = os.path.join(tmpdir, "hosts.csv.gz")
+        export_csv([{"ip": "10.0.0.1", "hostname": "pc-ñ"}], csv_gz)
+        export_csv([{"ip": "10.0.0.2", "hostname": "nas"}], csv_gz, append=True)
+        with gzip.open(csv_gz, "rt", encoding="utf-8") as f:
+            assert f.read().splitlines() == ["ip,hostname", "10.0.0.1,pc-ñ", "10.0.0.2,nas"]
+
+        jsonl_gz = os.path.join(tmpdir, "hosts.jsonl.gz")
+        with ResultWriter(jsonl_gz, fieldnames=["ip"]) as writer:
+            writer.write({"ip": "10.0.0.1", "mac": "AA"})
+            writer.write({"ip": "10.0.0.2"})
+        with gzip.open(jsonl_gz, "rt", encoding="utf-8") as f:
+            assert f.read() == '{"ip": "10.0.0.1"}\n{"ip": "10.0.0.2"}\n'
+
+
 @patch("builtins.open", new_callable=mock_open)
 def test_export_csv_io_error(mock_file):
     mock_file.side_effect = IOError("Permission denied")
     data = [{"ip": "1.1.1.1"}]
     with pytest.raises(IOError):
         export_csv(data, "/root/no_permission.csv")
+
+
+def _fake_scapy(replies):
+    fake_all = MagicMock()
+    answers = [
+        (MagicMock(), MagicMock(psrc=ip, hwsrc=mac)) for ip, mac in replies
+    ]
+    fake_all.arping.return_value = (answers, [])
+    return {"scapy": MagicMock(), "scapy.all": fake_all}
+
+
+@patch("scripts.utils.reverse_dns")
+def test_run_arp_scan_reports_hostnames_asynchronously(mock_reverse_dns):
+    mock_reverse_dns.side_effect = lambda ip: "router.local" if ip == "192.168.1.1" else "N/A"
+    found, updated = [], []
+
+    with patch.dict(sys.modules, _fake_scapy([
+        ("192.168.1.1", "00:0C:29:AA:BB:CC"),
+        ("192.168.1.50", "AA:BB:CC:DD:EE:FF"),
+    ])):
+        hosts = run_arp_scan("192.168.1.0/24", callback=found.append, on_update=updated.append)
+
+    assert [h["hostname"] for h in found] == ["N/A", "N/A"]
+    assert found[0]["vendor"] == "VMware, Inc."
+    assert updated == [{
+        "ip": "192.168.1.1", "mac": "00:0C:29:AA:BB:CC",
+        "hostname": "router.local", "vendor": "VMware, Inc.",
+    }]
+    assert [h["hostname"] for h in hosts] == ["router.local", "N/A"]
+
+
+def test_run_arp_scan_drops_hostname_updates_after_failure():
+    started, release, resolved = threading.Event(), threading.Event(), threading.Event()
+    lookups = []
+
+    def slow_reverse_dns(ip):
+        lookups.append(ip)
+        started.set()
+        release.wait(5)
+        resolved.set()
+        return "router.local"
+
+    def failing_sweep(cidr, on_reply, *args):
+        on_reply("192.168.1.1", "00:0C:29:AA:BB:CC")
+        on_reply("192.168.1.2", "00:0C:29:AA:BB:CD")
+        assert started.wait(5)
+        raise RuntimeError("interfaz caída")
+
+    updated = []
+    with patch.dict(sys.modules, _fake_scapy([])), \
+            patch("scripts.utils.reverse_dns", slow_reverse_dns), \
+            patch("scripts.utils._arp_sweep_arping", failing_sweep):
+        with pytest.raises(Exception, match="interfaz caída"):
+            run_arp_scan("192.168.1.0/24", on_update=updated.append, dns_workers=1)
+        release.set()
+        assert resolved.wait(5)
+        time.sleep(0.05)
+
+    assert lookups == ["192.168.1.1"]
+    assert updated == []
+
+
+@patch("socket.gethostbyaddr")
+def test_reverse_dns_caches_hits_and_misses(mock_gethostbyaddr):
+    mock_gethostbyaddr.side_effect = socket.herror("Test error")
+
+    assert reverse_dns("10.0.0.7") == "N/A"
+    assert reverse_dns("10.0.0.7") == "N/A"
+
+    mock_gethostbyaddr.assert_called_once_with("10.0.0.7")
+    stats = dns_cache_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+@patch("socket.gethostbyaddr")
+def test_reverse_dns_negative_ttl_expires(mock_gethostbyaddr):
+    mock_gethostbyaddr.side_effect = socket.herror("Test error")
+
+    with patch("scripts.utils.DNS_NEGATIVE_TTL", -1):
+        reverse_dns("10.0.0.8")
+        reverse_dns("10.0.0.8")
+
+    assert mock_gethostbyaddr.call_count == 2
+
+
+@patch("socket.gethostbyaddr")
+def test_dns_cache_lru_eviction(mock_gethostbyaddr):
+    mock_gethostbyaddr.return_value = ("host", [], [])
+
+    with patch("scripts.utils.DNS_CACHE_SIZE", 2):
+        reverse_dns("10.0.0.1")
+        reverse_dns("10.0.0.2")
+        reverse_dns("10.0.0.1")
+        reverse_dns("10.0.0.3")
+        reverse_dns("10.0.0.2")
+
+    assert mock_gethostbyaddr.call_count == 4
+
+
+@patch("socket.gethostbyaddr")
+def test_dns_cache_persistence_roundtrip(mock_gethostbyaddr):
+    mock_gethostbyaddr.return_value = ("nas.local", [], [])
+    reverse_dns("10.0.0.9")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, "dns_cache.json")
+        save_dns_cache(filepath)
+        clear_dns_cache()
+        assert load_dns_cache(filepath) == 1
+
+    assert reverse_dns("10.0.0.9") == "nas.local"
+    mock_gethostbyaddr.assert_called_once_with("10.0.0.9")
+
+
+def _fake_scapy_stream(answers_by_attempt, sniffer_starts=True):
+    fake_all = MagicMock()
+    fake_all.ARP.side_effect = lambda **kwargs: kwargs
+    fake_all.Ether.return_value = MagicMock(__truediv__=lambda self, arp: arp)
+    fake_all.conf.route.route.side_effect = lambda ip: ("eth1", "192.168.1.10", "0.0.0.0")
+    sniffer = {}
+
+    class FakeSniffer:
+        def __init__(self, prn, **kwargs):
+            sniffer["prn"] = prn
+            sniffer["kwargs"] = kwargs
+
+        def start(self):
+            if not sniffer_starts:
+                self.exception = OSError("eth1: permiso denegado")
+                return
+            sniffer["started"] = True
+            sniffer["kwargs"]["started_callback"]()
+
+        def stop(self):
+            if not sniffer.get("started"):
+                raise RuntimeError("Not running")
+
+    class FakeReply:
+        def __init__(self, ip, mac, op=2):
+            self.arp = MagicMock(op=op, psrc=ip, hwsrc=mac)
+
+        def __contains__(self, layer):
+            return layer is fake_all.ARP
+
+        def __getitem__(self, layer):
+            return self.arp
+
+    sent = []
+
+    def fake_sendp(arp, iface=None, verbose=0):
+        assert sniffer.get("started") and iface == sniffer["kwargs"]["iface"] == "eth1"
+        sent.append(list(arp["pdst"]))
+        for ip, mac in answers_by_attempt[len(sent) - 1]:
+            if ip in arp["pdst"]:
+                sniffer["prn"](FakeReply(ip, "ff:ff:ff:ff:ff:ff", op=1))
+                sniffer["prn"](FakeReply(ip, mac))
+                sniffer["prn"](FakeReply(ip, mac))
+
+    fake_all.AsyncSniffer = FakeSniffer
+    fake_all.sendp.side_effect = fake_sendp
+    return {"scapy": MagicMock(), "scapy.all": fake_all}, sent
+
+
+@patch("scripts.utils.ARP_SNIFFER_START_TIMEOUT", 0.05)
+def test_run_arp_scan_stream_fails_when_sniffer_does_not_start(capsys):
+    modules, sent = _fake_scapy_stream([[("192.168.1.1", "00:0C:29:AA:BB:CC")]], False)
+
+    with patch.dict(sys.modules, modules):
+        with pytest.raises(Exception, match="captura ARP en eth1: eth1: permiso denegado"):
+            run_arp_scan("192.168.1.0/30", mode="stream", timeout=0.01)
+
+    assert sent == []
+    assert "Not running" in capsys.readouterr().err
+
+
+@patch("scripts.utils.reverse_dns", return_value="N/A")
+def test_run_arp_scan_stream_retries_only_non_responders(mock_reverse_dns):
+    modules, sent = _fake_scapy_stream([
+        [("192.168.1.1", "00:0C:29:AA:BB:CC")],
+        [("192.168.1.2", "B8:27:EB:00:11:22")],
+    ])
+    found = []
+
+    with patch.dict(sys.modules, modules):
+        hosts = run_arp_scan(
+            "192.168.1.0/30", callback=found.append, mode="stream", timeout=0.01, retries=3
+        )
+
+    assert sent == [["192.168.1.1", "192.168.1.2"], ["192.168.1.2"]]
+    assert [h["ip"] for h in found] == ["192.168.1.1", "192.168.1.2"]
+    assert [h["vendor"] for h in hosts] == ["VMware, Inc.", "Raspberry Pi Foundation"]
+
+
+@patch("scripts.utils.reverse_dns", return_value="N/A")
+def test_run_arp_scan_stream_stops_sending_when_cancelled(mock_reverse_dns):
+    modules, sent = _fake_scapy_stream([[("192.168.0.1", "00:0C:29:AA:BB:CC")]])
+    token = CancelToken()
+
+    with patch.dict(sys.modules, modules), patch("scripts.utils.ARP_SEND_BATCH", 2):
+        hosts = run_arp_scan(
+            "192.168.0.0/29", callback=lambda host: token.cancel(), mode="stream",
+            timeout=5, retries=3, cancel=token,
+        )
+
+    assert sent == [["192.168.0.1", "192.168.0.2"]]
+    assert [h["ip"] for h in hosts] == ["192.168.0.1"]
+
+
+@patch("scripts.utils.reverse_dns", return_value="host.lan")
+def test_run_arp_scan_stream_records_stage_timings(mock_reverse_dns):
+    modules, _ = _fake_scapy_stream([[("192.168.1.1", "00:0C:29:AA:BB:CC")]])
+    timings = StageTimer()
+
+    with patch.dict(sys.modules, modules):
+        run_arp_scan(
+            "192.168.1.0/30", callback=lambda host: None, on_update=lambda host: None,
+            mode="stream", timeout=0.01, retries=0, timings=timings,
+        )
+
+    stages = timings.as_dict()
+    assert set(stages) == {"send", "wait", "vendor", "callback", "dns", "dns_wait"}
+    assert stages["send"]["count"] == 1
+    assert stages["dns"]["count"] == 1
+    assert stages["callback"]["count"] == 2
+
+
+def test_run_arp_scan_invalid_mode():
+    with pytest.raises(ValueError, match="Modo ARP inválido"):
+        run_arp_scan("192.168.1.0/24", mode="icmp")
+
+
+@patch("scripts.utils.reverse_dns", return_value="N/A")
+def test_run_arp_scan_sharded_merges_and_deduplicates(mock_reverse_dns):
+    contexts = []
+
+    def fake_pool(max_workers, mp_context):
+        contexts.append(mp_context.get_start_method())
+        return ThreadPoolExecutor(max_workers)
+
+    fake_all = MagicMock()
+    fake_all.ARP.side_effect = lambda pdst: pdst
+    fake_all.Ether.return_value = MagicMock(__truediv__=lambda self, pdst: pdst)
+    shards, inters = [], []
+
+    def fake_srp(pdst, timeout, retry, inter, iface_hint, verbose):
+        assert iface_hint == pdst
+        shards.append(pdst)
+        inters.append(inter)
+        replies = [("10.20.0.1", "00:0C:29:00:00:01"), ("10.20.1.1", "00:0C:29:00:00:02")]
+        return [(None, MagicMock(psrc=ip, hwsrc=mac)) for ip, mac in replies], []
+
+    fake_all.srp.side_effect = fake_srp
+    found = []
+
+    with patch.dict(sys.modules, {"scapy": MagicMock(), "scapy.all": fake_all}), \
+            patch("scripts.utils.ProcessPoolExecutor", fake_pool):
+        hosts = run_arp_scan(
+            "10.20.0.0/22", callback=found.append, mode="sharded", workers=2, max_pps=1000
+        )
+
+    assert sorted(shards) == ["10.20.0.0/24", "10.20.1.0/24", "10.20.2.0/24", "10.20.3.0/24"]
+    assert inters == [0.002] * 4
+    assert contexts[0] in ("forkserver", "spawn")
+    assert sorted(h["ip"] for h in hosts) == ["10.20.0.1", "10.20.1.1"]
+    assert len(found) == 2
+
+
+def test_connect_scan_finds_listening_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener, \
+            socket.socket(socket.AF_INET, socket.SOCK_STREAM) as closed:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        closed.bind(("127.0.0.1", 0))
+        open_port = listener.getsockname()[1]
+        closed_port = closed.getsockname()[1]
+
+        result = nmap_scan("127.0.0.1", f"{open_port},{closed_port}", engine="connect")
+
+    assert result == [open_port]
+
+
+def test_connect_scan_cancelled_before_start_returns_no_ports():
+    cancel = CancelToken()
+    cancel.cancel()
+
+    assert nmap_scan("127.0.0.1", "1-10", engine="connect", cancel=cancel) == []
+
+
+def test_connect_scan_many_reports_each_host():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        port = listener.getsockname()[1]
+        reported = []
+
+        results = connect_scan_many(
+            ["127.0.0.1"], str(port), concurrency=1,
+            callback=lambda ip, ports: reported.append((ip, ports)),
+        )
+
+    assert results == {"127.0.0.1": [port]}
+    assert reported == [("127.0.0.1", [port])]
+
+
+def test_connect_scan_many_bounds_coroutines_by_concurrency():
+    import asyncio
+    peak = 0
+
+    async def fake_probe(ip, port, timeout):
+        nonlocal peak
+        peak = max(peak, len(asyncio.all_tasks()))
+        await asyncio.sleep(0)
+        return port == 22
+
+    ips = [f"10.0.{i // 256}.{i % 256}" for i in range(500)]
+    with patch("scripts.utils._connect_probe", fake_probe):
+        results = connect_scan_many(ips, "1-64", concurrency=16, per_host=8)
+
+    assert list(results) == ips
+    assert all(ports == [22] for ports in results.values())
+    # 4 hosts a la vez, cada uno con su tarea y 8 trabajadores, más la principal.
+    assert peak <= 4 * (1 + 8) + 1
+
+
+def test_nmap_scan_invalid_engine_and_ports():
+    with pytest.raises(ValueError, match="Motor de escaneo inválido"):
+        nmap_scan("127.0.0.1", "22", engine="masscan")
+    with pytest.raises(ValueError, match="Rango de puertos inválido"):
+        nmap_scan("127.0.0.1", "80-22", engine="connect")
+    with pytest.raises(ValueError, match="UDP no están soportados"):
+        nmap_scan("127.0.0.1", "U:53")
+
+
+@patch("subprocess.Popen")
+def test_nmap_scan_many_streams_each_host(mock_popen):
+    mock_popen.return_value = FakeNmapProcess(
+        NMAP_XML_HEADER
+        + _nmap_xml_host("10.0.0.1", [22], [23])
+        + _nmap_xml_host("10.0.0.2", [80, 443])
+        + NMAP_XML_FOOTER
+    )
+    reported = []
+
+    results = nmap_scan_many(
+        ["10.0.0.1", "10.0.0.2", "10.0.0.3"], "1-1024",
+        callback=lambda ip, ports: reported.append((ip, ports)),
+    )
+
+    command = mock_popen.call_args[0][0]
+    assert command[-3:] == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    assert reported == [("10.0.0.1", [22]), ("10.0.0.2", [80, 443]), ("10.0.0.3", [])]
+    assert results == {"10.0.0.1": [22], "10.0.0.2": [80, 443], "10.0.0.3": []}
+
+
+@patch("subprocess.Popen")
+def test_nmap_scan_many_file_not_found(mock_popen):
+    mock_popen.side_effect = FileNotFoundError
+    with pytest.raises(Exception, match="Nmap no está instalado"):
+        nmap_scan_many(["10.0.0.1"], "22")
+
+
+def test_mac_to_int_notations():
+    expected = 0x000C29AABBCC
+    assert mac_to_int("00:0C:29:AA:BB:CC") == expected
+    assert mac_to_int("00-0c-29-aa-bb-cc") == expected
+    assert mac_to_int("000c.29aa.bbcc") == expected
+    assert mac_to_int("000C29AABBCC") == expected
+    assert mac_to_int("0:c:29:aa:bb:cc") == expected
+    assert mac_to_int("00:0C:29:XX:YY:ZZ") is None
+    assert mac_to_int("00:0C:29") is None
+    assert mac_to_int(None) is None
+    for bad in (
+        "0x0c29aabbcc", "00_c29aabbcc", "+00c29aabbcc", "00:0c:29:aa:bb:+c", "0x0c.29aa.bbcc",
+    ):
+        assert mac_to_int(bad) is None
+
+
+def test_vendor_lookup_cisco_dotted_and_bare_hex():
+    assert vendor_lookup("001c.42aa.bbcc") == "Cisco Systems"
+    assert vendor_lookup("B827EB001122") == "Raspberry Pi Foundation"
+
+
+def test_vendor_lookup_many_matches_single_lookups():
+    macs = [
+        "00:0C:29:AA:BB:CC", "000c.29aa.bbcc", "AA:BB:CC:DD:EE:FF",
+        "00:0C:29:XX:YY:ZZ", None, "b8-27-eb-aa-bb-cc",
+    ]
+    assert vendor_lookup_many(macs) == [vendor_lookup(mac) for mac in macs]
+    assert vendor_lookup_many(iter([])) == []
+
+
+@patch("scripts.utils.nmap_scan", return_value=[80, 22])
+def test_nmap_scan_cached_normalises_key_and_honours_force(mock_scan):
+    assert nmap_scan_cached("10.0.0.1", "80,22,23-24,21") == ([80, 22], False)
+    assert nmap_scan_cached("10.0.0.1", "21-24, 80") == ([80, 22], True)
+    mock_scan.assert_called_once_with(
+        "10.0.0.1", "21-24,80", engine="nmap", on_port=None, on_progress=None, cancel=None,
+        timings=None,
+    )
+
+    assert nmap_scan_cached("10.0.0.1", "21-24,80", engine="connect")[1] is False
+    assert nmap_scan_cached("10.0.0.1", "21-24,80", force=True)[1] is False
+    assert mock_scan.call_count == 3
+    assert nmap_cache_stats()["hits"] == 1
+
+
+@patch("scripts.utils.nmap_scan", return_value=[443])
+def test_nmap_scan_cached_expires(mock_scan):
+    nmap_scan_cached("10.0.0.1", "443", ttl=0)
+    assert nmap_scan_cached("10.0.0.1", "443", ttl=0) == ([443], False)
+    assert mock_scan.call_count == 2
+
+
+def test_nmap_scan_cached_single_flight():
+    release = threading.Event()
+    calls = []
+
+    def slow_scan(ip, port_range, **kwargs):
+        calls.append(ip)
+        release.wait(5)
+        return [22]
+
+    results = []
+    with patch("scripts.utils.nmap_scan", side_effect=slow_scan):
+        threads = [
+            threading.Thread(target=lambda: results.append(nmap_scan_cached("10.0.0.1", "22")))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        while nmap_cache_stats()["shared"] < 4:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+
+    assert calls == ["10.0.0.1"]
+    assert sorted(cached for _, cached in results) == [False, True, True, True, True]
+    assert all(ports == [22] for ports, _ in results)
+
+
+@patch("scripts.utils.nmap_scan", side_effect=Exception("Nmap devolvió un error: boom"))
+def test_nmap_scan_cached_does_not_store_errors(mock_scan):
+    for _ in range(2):
+        with pytest.raises(Exception, match="boom"):
+            nmap_scan_cached("10.0.0.1", "22")
+    assert mock_scan.call_count == 2
+    assert nmap_cache_stats()["size"] == 0
+
+
+def test_nmap_scan_cached_does_not_store_cancelled_results():
+    token = CancelToken()
+
+    def cancelled_scan(ip, port_range, cancel=None, **kwargs):
+        cancel.cancel()
+        return [22]
+
+    with patch("scripts.utils.nmap_scan", side_effect=cancelled_scan):
+        assert nmap_scan_cached("10.0.0.1", "22", cancel=token) == ([22], False)
+    assert nmap_cache_stats()["size"] == 0
+
+
+def test_nmap_scan_chunked_merges_chunks_and_keeps_partial_results():
+    def fake_stream(targets, port_range, timeout, on_port=None, **kwargs):
+        first = int(port_range.split("-")[0])
+        on_port(targets[0], first)
+        if first == 51:
+            raise Exception("El escaneo Nmap excedió el tiempo límite.")
+        return {targets[0]: [first]}
+
+    chunks, ports = [], []
+    with patch("scripts.utils._nmap_stream", side_effect=fake_stream) as mock_stream:
+        result = nmap_scan_chunked(
+            "10.0.0.1", "1-100", chunks=4, workers=2,
+            on_port=ports.append, on_chunk=chunks.append,
+        )
+
+    assert sorted(call.args[1] for call in mock_stream.call_args_list) == [
+        "1-25", "26-50", "51-75", "76-100"
+    ]
+    assert result["open_ports"] == [1, 26, 51, 76]
+    assert sorted(ports) == [1, 26, 51, 76]
+    assert result["partial"] is True
+    assert result["failed_chunks"] == [
+        {"chunk": 2, "ports": "51-75", "error": "El escaneo Nmap excedió el tiempo límite."}
+    ]
+    done = [c for c in chunks if c["status"] != "running"]
+    assert sorted((c["chunk"], c["status"]) for c in done) == [
+        (0, "done"), (1, "done"), (2, "failed"), (3, "done")
+    ]
+
+
+@patch("scripts.utils._nmap_stream", side_effect=Exception("Nmap devolvió un error: boom"))
+def test_nmap_scan_chunked_raises_when_every_chunk_fails(mock_stream):
+    with pytest.raises(Exception, match="boom"):
+        nmap_scan_chunked("10.0.0.1", "1-100", chunks=2)